@@ -1,26 +1,52 @@
+import argparse
+import threading
+import time
+
 import weaviate
-import torch
-from FlagEmbedding import BGEM3FlagModel
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from transformers import BitsAndBytesConfig
+
+from weaviate_schema import (COLLECTION_NAME, FUSION_TYPES, HYBRID_ALPHA, HYBRID_FUSION, SEARCH_FIELDS,
+                             StageTimer, hybrid_search, iter_queries)
 
 model_id = "malhajar/Mistral-7B-Instruct-v0.2-turkish"
 # model_id = "tensorblock/Mistral-7B-Instruct-v0.2-turkish-GGUF"
 # with llama.cpp ::: model_id = "matrixportal/Turkish-Llama-8b-DPO-v0.1-Q4_K_M-GGUF"
 
-quantization_config = BitsAndBytesConfig(
-    load_in_4bit=True,  # Modeli 8-bit modda yükle
-    bnb_8bit_compute_dtype=torch.float16,  # Hesaplamaları fp16 ile yap
-    bnb_8bit_use_double_quant=True  # Çift quantization kullan
-)
+# Model, modül içe aktarılırken değil ilk kullanımda (ya da main'deki arka plan thread'inde) yüklenir.
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def log_phase(name, start):
+    """Başlangıç fazının süresini loglar"""
+    print(f"[başlangıç] {name}: {time.perf_counter() - start:.2f} s", flush=True)
+
+
+def load_generator():
+    """4-bit Mistral modelini ve tokenizer'ını bir kez yükler; (model, tokenizer) döndürür"""
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            start = time.perf_counter()
+            import torch
+            from transformers import AutoTokenizer, AutoModelForCausalLM
+            from transformers import BitsAndBytesConfig
 
-model = AutoModelForCausalLM.from_pretrained(model_id,
-                                             quantization_config=quantization_config,
-                                             device_map="auto",
-                                             torch_dtype=torch.float16,
-                                             revision="main")
-model.eval()
-tokenizer = AutoTokenizer.from_pretrained(model_id)
+            quantization_config = BitsAndBytesConfig(
+                load_in_4bit=True,  # Modeli 8-bit modda yükle
+                bnb_8bit_compute_dtype=torch.float16,  # Hesaplamaları fp16 ile yap
+                bnb_8bit_use_double_quant=True  # Çift quantization kullan
+            )
+
+            model = AutoModelForCausalLM.from_pretrained(model_id,
+                                                         quantization_config=quantization_config,
+                                                         device_map="auto",
+                                                         torch_dtype=torch.float16,
+                                                         revision="main")
+            model.eval()
+            tokenizer = AutoTokenizer.from_pretrained(model_id)
+            _generator = (model, tokenizer)
+            log_phase("llm", start)
+    return _generator
 
 
 def generate_response(context, query_text):
@@ -34,6 +60,7 @@ Aşağıda verilen bağlamdaki bilgileri kullanarak '{query_text}' sorusuna uygu
 
 ### Response:
 """
+    model, tokenizer = load_generator()
     input_ids = tokenizer(prompt, return_tensors="pt").input_ids.to(model.device)
 
     output = model.generate(inputs=input_ids, max_new_tokens=512,
@@ -52,66 +79,76 @@ original llm template:
 
 ### Response:
 """
+def parse_args():
+    parser = argparse.ArgumentParser(description="Transcript koleksiyonunda BM25 + HNSW hybrid arama.")
+    parser.add_argument("--limit", type=int, default=1)
+    parser.add_argument("--alpha", type=float, default=HYBRID_ALPHA,
+                        help="1 yalnızca vektör, 0 yalnızca BM25 araması.")
+    parser.add_argument("--fusion", choices=sorted(FUSION_TYPES), default=HYBRID_FUSION)
+    parser.add_argument("--field", choices=SEARCH_FIELDS, default="transkript", help="Varsayılan BM25 arama alanı.")
+    parser.add_argument("--queries", help="Her satırında bir sorgu olan dosya; verilmezse sorgular kullanıcıdan alınır.")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+    # LLM, bağlantı, gömme modeli ve kullanıcı girdisi sürerken arka planda yüklenir.
+    threading.Thread(target=load_generator, name="warm-up-llm", daemon=True).start()
+
+    start = time.perf_counter()
     try:
         client = weaviate.connect_to_local(host="localhost", port=8080)
     except Exception as e:
         print(f"HATA: Weaviate'e bağlanılamadı. ({e})")
         return
+    log_phase("weaviate", start)
 
     try:
-        transcript_collection = client.collections.get("Transcript")
-
-        model_bge = BGEM3FlagModel("BAAI/bge-m3", use_fp16=True)
+        transcript_collection = client.collections.get(COLLECTION_NAME)
 
-        query_text = input("Arama yapmak istediğiniz sorguyu giriniz: ").strip()
-        search_field = input("Hangi alanda aramak istersiniz? (file_title/transkript): ").strip()
+        start = time.perf_counter()
+        from FlagEmbedding import BGEM3FlagModel
 
-        if search_field not in ["file_title", "transkript"]:
-            print("Geçersiz arama alanı seçildi.")
-            return
-
-        query_embeddings = model_bge.encode([query_text], return_dense=True, return_sparse=True)
-
-        dense_embedding = query_embeddings["dense_vecs"][0].tolist()
-
-        sparse_embedding = query_embeddings.get("sparse_vecs", [[]])
-        sparse_embedding = sparse_embedding[0].tolist() if sparse_embedding and sparse_embedding[0] else None
-
-        search_params = {
-            "query": query_text,
-            "vector": dense_embedding,
-            "limit": 1,
-            "return_properties": ["file_title", "transkript"]
-        }
-
-        if sparse_embedding:
-            search_params["sparse_vector"] = sparse_embedding
-        else:
-            print("Uyarı: Sparse embedding bulunamadı, yalnızca dense vector kullanılacak.")
-
-        response = transcript_collection.query.hybrid(**search_params)
-
-        context_pieces = []
-        for idx, item in enumerate(response.objects):
-            file_title = item.properties.get("file_title", "N/A")
-            transkript = item.properties.get("transkript", "N/A")
-            context_pieces.append(f"Başlık: {file_title}\nTranskript: {transkript}")
-
-        context = "\n\n".join(context_pieces)
-        # print("saghdqwbdqwvqgwdjq\n\n" + context)
-        # quit()
-        if not context_pieces:
-            print("Weaviate'de ilgili sonuç bulunamadı.")
-            return
-
-        final_response = generate_response(context, query_text)
-
-        print("\n### LLM Yanıtı ###\n")
-        print(final_response)
+        model_bge = BGEM3FlagModel("BAAI/bge-m3", use_fp16=True)
+        log_phase("bge-m3", start)
+
+        # Bağlantı, gömme modeli ve LLM açık kalır; sorgular tek tek yanıtlanır.
+        for query_text, search_field in iter_queries(args.queries, args.field):
+            timer = StageTimer()
+            try:
+                with timer.stage("encode"):
+                    query_embeddings = model_bge.encode([query_text], return_dense=True, return_sparse=False)
+                    dense_embedding = query_embeddings["dense_vecs"][0].tolist()
+
+                # **BM25 + HNSW Hybrid Query Çalıştır**
+                with timer.stage("search"):
+                    response = hybrid_search(transcript_collection, query_text, dense_embedding, limit=args.limit,
+                                             alpha=args.alpha, fusion=args.fusion, query_properties=[search_field])
+
+                context_pieces = []
+                for idx, item in enumerate(response.objects):
+                    file_title = item.properties.get("file_title", "N/A")
+                    transkript = item.properties.get("transkript", "N/A")
+                    context_pieces.append(f"Başlık: {file_title}\nTranskript: {transkript}")
+
+                context = "\n\n".join(context_pieces)
+                if not context_pieces:
+                    print("Weaviate'de ilgili sonuç bulunamadı.")
+                    continue
+
+                # İlk sorguda LLM henüz yükleniyorsa bu aşama yüklemenin bitmesini de bekler.
+                with timer.stage("generate"):
+                    final_response = generate_response(context, query_text)
+            except Exception as e:
+                print(f"Sorgu sırasında hata oluştu: {e}")
+                continue
+
+            print("\n### LLM Yanıtı ###\n")
+            print(final_response)
+            print(f"\nSüreler: {timer.report()}")
 
     except Exception as e:
-        print(f"Sorgu sırasında hata oluştu: {e}")
+        print(f"HATA: {e}")
 
     finally:
         client.close()
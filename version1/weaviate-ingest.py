@@ -1,8 +1,80 @@
+import argparse
 import json
+import time
 import weaviate
+from weaviate.util import generate_uuid5
 from FlagEmbedding import BGEM3FlagModel
 
+from weaviate_schema import (VECTOR_NAME, HNSW_EF, HNSW_EF_CONSTRUCTION, HNSW_MAX_CONNECTIONS,
+                             create_collection)
+
+DATA_FILE = "transcriptions-no-cut.json"
+
+# BGE-M3 bu sayıda transkripti tek seferde kodlar; Weaviate batch'i bu sırada arka planda gönderir.
+ENCODE_BATCH_SIZE = 16
+# Weaviate'e gRPC ile gönderilen batch boyutu ve aynı anda açık batch isteği sayısı.
+INSERT_BATCH_SIZE = 100
+CONCURRENT_REQUESTS = 2
+# Başarısız nesneler yalnızca kendileri yeniden gönderilir.
+MAX_RETRIES = 3
+
+
+def iter_batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def insert_objects(collection, objects, batch_size=INSERT_BATCH_SIZE, concurrent_requests=CONCURRENT_REQUESTS):
+    """
+    (uuid, properties, vector) nesnelerini batch ile ekler ve başarısız olanları döndürür.
+    objects bir generator olabilir; kodlama sürerken önceki batch'ler gönderilir.
+    """
+    with collection.batch.fixed_size(batch_size=batch_size, concurrent_requests=concurrent_requests) as batch:
+        for uuid, properties, vector in objects:
+            batch.add_object(properties=properties, vector={VECTOR_NAME: vector}, uuid=uuid)
+    return collection.batch.failed_objects
+
+
+def encode_objects(model, items, encode_batch_size=ENCODE_BATCH_SIZE):
+    """Transkriptleri batch'ler halinde kodlar ve (uuid, properties, vector) üretir"""
+    for batch_items in iter_batches(items, encode_batch_size):
+        embeddings = model.encode([content["transkript"] for _, content in batch_items],
+                                  batch_size=encode_batch_size, return_dense=True, return_sparse=False)
+        for (key, content), dense_embedding in zip(batch_items, embeddings["dense_vecs"]):
+            properties = {"file_title": content["file_title"], "transkript": content["transkript"]}
+            # Aynı dosya her zaman aynı uuid'yi alır; yeniden deneme ve tekrar ingest kopya oluşturmaz.
+            yield generate_uuid5(key), properties, dense_embedding.tolist()
+
+
+def ingest(collection, model, data, encode_batch_size=ENCODE_BATCH_SIZE, batch_size=INSERT_BATCH_SIZE,
+           concurrent_requests=CONCURRENT_REQUESTS, max_retries=MAX_RETRIES):
+    """Veriyi kodlayıp ekler; eklenemeyen nesnelerin hata mesajlarını döndürür"""
+    failed = insert_objects(collection, encode_objects(model, list(data.items()), encode_batch_size),
+                            batch_size, concurrent_requests)
+    for attempt in range(1, max_retries + 1):
+        if not failed:
+            break
+        print(f"{len(failed)} nesne eklenemedi, yeniden deneniyor ({attempt}/{max_retries})...")
+        time.sleep(2 ** (attempt - 1))
+        retry = [(error.object_.uuid, error.object_.properties, error.object_.vector[VECTOR_NAME]) for error in failed]
+        failed = insert_objects(collection, retry, batch_size, concurrent_requests)
+    return [(error.object_.properties.get("file_title"), error.message) for error in failed]
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Transkriptleri BGE-M3 vektörleriyle Weaviate'e batch halinde ekler.")
+    parser.add_argument("--data-file", default=DATA_FILE)
+    parser.add_argument("--encode-batch-size", type=int, default=ENCODE_BATCH_SIZE)
+    parser.add_argument("--batch-size", type=int, default=INSERT_BATCH_SIZE)
+    parser.add_argument("--concurrent-requests", type=int, default=CONCURRENT_REQUESTS)
+    parser.add_argument("--max-retries", type=int, default=MAX_RETRIES)
+    parser.add_argument("--recreate", action="store_true",
+                        help="Koleksiyonu silip yeniden oluşturur (eski dense_vector özellikli şema için gerekli).")
+    parser.add_argument("--ef", type=int, default=HNSW_EF, help="HNSW sorgu aday listesi boyutu.")
+    parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--max-connections", type=int, default=HNSW_MAX_CONNECTIONS)
+    args = parser.parse_args()
+
     with weaviate.connect_to_local(host="localhost", port=8080) as client:
         try:
             meta = client.get_meta()
@@ -11,54 +83,22 @@ def main():
             print(f"HATA: Weaviate'e bağlanılamadı. Lütfen Docker konteynerini başlatın. ({e})")
             return
 
-        schema = {
-            "class": "Transcript",
-            "properties": [
-                {"name": "file_title", "dataType": ["text"]},
-                {"name": "transkript", "dataType": ["text"]},
-                {"name": "dense_vector", "dataType": ["number[]"]}  # Dense embedding
-            ]
-        }
-
-        if not client.collections.exists("Transcript"):
-            client.collections.create_from_dict(schema)
-            print("Schema oluşturuldu.")
-        else:
-            print("Schema zaten mevcut.")
+        transcript_collection = create_collection(client, args.recreate, args.ef, args.ef_construction,
+                                                  args.max_connections)
 
         model = BGEM3FlagModel("BAAI/bge-m3", use_fp16=True)
 
-        data_file = "transcriptions-no-cut.json"
-        with open(data_file, "r", encoding="utf-8") as f:
+        with open(args.data_file, "r", encoding="utf-8") as f:
             data = json.load(f)
 
-        transcript_collection = client.collections.get("Transcript")
-
-        for _, content in data.items():
-            text = content["transkript"]
-
-            embeddings = model.encode([text], return_dense=True, return_sparse=True)
-
-            dense_embedding = embeddings["dense_vecs"][0].tolist()
-
-            sparse_embedding = embeddings.get("sparse_vecs", [])
-
-            if not sparse_embedding:
-                print(f"Sparse embedding bulunamadı: {content['file_title']}")
-
-            transcript_data = {
-                "file_title": content["file_title"],
-                "transkript": text,
-                "dense_vector": dense_embedding
-            }
-
-            if sparse_embedding:
-                transcript_data["sparse_vector"] = sparse_embedding[0].tolist()
-
-            transcript_collection.data.insert(transcript_data)
-            print(f"Eklendi: {content['file_title']}")
+        start = time.perf_counter()
+        failed = ingest(transcript_collection, model, data, args.encode_batch_size, args.batch_size,
+                        args.concurrent_requests, args.max_retries)
+        elapsed = time.perf_counter() - start
 
-        print("Tüm veriler başarıyla eklendi.")
+        for file_title, message in failed:
+            print(f"Eklenemedi: {file_title} ({message})")
+        print(f"{len(data) - len(failed)}/{len(data)} transkript {elapsed:.2f} saniyede eklendi.")
 
 if __name__ == '__main__':
     from multiprocessing import freeze_support
@@ -66,5 +106,5 @@ if __name__ == '__main__':
     main()
 
 # to run: docker compose up -d
-# python 3ingest.py
+# python weaviate-ingest.py
 # token name: weavite-sample-1
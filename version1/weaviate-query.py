@@ -1,8 +1,24 @@
+import argparse
 import weaviate
 from FlagEmbedding import BGEM3FlagModel
 
+from weaviate_schema import (COLLECTION_NAME, FUSION_TYPES, HYBRID_ALPHA, HYBRID_FUSION, SEARCH_FIELDS,
+                             StageTimer, hybrid_search, iter_queries)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Transcript koleksiyonunda BM25 + HNSW hybrid arama.")
+    parser.add_argument("--limit", type=int, default=3)
+    parser.add_argument("--alpha", type=float, default=HYBRID_ALPHA,
+                        help="1 yalnızca vektör, 0 yalnızca BM25 araması.")
+    parser.add_argument("--fusion", choices=sorted(FUSION_TYPES), default=HYBRID_FUSION)
+    parser.add_argument("--field", choices=SEARCH_FIELDS, default="transkript", help="Varsayılan BM25 arama alanı.")
+    parser.add_argument("--queries", help="Her satırında bir sorgu olan dosya; verilmezse sorgular kullanıcıdan alınır.")
+    return parser.parse_args()
+
 
 def main():
+    args = parse_args()
     # **Weaviate'e bağlan**
     try:
         client = weaviate.connect_to_local(host="localhost", port=8080)
@@ -12,57 +28,41 @@ def main():
 
     try:
         # **Koleksiyonu tanımla**
-        transcript_collection = client.collections.get("Transcript")
+        transcript_collection = client.collections.get(COLLECTION_NAME)
 
         # **Modeli yükle**
         model = BGEM3FlagModel("BAAI/bge-m3", use_fp16=True)
 
-        # **Kullanıcıdan sorgu ve arama türü al**
-        query_text = input("Arama yapmak istediğiniz sorguyu giriniz: ").strip()
-        search_field = input("Hangi alanda aramak istersiniz? (file_title/transkript): ").strip()
-
-        if search_field not in ["file_title", "transkript"]:
-            print("Geçersiz arama alanı seçildi.")
-            return
-
-        # **BGE-M3 Modelinden Query için Embedding Çıkar**
-        query_embeddings = model.encode([query_text], return_dense=True, return_sparse=True)
-
-        dense_embedding = query_embeddings["dense_vecs"][0].tolist()
-
-        # Sparse embedding varsa al, yoksa None olarak belirle
-        sparse_embedding = query_embeddings.get("sparse_vecs", [[]])
-        sparse_embedding = sparse_embedding[0].tolist() if sparse_embedding and sparse_embedding[0] else None
-
-        # **Hybrid Search Kullanımı**
-        search_params = {
-            "query": query_text,  # String formatında sorgu
-            "vector": dense_embedding,  # Dense vektör
-            "limit": 3,
-            "return_properties": ["file_title", "transkript"]
-        }
-
-        # Eğer sparse embedding mevcutsa, hybrid search'e dahil et
-        if sparse_embedding:
-            search_params["sparse_vector"] = sparse_embedding  # `sparse_vector` kullanıldı
-        else:
-            print("Uyarı: Sparse embedding bulunamadı, yalnızca dense vector kullanılacak.")
-
-        # **Weaviate Hybrid Query Çalıştır**
-        response = transcript_collection.query.hybrid(**search_params)
-
-        # **Sonuçları yazdır**
-        print("\nEn alakalı sonuçlar:")
-        for idx, item in enumerate(response.objects):
-            file_title = item.properties.get("file_title", "N/A")
-            transkript = item.properties.get("transkript", "N/A")
-
-            print(f"\nSonuç {idx + 1}:")
-            print(f"Başlık: {file_title}")
-            print(f"Transkript: {transkript}")
+        # **Bağlantı ve model açık kalır; sorgular tek tek yanıtlanır**
+        for query_text, search_field in iter_queries(args.queries, args.field):
+            timer = StageTimer()
+            try:
+                # **BGE-M3 Modelinden Query için Embedding Çıkar**
+                with timer.stage("encode"):
+                    query_embeddings = model.encode([query_text], return_dense=True, return_sparse=False)
+                    dense_embedding = query_embeddings["dense_vecs"][0].tolist()
+
+                # **BM25 + HNSW Hybrid Query Çalıştır**
+                with timer.stage("search"):
+                    response = hybrid_search(transcript_collection, query_text, dense_embedding, limit=args.limit,
+                                             alpha=args.alpha, fusion=args.fusion, query_properties=[search_field])
+            except Exception as e:
+                print(f"Sorgu sırasında hata oluştu: {e}")
+                continue
+
+            # **Sonuçları yazdır**
+            print(f"\nEn alakalı sonuçlar ({query_text}):")
+            for idx, item in enumerate(response.objects):
+                file_title = item.properties.get("file_title", "N/A")
+                transkript = item.properties.get("transkript", "N/A")
+
+                print(f"\nSonuç {idx + 1}:")
+                print(f"Başlık: {file_title}")
+                print(f"Transkript: {transkript}")
+            print(f"\nSüreler: {timer.report()}")
 
     except Exception as e:
-        print(f"Sorgu sırasında hata oluştu: {e}")
+        print(f"HATA: {e}")
 
     finally:
         # **Bağlantıyı kapat**
@@ -0,0 +1,174 @@
+"""
+Transcript koleksiyonunun şeması ve hybrid arama yardımcıları.
+
+weaviate-ingest.py, weaviate-query.py ve weaviate-app.py aynı koleksiyon ayarlarını buradan kullanır:
+    - "dense" adlı, istemcide BGE-M3 ile üretilen vektörler için HNSW indeksi (kosinüs)
+    - file_title ve transkript alanları üzerinde BM25 ters indeksi
+Hybrid sorgu, HNSW (vektör) ve BM25 (anahtar kelime) sonuçlarını alpha ağırlığıyla birleştirir.
+Sorgu döngüsü yardımcıları (iter_queries, StageTimer) kalıcı sorgu oturumlarında kullanılır.
+
+Koleksiyonun ef değeri tüm istemciler için ortaktır; yalnızca yönetim adımı olarak değiştirilir:
+    python weaviate_schema.py set-ef 256
+"""
+import argparse
+import time
+from contextlib import contextmanager
+
+import weaviate
+import weaviate.classes.config as wc
+from weaviate.classes.query import HybridFusion
+
+COLLECTION_NAME = "Transcript"
+VECTOR_NAME = "dense"
+
+# HNSW: ef sorgu sırasında gezilen aday listesinin boyutu (yüksek = daha doğru, daha yavaş),
+# ef_construction indeks oluşturulurken kullanılan liste boyutu, max_connections düğüm başına komşu sayısı.
+HNSW_EF = 128
+HNSW_EF_CONSTRUCTION = 128
+HNSW_MAX_CONNECTIONS = 32
+
+# BM25 parametreleri (Weaviate varsayılanları).
+BM25_B = 0.75
+BM25_K1 = 1.2
+
+# alpha = 1 yalnızca vektör, alpha = 0 yalnızca BM25 araması demektir.
+HYBRID_ALPHA = 0.75
+SEARCH_FIELDS = ["file_title", "transkript"]
+FUSION_TYPES = {"ranked": HybridFusion.RANKED, "relative_score": HybridFusion.RELATIVE_SCORE}
+HYBRID_FUSION = "relative_score"
+
+
+def create_collection(client, recreate=False, ef=HNSW_EF, ef_construction=HNSW_EF_CONSTRUCTION,
+                      max_connections=HNSW_MAX_CONNECTIONS):
+    """Koleksiyonu yoksa HNSW vektör indeksi ve BM25 ters indeksiyle oluşturur"""
+    if recreate and client.collections.exists(COLLECTION_NAME):
+        client.collections.delete(COLLECTION_NAME)
+        print("Mevcut koleksiyon silindi.")
+
+    if not client.collections.exists(COLLECTION_NAME):
+        client.collections.create(
+            COLLECTION_NAME,
+            vectorizer_config=[
+                wc.Configure.NamedVectors.none(
+                    name=VECTOR_NAME,
+                    vector_index_config=wc.Configure.VectorIndex.hnsw(
+                        distance_metric=wc.VectorDistances.COSINE,
+                        ef=ef,
+                        ef_construction=ef_construction,
+                        max_connections=max_connections,
+                    ),
+                )
+            ],
+            inverted_index_config=wc.Configure.inverted_index(bm25_b=BM25_B, bm25_k1=BM25_K1),
+            properties=[
+                wc.Property(name="file_title", data_type=wc.DataType.TEXT, index_searchable=True,
+                            tokenization=wc.Tokenization.WORD),
+                wc.Property(name="transkript", data_type=wc.DataType.TEXT, index_searchable=True,
+                            tokenization=wc.Tokenization.WORD),
+            ],
+        )
+        print("Schema oluşturuldu.")
+    else:
+        print("Schema zaten mevcut.")
+    return client.collections.get(COLLECTION_NAME)
+
+
+def set_ef(collection, ef):
+    """
+    Koleksiyonun HNSW ef değerini indeksi yeniden oluşturmadan değiştirir.
+    Ayar sunucudadır ve koleksiyonu sorgulayan herkesi etkiler; sorgu betikleri bunu çağırmaz.
+    """
+    collection.config.update(
+        vectorizer_config=[
+            wc.Reconfigure.NamedVectors.update(
+                name=VECTOR_NAME,
+                vector_index_config=wc.Reconfigure.VectorIndex.hnsw(ef=ef),
+            )
+        ]
+    )
+
+
+def hybrid_search(collection, query_text, dense_embedding, limit=3, alpha=HYBRID_ALPHA, fusion=HYBRID_FUSION,
+                  query_properties=None):
+    """
+    BM25 ve HNSW sonuçlarını birleştiren hybrid sorgu.
+    query_properties verilirse BM25 yalnızca bu alanlarda arar (ör. ["file_title"]).
+    """
+    return collection.query.hybrid(
+        query=query_text,
+        vector=dense_embedding,
+        target_vector=VECTOR_NAME,
+        alpha=alpha,
+        fusion_type=FUSION_TYPES[fusion],
+        query_properties=query_properties,
+        limit=limit,
+        return_properties=["file_title", "transkript"],
+    )
+
+
+def iter_queries(queries_file=None, search_field="transkript"):
+    """
+    Sorguları dosyadan (her satırda bir sorgu) ya da kullanıcıdan okur ve (sorgu, alan) üretir.
+    Etkileşimli modda boş sorgu, Ctrl+D veya Ctrl+C döngüyü bitirir.
+    """
+    if queries_file:
+        with open(queries_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield line.strip(), search_field
+        return
+
+    while True:
+        try:
+            query_text = input("\nArama yapmak istediğiniz sorguyu giriniz (çıkmak için boş bırakın): ").strip()
+            if not query_text:
+                return
+            field = input(f"Hangi alanda aramak istersiniz? (file_title/transkript) [{search_field}]: ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return
+        field = field or search_field
+        if field not in SEARCH_FIELDS:
+            print("Geçersiz arama alanı seçildi.")
+            continue
+        yield query_text, field
+
+
+class StageTimer:
+    """Bir sorgunun aşama sürelerini (encode, search, generate...) ölçer"""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def report(self):
+        stages = [f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.timings.items()]
+        return " | ".join(stages + [f"toplam {sum(self.timings.values()) * 1000:.0f} ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcript koleksiyonu yönetim komutları.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    set_ef_parser = commands.add_parser("set-ef", help="Koleksiyonun HNSW ef değerini değiştirir (tüm istemciler için).")
+    set_ef_parser.add_argument("ef", type=int)
+    args = parser.parse_args()
+
+    with weaviate.connect_to_local(host="localhost", port=8080) as client:
+        if not client.collections.exists(COLLECTION_NAME):
+            print(f"HATA: {COLLECTION_NAME} koleksiyonu bulunamadı; önce weaviate-ingest.py çalıştırın.")
+            return
+        collection = client.collections.get(COLLECTION_NAME)
+        if args.command == "set-ef":
+            set_ef(collection, args.ef)
+            print(f"{COLLECTION_NAME} koleksiyonunun HNSW ef değeri {args.ef} olarak ayarlandı.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,185 +1,90 @@
 import json
 import os
-import time
-import subprocess
-import io
-import numpy as np
-from datetime import datetime
 
 import streamlit as st
-import torch
-import scipy.io.wavfile
-from txtai import Embeddings
-from tqdm import tqdm
-from transformers import VitsModel, AutoTokenizer
-from duckduckgo_search import DDGS
+import requests
+from requests.adapters import HTTPAdapter
+
+from speech_stream import SequentialPlayer, StreamingTTS, concatenate_wavs
 
 # Sayfa konfigürasyonu (geniş ekran, sayfa başlığı vs.)
 st.set_page_config(layout="wide", page_title="🎖️ Leadership Coach", initial_sidebar_state="expanded")
 st.title("🎖️ Leadership Coach")
 
 ##############################################
-# txtai Indexing ve LLM Yanıt Fonksiyonları  #
+# Model Servisi İstemcisi                    #
 ##############################################
 
-class EmbeddingIndexer:
-    def __init__(self, model_name="BAAI/bge-m3", cuda_device="1"):
-        """
-        Belirtilen model ve CUDA ayarları ile embedding indexer'ı başlatır.
-        """
-        os.environ["CUDA_VISIBLE_DEVICES"] = cuda_device
-        self.model_name = model_name
-        # txtai Embeddings örneğini oluşturuyoruz.
-        self.embeddings = Embeddings(path=model_name, hybrid=True, content=True, method="clspooling")
-        self.data = {}
-        self.documents = []
+# Arama, LLM, TTS ve web araması server.py'deki model servisinde çalışır; bu arayüz
+# yalnızca HTTP istemcisidir ve model yüklemez.
+COACH_API_URL = os.environ.get("COACH_API_URL", "http://localhost:8000")
 
-    def load_data(self, json_file):
-        """
-        JSON dosyasından veriyi yükler.
-        """
-        with open(json_file, "r", encoding="utf-8") as f:
-            self.data = json.load(f)
-        return self.data
+class CoachClient:
+    """
+    Model servisi için kalıcı (keep-alive) bağlantı havuzlu HTTP istemcisi.
+    """
 
-    def prepare_documents(self):
+    def __init__(self, base_url=COACH_API_URL, timeout=(5, 300), pool_size=8):
+        self.base_url = base_url.rstrip("/")
+        # (bağlantı, okuma) zaman aşımı; okuma süresi token'lar arası beklemeyi sınırlar.
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, path, payload, **kwargs):
+        response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def search(self, query, limit=3, weights=None, web=False, web_max_results=5):
         """
-        Dokümanları, dosya başlığı ve transkripti birleştirerek hazırlar.
-        Her doküman: (id, birleşik metin, metadata) şeklinde.
+        Hybrid arama yapar; sonuçlar doküman kayıtlarıyla birlikte döner. web=True ise servis
+        DuckDuckGo aramasını aynı anda çalıştırır ve sonuçları "web" alanında döndürür.
         """
-        self.documents = []
-        for key, value in self.data.items():
-            file_title = value.get("file_title", "")
-            transcription = value.get("transcription", "")
-            combined_text = f"Dosya Başlığı: {file_title}\nTranskript: {transcription}"
-            metadata = json.dumps({"file_title": file_title, "transcription": transcription})
-            self.documents.append((key, combined_text, metadata))
-        return self.documents
+        return self.post("/search", {"query": query, "limit": limit, "weights": weights,
+                                     "web": web, "web_max_results": web_max_results}).json()
 
-    def index_documents(self):
+    def answer_stream(self, query, ids, cancel_event=None, web=False):
         """
-        Hazırlanan dokümanları txtai ile indeksler.
+        Verilen doküman kimlikleriyle üretilen yanıtı NDJSON parçaları halinde akıtır (generator).
+        web=True ise web sonuçları da bağlama eklenir.
+        cancel_event set edildiğinde veya generator kapatıldığında bağlantı kapanır ve üretim durur.
         """
-        if not self.documents:
-            raise ValueError("İndeksleme için doküman bulunamadı. Önce prepare_documents() çalıştırın.")
-        st.info("Dokümanlar indeksleniyor...")
-        start_time = time.time()
-        self.embeddings.index(tqdm(self.documents, total=len(self.documents)))
-        elapsed_time = time.time() - start_time
-        st.success(f"İndeksleme {elapsed_time:.2f} saniyede tamamlandı.")
-        return elapsed_time
-
-    def save_index(self, directory="indexes"):
+        with self.post("/answer", {"query": query, "ids": ids, "web": web}, stream=True) as response:
+            for line in response.iter_lines():
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                if line:
+                    yield json.loads(line)
+
+    def tts(self, text):
         """
-        İndeksi belirtilen dizine kaydeder.
+        Cümleyi WAV baytlarına çevirir; seslendirilecek bir şey yoksa None döner.
         """
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-        current_date = datetime.now().strftime("%d-%m-%Y")
-        file_name = f"index_{self.model_name.split('/')[-1]}_{current_date}"
-        file_path = os.path.join(directory, file_name)
-        self.embeddings.save(file_path)
-        st.info("İndeks kaydedildi: " + file_path)
-        return file_path
-
-# Web Search Function (No API Key)
-def search_web_results_duckduckgo(query, max_results=5):
-    """
-    DuckDuckGo kullanarak API anahtarsız web araması yapar.
-    """
-    try:
-        ddgs = DDGS()
-        results = list(ddgs.text(query, max_results=max_results))
-        return results
-    except Exception as e:
-        st.error(f"Web araması sırasında hata oluştu: {str(e)}")
-        return []
-
-def generate_response(context, query_text):
-    """
-    Ollama aracılığıyla llama3-70b modelini çalıştırır ve LLM yanıtını üretir.
-    """
-    prompt = f"""Sistem Talimatları:
-    Sen yalnızca Türkçe yanıt veren bir yapay zeka asistanısın.
-    Başka bir dilde yanıt vermemelisin.
-
-    Aşağıdaki bağlamı kullanarak, '{query_text}' sorusuna yalnızca Türkçe olarak yanıt oluştur.
-    Bağlamda verilen bilgilerden emin olmadığın durumda yanıt üretme.
-    Gereksiz yorum veya tahmin yapma.
-    Eğer bağlamda yeterli bilgi yoksa, sadece "Bilmiyorum." diye yanıt ver.
-
-    --- BAĞLAM ---
-    {context}
-
-    --- SORU ---
-    {query_text}
-
-    --- YANIT ---"""
-    try:
-        result = subprocess.run(
-            ["ollama", "run", "llama3:70b", prompt],
-            capture_output=True, text=True, check=True
-        )
-        response = result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        st.error("Ollama hatası: " + e.stderr)
-        response = "Ollama ile yanıt üretilirken bir hata oluştu."
-    return response
-
-# LLM yanıtlarını cache'lemek için yeni fonksiyon
-@st.cache_data(show_spinner=False)
-def cached_generate_response(context, query_text):
-    return generate_response(context, query_text)
-
-#########################################
-# TTS Model Yükleme ve Ses Üretim Fonksiyonu #
-#########################################
-
-@st.cache_resource
-def load_tts_model_and_tokenizer():
-    model = VitsModel.from_pretrained("facebook/mms-tts-tur")
-    tokenizer = AutoTokenizer.from_pretrained("facebook/mms-tts-tur")
-    return model, tokenizer
-
-tts_model, tts_tokenizer = load_tts_model_and_tokenizer()
-
-#########################################
-# Embedding Indexer'ı Yükleme veya Oluşturma #
-#########################################
+        response = self.post("/tts", {"text": text})
+        return response.content if response.status_code != 204 else None
 
 @st.cache_resource
-def load_indexer():
-    index_dir = "/data/Workspace/balkan/leadership_coach/indexes"
-    indexer = EmbeddingIndexer(model_name="BAAI/bge-m3", cuda_device="1")
-    current_date = datetime.now().strftime("%d-%m-%Y")
-    index_file_name = f"index_{indexer.model_name.split('/')[-1]}_{current_date}"
-    index_file_path = os.path.join(index_dir, index_file_name)
-
-    if os.path.exists(index_file_path):
-        st.info("Önceden oluşturulmuş indeks yükleniyor: /indexes/index_bge-m3_10-03-2025")# + # index_file_path)
-        indexer.embeddings.load(index_file_path)
-        indexer.load_data("transcriptions-no-cut.json")
-        indexer.prepare_documents()
-    else:
-        st.info("İndeks dosyası bulunamadı. Dokümanlar indeksleniyor...")
-        indexer.load_data("transcriptions-no-cut.json")
-        indexer.prepare_documents()
-        indexer.index_documents()
-        indexer.save_index(directory=index_dir)
-    return indexer
-
-indexer = load_indexer()
+def load_client():
+    return CoachClient()
 
 #########################################
 # Kullanıcı Arayüzü - Sorgu ve İşlemler #
 #########################################
 
+client = load_client()
+
 st.subheader("Arama Sorgusu Girin")
 query_text = st.text_input("Arama sorgunuzu giriniz:")
 
 with st.form("query_params"):
     limit_input = st.text_input("Arama limiti (Varsayılan: 3):", "3")
     weight_input = st.text_input("Hybrid search için ağırlık (Örnek: 0.5, Varsayılan: None):", "")
+    # Web araması doküman aramasıyla aynı anda, servisteki zaman aşımı bütçesiyle çalışır.
+    web_enabled = st.checkbox("Web Search Yapılsın mı?")
+    web_context = st.checkbox("Web sonuçları LLM bağlamına eklensin mi?")
     submitted = st.form_submit_button("Ara")
     
 if submitted and query_text:
@@ -194,63 +99,102 @@ if submitted and query_text:
         weight = None
 
     # Arama işlemi
-    results = indexer.embeddings.search(query_text, limit=limit, weights=weight)
+    try:
+        response = client.search(query_text, limit=limit, weights=weight, web=web_enabled)
+    except requests.RequestException as e:
+        st.error(f"Model servisine ulaşılamadı ({client.base_url}): {str(e)}")
+        st.stop()
+    results = response["results"]
+    stats = response["cache_stats"]
+    st.sidebar.subheader("Arama Önbelleği")
+    st.sidebar.caption(f"Sonuç: %{stats['result_hit_rate'] * 100:.0f} isabet, {stats['result_size']} kayıt")
+    st.sidebar.caption(f"Sorgu vektörü: %{stats['vector_hit_rate'] * 100:.0f} isabet, {stats['vector_size']} kayıt")
     if not results:
         st.warning("İlgili doküman bulunamadı.")
     else:
-        # Doküman bilgilerini topla ve ekrana yazdır
-        doc_dict = {doc[0]: doc for doc in indexer.documents}
-        context_pieces = []
+        # Doküman bilgilerini ekrana yazdır; bağlam servis tarafında aynı kimliklerden oluşturulur.
+        doc_ids = []
         st.subheader("Elde Edilen Dokümanlar")
         for res in results:
-            if isinstance(res, dict):
-                doc_id = res.get("id")
-            else:
-                doc_id = res[0]
-            if doc_id in doc_dict:
-                metadata = json.loads(doc_dict[doc_id][2])
-                file_title = metadata.get("file_title", "N/A")
-                transcription = metadata.get("transcription", "N/A")
-                st.markdown(f"**Başlık:** {file_title}")
-                st.markdown(f"**Transkript:** {transcription}")
+            doc_ids.append(res["id"])
+            record = res["record"]
+            if record is not None:
+                st.markdown(f"**Başlık:** {record['file_title'] or 'N/A'}")
+                if record["unit"] == "s":
+                    st.caption(f"Pasaj: [{record['start']:.2f}s - {record['end']:.2f}s]")
+                elif record["unit"] == "char":
+                    st.caption(f"Pasaj: karakter {record['start']}-{record['end']}")
+                st.markdown(f"**Transkript:** {record['transcription']}")
                 st.markdown("---")
-                context_pieces.append(f"Başlık: {file_title}\nTranskript: {transcription}")
             else:
                 st.error("Doküman bilgisi bulunamadı.")
-                context_pieces.append("Doküman bilgisi bulunamadı.")
-        context = "\n\n".join(context_pieces)
 
-        # LLM yanıtını üret (cache'lenmiş fonksiyon kullanılıyor)
+        if web_enabled:
+            st.subheader("Web Sonuçları")
+            if response["web"]["error"] == "timeout":
+                st.warning("Web araması zaman aşımına uğradı; yanıt web sonuçları olmadan üretilecek.")
+            elif response["web"]["error"]:
+                st.error(f"Web araması sırasında hata oluştu: {response['web']['error']}")
+            for result in response["web"]["results"]:
+                st.markdown(f"**[{result.get('title', 'Başlık Yok')}]({result.get('href', '#')})**")
+                st.write(result.get("body", "Açıklama Yok"))
+                st.markdown("---")
+
+        # LLM yanıtını üret (servis tarafında anlamsal önbellek kullanılıyor)
         st.subheader("LLM Yanıtı")
-        final_response = cached_generate_response(context, query_text)
-        st.write(final_response)
+        answer_container = st.container()
 
         #########################################
         # TTS: Yanıtı Sese Dönüştürme          #
         #########################################
+        # Cümleler, LLM üretimi sürerken sese çevrilir ve tek bir ses öğesinde sırayla otomatik çalınır.
         st.subheader("Sesli Yanıt")
-        with st.spinner("Ses oluşturuluyor..."):
-            inputs = tts_tokenizer(final_response, return_tensors="pt")
-            with torch.no_grad():
-                result = tts_model(**inputs)
-                waveform = result.waveform.detach().cpu().numpy()
+        audio_slot = st.empty()
+        speech = StreamingTTS(synthesize=client.tts)
+        player = SequentialPlayer(audio_slot)
+
+        answer_status = {}
+
+        def stream_with_speech():
+            try:
+                for chunk in client.answer_stream(query_text, doc_ids, web=web_enabled and web_context):
+                    if chunk.get("done"):
+                        answer_status.update(chunk)
+                        break
+                    if "context" in chunk:
+                        answer_status["context"] = chunk["context"]
+                        continue
+                    token = chunk.get("response", "")
+                    speech.feed(token)
+                    for clip in speech.ready():
+                        player.add(clip)
+                    player.advance()
+                    yield token
+            except requests.RequestException as e:
+                answer_status["error"] = str(e)
+            if answer_status.get("error"):
+                st.error("Ollama hatası: " + answer_status["error"])
+                message = "Ollama ile yanıt üretilirken bir hata oluştu."
+                speech.feed(message)
+                yield message
+            speech.finish()
+
+        final_response = answer_container.write_stream(stream_with_speech()).strip()
+        if answer_status.get("cache") == "semantic":
+            answer_container.caption(f"Anlamsal önbellekten (benzerlik: {answer_status['score']:.3f})")
+        if answer_status.get("context"):
+            context_stats = answer_status["context"]
+            answer_container.caption(
+                f"Bağlam: {context_stats['tokens']} / {context_stats['budget']} token, "
+                f"{context_stats['documents']} doküman ({context_stats['web']} web), "
+                f"{context_stats['sentences']}/{context_stats['total_sentences']} cümle"
+                + (" (sıkıştırıldı)" if context_stats["compressed"] else ""))
 
-            if waveform.ndim > 1:
-                waveform = waveform.squeeze()
-            waveform_norm = waveform / np.max(np.abs(waveform))
-            waveform_int16 = (waveform_norm * 32767).astype(np.int16)
-            sampling_rate = tts_model.config.sampling_rate
-
-            wav_buffer = io.BytesIO()
-            scipy.io.wavfile.write(wav_buffer, rate=sampling_rate, data=waveform_int16)
-            wav_buffer.seek(0)
-            st.audio(wav_buffer, format="audio/wav")
+        with st.spinner("Ses oluşturuluyor..."):
+            player.follow(speech)
+        if speech.errors:
+            st.error(f"{len(speech.errors)} cümle seslendirilemedi: {speech.errors[-1]}")
+        if player.played:
+            # Oynatma bitince aynı öğe, tekrar dinlemek için yanıtın tamamını (otomatik çalmadan) gösterir.
+            audio_slot.audio(concatenate_wavs(player.played), format="audio/wav")
             st.success("Ses oluşturuldu!")
-            
-            st.subheader("Web Search Yapılsın mı?")
-            if st.checkbox("Web Search Yapılsın mı?"):
-                search_results = search_web_results_duckduckgo(query_text, max_results=5)
-                for result in search_results:
-                    st.markdown(f"**[{result.get('title', 'Başlık Yok')}]({result.get('href', '#')})**")
-                    st.write(result.get("body", "Açıklama Yok"))
-                    st.markdown("---")
@@ -1,110 +1,74 @@
-import os
-import json
 import torch
-import numpy as np
 from transformers import WhisperForConditionalGeneration, WhisperProcessor
-from pydub import AudioSegment
 
+from transcription import StreamingTranscriber, transcribe_folder_parallel
 
-class WhisperTranscriber:
+
+class WhisperTranscriber(StreamingTranscriber):
     """
     A class to handle audio transcription using OpenAI's Whisper model.
     """
 
-    def __init__(self, model_name="openai/whisper-large-v3", audio_chunk_length=60):
+    def __init__(self, model_name="openai/whisper-large-v3", audio_chunk_length=60, batch_size=8, device=None,
+                 ffmpeg_binary="ffmpeg", vad=True, vad_threshold_db=-40):
         """
         Initializes the Whisper model and processor.
+        Chunks are decoded in batches of batch_size; on CPU the model runs in float32,
+        so a small checkpoint such as "openai/whisper-tiny" can be used for testing.
+        With vad=True audio is segmented on pauses instead of fixed audio_chunk_length windows.
         """
         print(f"GPU Available: {torch.cuda.is_available()}")
         self.model_name = model_name
         self.audio_chunk_length = audio_chunk_length
+        self.batch_size = batch_size
+        self.ffmpeg_binary = ffmpeg_binary
+        # Voice activity detection; the remaining VAD settings are StreamingTranscriber defaults.
+        self.vad = vad
+        self.vad_threshold_db = vad_threshold_db
+        self.device = device or ("cuda:0" if torch.cuda.is_available() else "cpu")
+        self.torch_dtype = torch.float16 if self.device.startswith("cuda") else torch.float32
         
         # Load Whisper model
         self.whisper_model = WhisperForConditionalGeneration.from_pretrained(
-            self.model_name, torch_dtype=torch.float16, device_map={"": 0}
-        )
+            self.model_name, torch_dtype=self.torch_dtype
+        ).to(self.device)
         self.whisper_processor = WhisperProcessor.from_pretrained(self.model_name)
 
-    def load_mp3(self, audio_path, target_sample_rate=16000):
-        """
-        Loads an MP3 file, converts it to mono, and resamples it to the target sample rate.
-        """
-        audio = AudioSegment.from_mp3(audio_path)
-        audio = audio.set_channels(1)  # Convert to mono
-        audio = audio.set_frame_rate(target_sample_rate)  # Resample to 16kHz
-        samples = np.array(audio.get_array_of_samples()).astype(np.float32)
-        max_val = float(2 ** (8 * audio.sample_width - 1))
-        samples = samples / max_val
-        return torch.tensor(samples)
-
-    def chunk_audio(self, audio_path):
+    def transcribe_batch(self, chunks):
         """
-        Splits the audio into smaller chunks of predefined length.
+        Transcribes a batch of audio chunks in Turkish with a single generate call.
+        Chunks are padded to the same length with an attention mask; results keep the input order.
         """
-        speech = self.load_mp3(audio_path, target_sample_rate=16000)
-        sr = 16000
-        num_samples_per_chunk = self.audio_chunk_length * sr
-        chunks, timestamps = [], []
-        
-        for i in range(0, len(speech), num_samples_per_chunk):
-            chunks.append(speech[i:i + num_samples_per_chunk])
-            timestamps.append(i / sr)
-        
-        return chunks, timestamps
-
-    def transcribe_chunk(self, chunk):
-        """
-        Transcribes a given audio chunk in Turkish using the Whisper model.
-        """
-        inputs = self.whisper_processor(chunk, return_tensors="pt", sampling_rate=16000)
-        inputs["input_features"] = inputs["input_features"].to(self.whisper_model.device, torch.float16)
+        inputs = self.whisper_processor(
+            [chunk.numpy() for chunk in chunks],
+            return_tensors="pt",
+            sampling_rate=self.target_sample_rate,
+            return_attention_mask=True
+        )
+        input_features = inputs["input_features"].to(self.whisper_model.device, self.torch_dtype)
+        attention_mask = inputs["attention_mask"].to(self.whisper_model.device)
         
         with torch.no_grad():
             predicted_ids = self.whisper_model.generate(
-                inputs["input_features"],
+                input_features,
+                attention_mask=attention_mask,
                 no_repeat_ngram_size=2,
                 language="tr"
             )
         
-        return self.whisper_processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
+        return self.whisper_processor.batch_decode(predicted_ids, skip_special_tokens=True)
 
-    def transcribe_mp3(self, audio_path):
+    def transcribe_chunk(self, chunk):
         """
-        Transcribes an entire MP3 file by splitting it into chunks and processing each one.
+        Transcribes a given audio chunk in Turkish using the Whisper model.
         """
-        full_transcription = []
-        chunks, timestamps = self.chunk_audio(audio_path)
-        
-        for chunk, start_time in zip(chunks, timestamps):
-            transcription = self.transcribe_chunk(chunk)
-            timestamp_str = f"[{start_time:.2f}s - {start_time + self.audio_chunk_length:.2f}s]"
-            full_transcription.append(f"{timestamp_str} {transcription}")
-        
-        return full_transcription
+        return self.transcribe_batch([chunk])[0]
 
-    def transcribe_folder(self, input_folder, output_json):
+    def format_output(self, segments):
         """
-        Processes all MP3 files in a folder and saves the transcriptions as a JSON file.
+        Stores the segments as a list of "[start - end] text" strings.
         """
-        mp3_files = [os.path.join(input_folder, f) for f in os.listdir(input_folder) if f.lower().endswith(".mp3")]
-        print(f"Found MP3 files: {mp3_files}")
-        results = {}
-
-        for mp3_file in mp3_files:
-            print(f"Processing: {mp3_file} ...")
-            transcription = self.transcribe_mp3(mp3_file)
-            base_name = os.path.basename(mp3_file)
-            title = os.path.splitext(base_name)[0]
-
-            results[base_name] = {
-                "file_title": title,
-                "transcription": transcription
-            }
-        
-        with open(output_json, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=4)
-        
-        print(f"Transcription results saved to {output_json}")
+        return {"transcription": [f"[{start_time:.2f}s - {end_time:.2f}s] {text}" for start_time, end_time, text in segments]}
 
 
 if __name__ == "__main__":
@@ -112,6 +76,5 @@ if __name__ == "__main__":
     mp3_folder = "./audio"
     output_json = "transcriptions.json"
     
-    # Create an instance of WhisperTranscriber and process the MP3 folder
-    transcriber = WhisperTranscriber()
-    transcriber.transcribe_folder(mp3_folder, output_json)
+    # Transcribe the MP3 folder with one worker per GPU; rerunning resumes from the checkpoint
+    transcribe_folder_parallel(WhisperTranscriber, mp3_folder, output_json)
@@ -1,86 +1,68 @@
-import os
-import json
 import torch
-import numpy as np
 from transformers import WhisperForConditionalGeneration, WhisperProcessor
 
-from pydub import AudioSegment
+from transcription import StreamingTranscriber, transcribe_folder_parallel
 
 
-class WhisperTranscriber:
+class WhisperTranscriber(StreamingTranscriber):
     """
     A class to handle audio transcription using OpenAI's Whisper model.
     """
 
-    def __init__(self, model_name: str = "openai/whisper-large-v3", audio_chunk_length: int = 60, target_sample_rate: int = 16000):
+    def __init__(self, model_name: str = "openai/whisper-large-v3", audio_chunk_length: int = 60, target_sample_rate: int = 16000,
+                 batch_size: int = 8, device: str = None, ffmpeg_binary: str = "ffmpeg", vad: bool = True,
+                 vad_threshold_db: float = -40):
         """
         Initializes the Whisper model, its processor, and transcription settings.
         
         :param model_name: Identifier for the Whisper model.
         :param audio_chunk_length: Duration (in seconds) for each audio chunk.
         :param target_sample_rate: Sampling rate to use for processing audio.
+        :param batch_size: Number of chunks decoded per generate call.
+        :param device: Torch device; defaults to the first GPU, or the CPU (float32) when none is available.
+        :param ffmpeg_binary: ffmpeg executable used for streaming decode.
+        :param vad: Segment audio on pauses instead of fixed audio_chunk_length windows.
+        :param vad_threshold_db: Frames quieter than this RMS level (dBFS) count as non-speech.
         """
         print(f"GPU Available: {torch.cuda.is_available()}")
         self.audio_chunk_length = audio_chunk_length
         self.target_sample_rate = target_sample_rate
+        self.batch_size = batch_size
+        self.ffmpeg_binary = ffmpeg_binary
+        # Voice activity detection; the remaining VAD settings are StreamingTranscriber defaults.
+        self.vad = vad
+        self.vad_threshold_db = vad_threshold_db
+        self.device = device or ("cuda:0" if torch.cuda.is_available() else "cpu")
+        self.torch_dtype = torch.float16 if self.device.startswith("cuda") else torch.float32
         
         # Load the Whisper model and its processor
         self.model = WhisperForConditionalGeneration.from_pretrained(
             model_name,
-            torch_dtype=torch.float16,
-            device_map={"": 0}  # Automatically maps model to GPU if available
-        )
+            torch_dtype=self.torch_dtype
+        ).to(self.device)
         self.processor = WhisperProcessor.from_pretrained(model_name)
 
-    def load_mp3(self, audio_path: str) -> torch.Tensor:
-        """
-        Loads an MP3 file, converts it to mono, resamples it to the target sample rate,
-        and normalizes the audio samples.
-        
-        :param audio_path: Path to the MP3 file.
-        :return: A Torch tensor containing normalized audio samples.
-        """
-        audio = AudioSegment.from_mp3(audio_path)
-        audio = audio.set_channels(1)  # Convert to mono
-        audio = audio.set_frame_rate(self.target_sample_rate)  # Resample audio
-        samples = np.array(audio.get_array_of_samples()).astype(np.float32)
-        max_val = float(2 ** (8 * audio.sample_width - 1))
-        samples = samples / max_val  # Normalize the samples
-        return torch.tensor(samples)
-
-    def chunk_audio(self, audio: torch.Tensor) -> list:
+    def transcribe_batch(self, chunks: list) -> list:
         """
-        Splits the full audio tensor into smaller chunks.
+        Transcribes a batch of audio chunks with a single generate call.
+        Chunks are padded to the same length and masked with an attention mask.
         
-        :param audio: The full audio tensor.
-        :return: A list of audio chunks (Torch tensors).
-        """
-        num_samples_per_chunk = self.audio_chunk_length * self.target_sample_rate
-        chunks = []
-        for i in range(0, len(audio), num_samples_per_chunk):
-            chunks.append(audio[i:i + num_samples_per_chunk])
-        return chunks
-
-    def transcribe_chunk(self, chunk: torch.Tensor) -> str:
-        """
-        Transcribes a single audio chunk using the Whisper model.
-        
-        :param chunk: A chunk of audio as a Torch tensor.
-        :return: The transcription text.
+        :param chunks: Audio chunks as Torch tensors.
+        :return: The transcription texts, in the same order as the chunks.
         """
         inputs = self.processor(
-            chunk,
+            [chunk.numpy() for chunk in chunks],
             return_tensors="pt",
             sampling_rate=self.target_sample_rate,
             return_attention_mask=True  # Request attention mask for improved performance
         )
         # Move input features and attention mask to the model's device
-        inputs["input_features"] = inputs["input_features"].to(self.model.device, torch.float16)
+        input_features = inputs["input_features"].to(self.model.device, self.torch_dtype)
         attention_mask = inputs["attention_mask"].to(self.model.device)
         
         with torch.no_grad():
             predicted_ids = self.model.generate(
-                inputs["input_features"],
+                input_features,
                 attention_mask=attention_mask,
                 no_repeat_ngram_size=2,
                 num_beams=5,           # Using beam search for higher-quality results
@@ -88,49 +70,32 @@ class WhisperTranscriber:
                 language="tr"          # Set language to Turkish
             )
         # Decode the generated token IDs into text
-        transcription = self.processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
-        return transcription
+        return self.processor.batch_decode(predicted_ids, skip_special_tokens=True)
 
-    def transcribe_mp3(self, audio_path: str) -> str:
+    def transcribe_chunk(self, chunk: torch.Tensor) -> str:
         """
-        Transcribes an entire MP3 file by splitting it into chunks and concatenating
-        the individual transcriptions.
+        Transcribes a single audio chunk using the Whisper model.
         
-        :param audio_path: The path to the MP3 file.
-        :return: The full transcription text.
+        :param chunk: A chunk of audio as a Torch tensor.
+        :return: The transcription text.
         """
-        full_audio = self.load_mp3(audio_path)
-        chunks = self.chunk_audio(full_audio)
-        full_transcription = ""
-        for chunk in chunks:
-            transcription = self.transcribe_chunk(chunk)
-            full_transcription += " " + transcription
-        return full_transcription.strip()
+        return self.transcribe_batch([chunk])[0]
 
-    def transcribe_folder(self, input_folder: str, output_json: str):
+    def format_output(self, segments: list) -> dict:
         """
-        Processes all MP3 files in a folder and saves the transcriptions as a JSON file.
+        Concatenates the segment texts into a single transcription and keeps the VAD window
+        times of each segment next to it.
         
-        :param input_folder: Directory containing MP3 files.
-        :param output_json: Path to the JSON file where transcriptions will be saved.
+        :param segments: (start_time, end_time, text) tuples in their original order.
+        :return: {"transcription": full text, "segments": [{"start", "end", "text"}]}.
         """
-        mp3_files = [os.path.join(input_folder, f) for f in os.listdir(input_folder) if f.lower().endswith(".mp3")]
-        print(f"Found MP3 files: {mp3_files}")
-        results = {}
-
-        for mp3_file in mp3_files:
-            print(f"Processing: {mp3_file} ...")
-            transcription = self.transcribe_mp3(mp3_file)
-            base_name = os.path.basename(mp3_file)
-            title = os.path.splitext(base_name)[0]
-            results[base_name] = {
-                "file_title": title,
-                "transcription": transcription
-            }
-
-        with open(output_json, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=4)
-        print(f"Transcription results saved to {output_json}")
+        return {
+            "transcription": " ".join(text.strip() for _, _, text in segments).strip(),
+            "segments": [
+                {"start": round(start_time, 2), "end": round(end_time, 2), "text": text.strip()}
+                for start_time, end_time, text in segments
+            ]
+        }
 
 
 if __name__ == "__main__":
@@ -138,6 +103,5 @@ if __name__ == "__main__":
     mp3_folder = "./audio"
     output_json = "transcriptions-no-cut.json"
     
-    # Create an instance of WhisperTranscriber and process the MP3 folder
-    transcriber = WhisperTranscriber()
-    transcriber.transcribe_folder(mp3_folder, output_json)
+    # Transcribe the MP3 folder with one worker per GPU; rerunning resumes from the checkpoint
+    transcribe_folder_parallel(WhisperTranscriber, mp3_folder, output_json)
@@ -0,0 +1,448 @@
+"""
+Shared building blocks of the Whisper transcription scripts (audio_to_text.py and
+audio_to_text_no_cut.py): streaming ffmpeg decode, energy-based voice activity detection,
+batching, the JSONL checkpoint and the one-worker-per-GPU folder transcription.
+"""
+import os
+import json
+import queue
+import hashlib
+import subprocess
+import tempfile
+import multiprocessing
+import torch
+import numpy as np
+
+
+class StreamingTranscriber:
+    """
+    Base class for the Whisper transcribers. Subclasses load the model and implement
+    transcribe_batch(chunks) and format_output(segments).
+    """
+
+    target_sample_rate = 16000
+    audio_chunk_length = 60
+    batch_size = 8
+    ffmpeg_binary = "ffmpeg"
+    # Voice activity detection: cut on pauses, drop non-speech, pack speech into <= 30 s windows.
+    vad = True
+    vad_threshold_db = -40
+    vad_frame_ms = 30
+    min_silence_seconds = 0.5
+    min_speech_seconds = 0.25
+    max_pause_seconds = 2.0
+    max_window_seconds = 30
+
+    def stream_mp3(self, audio_path: str, frame_seconds: float = None):
+        """
+        Decodes an MP3 through an ffmpeg pipe and yields fixed-size mono float32 frames
+        at the target sample rate (the last frame may be shorter). Only one frame is held
+        in memory at a time, so peak memory depends on the frame size, not the file length.
+
+        :param audio_path: Path to the MP3 file.
+        :param frame_seconds: Frame duration in seconds (defaults to audio_chunk_length).
+        :return: A generator of Torch tensors.
+        """
+        target_sample_rate = self.target_sample_rate
+        frame_samples = int((frame_seconds or self.audio_chunk_length) * target_sample_rate)
+        frame_bytes = frame_samples * 4  # float32
+        command = [
+            self.ffmpeg_binary, "-nostdin", "-v", "error", "-i", audio_path,
+            "-f", "f32le", "-acodec", "pcm_f32le", "-ac", "1", "-ar", str(target_sample_rate), "-"
+        ]
+        # stderr goes to a temporary file: a damaged file can make ffmpeg log far more than a pipe
+        # buffer holds, which would block ffmpeg (and this reader) if stderr were an unread pipe.
+        stderr_file = tempfile.TemporaryFile()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            while True:
+                buffer = bytearray()
+                while len(buffer) < frame_bytes:
+                    data = process.stdout.read(frame_bytes - len(buffer))
+                    if not data:
+                        break
+                    buffer += data
+                if buffer:
+                    yield torch.from_numpy(np.frombuffer(buffer, dtype=np.float32))
+                if len(buffer) < frame_bytes:
+                    break
+            if process.wait() != 0:
+                stderr_file.seek(0)
+                # Only the tail is reported; per-frame errors can run to megabytes.
+                stderr = stderr_file.read().decode("utf-8", errors="replace").strip()[-2000:]
+                raise RuntimeError(f"ffmpeg failed to decode {audio_path}: {stderr}")
+        finally:
+            # Also reached when the consumer stops early; make sure ffmpeg does not linger.
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            stderr_file.close()
+
+    def vad_chunks(self, audio_path: str):
+        """
+        Segments an MP3 with an energy-based voice activity detector. Speech regions are cut on
+        pauses of at least min_silence_seconds, silence and music below vad_threshold_db are dropped,
+        and regions are packed into windows of up to max_window_seconds (Whisper's 30 s input).
+
+        :param audio_path: Path to the MP3 file.
+        :return: A generator of (start_time, end_time, chunk) with times in seconds of the source audio.
+        """
+        sr = self.target_sample_rate
+        frame = int(self.vad_frame_ms * sr / 1000)
+        threshold = 10 ** (self.vad_threshold_db / 20)  # RMS amplitude of full-scale float audio
+        max_samples = int(self.max_window_seconds * sr)
+        min_silence = int(self.min_silence_seconds * sr)
+        min_speech = int(self.min_speech_seconds * sr)
+        max_pause = int(self.max_pause_seconds * sr)
+
+        buffer, buffer_start = np.zeros(0, dtype=np.float32), 0  # buffer[0] is absolute sample buffer_start
+        position = 0  # absolute sample up to which energy has been analysed
+        region_start = last_voiced = None  # current speech region
+        window_start = window_end = None  # current packed window
+        ready = []
+
+        def close_region(start, end):
+            nonlocal window_start, window_end
+            if end - start < min_speech:
+                return  # clicks and short noise bursts
+            if window_start is not None and end - window_start <= max_samples and start - window_end <= max_pause:
+                window_end = end
+                return
+            if window_start is not None:
+                ready.append((window_start, window_end))
+            window_start, window_end = start, end
+
+        def analyse(frames):
+            nonlocal region_start, last_voiced
+            for offset, chunk in frames:
+                if np.sqrt(np.mean(np.square(chunk))) >= threshold:
+                    if region_start is None:
+                        region_start = offset
+                    last_voiced = offset + len(chunk)
+                elif region_start is not None and offset + len(chunk) - last_voiced >= min_silence:
+                    close_region(region_start, last_voiced)
+                    region_start = None
+                # Long uninterrupted speech is split so no window exceeds max_window_seconds.
+                if region_start is not None and last_voiced - region_start >= max_samples:
+                    close_region(region_start, last_voiced)
+                    region_start = None
+
+        def drain():
+            nonlocal buffer, buffer_start
+            for start, end in ready:
+                chunk = buffer[start - buffer_start:end - buffer_start]
+                yield start / sr, end / sr, torch.from_numpy(np.ascontiguousarray(chunk))
+            ready.clear()
+            # Drop audio that can no longer belong to a window.
+            keep_from = min(s for s in (window_start, region_start, position) if s is not None)
+            buffer = buffer[keep_from - buffer_start:]
+            buffer_start = keep_from
+
+        for samples in self.stream_mp3(audio_path, frame_seconds=self.max_window_seconds):
+            buffer = np.concatenate([buffer, samples.numpy()])
+            available = buffer_start + len(buffer) - position
+            count = available // frame
+            analyse(
+                (position + i * frame, buffer[position - buffer_start + i * frame:position - buffer_start + (i + 1) * frame])
+                for i in range(count)
+            )
+            position += count * frame
+            yield from drain()
+
+        # Flush the tail: the last partial frame, the open region and the open window.
+        end = buffer_start + len(buffer)
+        if end > position:
+            analyse([(position, buffer[position - buffer_start:])])
+            position = end
+        if region_start is not None:
+            close_region(region_start, last_voiced)
+            region_start = None
+        if window_start is not None:
+            ready.append((window_start, window_end))
+            window_start = None
+        yield from drain()
+
+    def timed_chunks(self, audio_path: str):
+        """
+        Yields the chunks of one file with their times: VAD windows, or fixed audio_chunk_length
+        frames when vad is off.
+
+        :param audio_path: Path to the MP3 file.
+        :return: A generator of (start_time, end_time, chunk) with times in seconds of the source audio.
+        """
+        if self.vad:
+            yield from self.vad_chunks(audio_path)
+        else:
+            for i, chunk in enumerate(self.stream_mp3(audio_path)):
+                start_time = i * self.audio_chunk_length
+                yield start_time, start_time + len(chunk) / self.target_sample_rate, chunk
+
+    def iter_batches(self, items):
+        """
+        Groups an iterable into lists of at most batch_size items.
+
+        :param items: Any iterable.
+        :return: A generator of lists.
+        """
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def transcribe_files(self, audio_paths: list, on_file_done=None) -> dict:
+        """
+        Transcribes several MP3 files, packing chunks from one or more files into batches.
+        Audio is streamed from ffmpeg, so only one batch of chunks is held in memory.
+        Each file's (start_time, end_time, text) segments are turned into its output fields
+        by format_output.
+
+        :param audio_paths: Paths to the MP3 files.
+        :param on_file_done: Optional callback(audio_path, output) called as soon as each file is complete.
+        :return: {audio_path: output fields}.
+        """
+        exhausted = []
+
+        def file_chunks():
+            for audio_path in audio_paths:
+                print(f"Processing: {audio_path} ...")
+                for start_time, end_time, chunk in self.timed_chunks(audio_path):
+                    yield audio_path, start_time, end_time, chunk
+                exhausted.append(audio_path)
+
+        segments = {audio_path: [] for audio_path in audio_paths}
+        reported = 0
+        for batch in self.iter_batches(file_chunks()):
+            transcriptions = self.transcribe_batch([chunk for _, _, _, chunk in batch])
+            for (audio_path, start_time, end_time, _), transcription in zip(batch, transcriptions):
+                segments[audio_path].append((start_time, end_time, transcription))
+            # A file is exhausted once the next file's first chunk was pulled into this batch,
+            # so all of its chunks have been decoded by now.
+            if on_file_done is not None:
+                for audio_path in exhausted[reported:]:
+                    on_file_done(audio_path, self.format_output(segments[audio_path]))
+                reported = len(exhausted)
+        if on_file_done is not None:
+            for audio_path in exhausted[reported:]:
+                on_file_done(audio_path, self.format_output(segments[audio_path]))
+        return {audio_path: self.format_output(parts) for audio_path, parts in segments.items()}
+
+    def format_output(self, segments: list) -> dict:
+        """
+        Turns one file's segments into the fields stored for it in the checkpoint and the output JSON.
+
+        :param segments: (start_time, end_time, text) tuples in their original order.
+        :return: Output fields, at least {"transcription": ...}.
+        """
+        raise NotImplementedError
+
+    def transcribe_mp3(self, audio_path: str):
+        """
+        Transcribes an entire MP3 file by splitting it into chunks and processing them in batches.
+
+        :param audio_path: The path to the MP3 file.
+        :return: The output fields of the file, as returned by transcribe_files.
+        """
+        return self.transcribe_files([audio_path])[audio_path]
+
+    def transcribe_folder(self, input_folder: str, output_json: str, checkpoint_path: str = None):
+        """
+        Processes all MP3 files in a folder in this process and saves the transcriptions as a JSON file.
+        Finished files are appended to a JSONL checkpoint as they complete, so a rerun after
+        a crash skips files whose audio hash is already transcribed.
+
+        :param input_folder: Directory containing MP3 files.
+        :param output_json: Path to the JSON file where transcriptions will be saved.
+        :param checkpoint_path: Path to the JSONL checkpoint (defaults to next to output_json).
+        """
+        checkpoint_path = checkpoint_path or default_checkpoint_path(output_json)
+        mp3_files = list_mp3_files(input_folder)
+        print(f"Found MP3 files: {mp3_files}")
+        hashes = {mp3_file: file_sha256(mp3_file) for mp3_file in mp3_files}
+        done = read_checkpoint(checkpoint_path)
+        pending = [mp3_file for mp3_file in mp3_files if hashes[mp3_file] not in done]
+
+        with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+            def on_file_done(mp3_file, output):
+                done[hashes[mp3_file]] = append_checkpoint(checkpoint, mp3_file, hashes[mp3_file], output)
+
+            self.transcribe_files(pending, on_file_done=on_file_done)
+
+        write_results(mp3_files, hashes, done, output_json)
+
+
+def list_mp3_files(input_folder: str) -> list:
+    return [os.path.join(input_folder, f) for f in os.listdir(input_folder) if f.lower().endswith(".mp3")]
+
+
+def file_sha256(path: str) -> str:
+    """
+    Returns the SHA-256 digest of a file, read in blocks.
+
+    :param path: Path to the file.
+    :return: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_checkpoint(checkpoint_path: str) -> dict:
+    """
+    Reads a JSONL checkpoint. A truncated last line (e.g. after a crash mid-write) is ignored.
+
+    :param checkpoint_path: Path to the JSONL checkpoint.
+    :return: {audio_sha256: record}.
+    """
+    done = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[record["audio_sha256"]] = record
+    return done
+
+
+def append_checkpoint(checkpoint, audio_path: str, audio_hash: str, output: dict) -> dict:
+    """
+    Appends a finished file to an open JSONL checkpoint and flushes it to disk.
+
+    :param checkpoint: Checkpoint file opened for appending.
+    :param audio_path: Path to the transcribed MP3 file.
+    :param audio_hash: SHA-256 digest of the MP3 file.
+    :param output: Output fields of the file, e.g. {"transcription": ..., "segments": ...}.
+    :return: The written record.
+    """
+    base_name = os.path.basename(audio_path)
+    record = {
+        "audio_sha256": audio_hash,
+        "file_name": base_name,
+        "file_title": os.path.splitext(base_name)[0],
+        **output
+    }
+    checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+    checkpoint.flush()
+    os.fsync(checkpoint.fileno())
+    return record
+
+
+def write_results(mp3_files: list, hashes: dict, done: dict, output_json: str):
+    """
+    Writes the transcriptions of the given files, taken from the checkpoint records, as a JSON file.
+
+    :param mp3_files: Paths to the MP3 files to include.
+    :param hashes: {mp3_file: audio_sha256}.
+    :param done: Checkpoint records keyed by audio hash.
+    :param output_json: Path to the JSON file where transcriptions will be saved.
+    """
+    results = {}
+    for mp3_file in mp3_files:
+        record = done.get(hashes[mp3_file])
+        if record is None:
+            continue
+        base_name = os.path.basename(mp3_file)
+        results[base_name] = {"file_title": os.path.splitext(base_name)[0]}
+        results[base_name].update(
+            (key, value) for key, value in record.items() if key not in ("audio_sha256", "file_name", "file_title")
+        )
+
+    with open(output_json, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=4)
+
+    print(f"Transcription results saved to {output_json}")
+
+
+def default_checkpoint_path(output_json: str) -> str:
+    return os.path.splitext(output_json)[0] + ".checkpoint.jsonl"
+
+
+def transcription_worker(transcriber_class, device: str, transcriber_kwargs: dict, tasks, results):
+    """
+    Worker process: loads one Whisper model on its device and transcribes files from the task queue.
+
+    :param transcriber_class: StreamingTranscriber subclass to instantiate.
+    :param device: Torch device for this worker.
+    :param transcriber_kwargs: Extra transcriber arguments.
+    :param tasks: Queue of (mp3_file, audio_hash) tasks, terminated by None.
+    :param results: Queue receiving (mp3_file, audio_hash, output fields, error).
+    """
+    transcriber = transcriber_class(device=device, **transcriber_kwargs)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        mp3_file, audio_hash = task
+        try:
+            results.put((mp3_file, audio_hash, transcriber.transcribe_mp3(mp3_file), None))
+        except Exception as e:
+            results.put((mp3_file, audio_hash, None, repr(e)))
+
+
+def transcribe_folder_parallel(transcriber_class, input_folder: str, output_json: str, devices: list = None,
+                               checkpoint_path: str = None, **transcriber_kwargs):
+    """
+    Transcribes all MP3 files in a folder with a pool of worker processes, one per entry in devices.
+    Files are scheduled largest first. Each finished file is appended to a JSONL checkpoint, and on
+    restart files whose audio hash is already in the checkpoint are skipped.
+
+    :param transcriber_class: StreamingTranscriber subclass each worker instantiates.
+    :param input_folder: Directory containing MP3 files.
+    :param output_json: Path to the JSON file where transcriptions will be saved.
+    :param devices: Torch devices, one worker each (defaults to every visible GPU, or a single CPU worker).
+    :param checkpoint_path: Path to the JSONL checkpoint (defaults to next to output_json).
+    :param transcriber_kwargs: Extra transcriber arguments, e.g. model_name or batch_size.
+    """
+    devices = devices or ([f"cuda:{i}" for i in range(torch.cuda.device_count())] or ["cpu"])
+    checkpoint_path = checkpoint_path or default_checkpoint_path(output_json)
+    mp3_files = list_mp3_files(input_folder)
+    mp3_files.sort(key=os.path.getsize, reverse=True)
+    hashes = {mp3_file: file_sha256(mp3_file) for mp3_file in mp3_files}
+    done = read_checkpoint(checkpoint_path)
+    pending = [(mp3_file, hashes[mp3_file]) for mp3_file in mp3_files if hashes[mp3_file] not in done]
+    print(f"Found {len(mp3_files)} MP3 files, {len(pending)} left to transcribe on {devices}")
+
+    if pending:
+        # CUDA cannot be re-initialized in forked processes.
+        context = multiprocessing.get_context("spawn")
+        tasks, results = context.Queue(), context.Queue()
+        for task in pending:
+            tasks.put(task)
+        workers = [
+            context.Process(target=transcription_worker,
+                            args=(transcriber_class, device, transcriber_kwargs, tasks, results))
+            for device in devices[:len(pending)]
+        ]
+        for worker in workers:
+            tasks.put(None)
+            worker.start()
+
+        remaining = len(pending)
+        with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+            while remaining:
+                try:
+                    mp3_file, audio_hash, output, error = results.get(timeout=5)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        print(f"All workers exited with {remaining} files left; rerun to resume.")
+                        break
+                    continue
+                remaining -= 1
+                if error is not None:
+                    print(f"Failed: {mp3_file} ({error})")
+                    continue
+                done[audio_hash] = append_checkpoint(checkpoint, mp3_file, audio_hash, output)
+                print(f"Done: {mp3_file} ({len(pending) - remaining}/{len(pending)})")
+
+        for worker in workers:
+            worker.join()
+
+    write_results(sorted(mp3_files), hashes, done, output_json)
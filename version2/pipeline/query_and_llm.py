@@ -1,134 +1,63 @@
 import json
 import os
-import time
-import subprocess
-from datetime import datetime
-from txtai import Embeddings
-from tqdm import tqdm
+import requests
+from requests.adapters import HTTPAdapter
 
 #########################
-# txtai Indexing Module #
+# Model Service Client  #
 #########################
 
-class EmbeddingIndexer:
-    def __init__(self, model_name="BAAI/bge-m3", cuda_device="1"):
-        """
-        Initialize the embedding indexer with the given model and CUDA settings.
-        """
-        os.environ["CUDA_VISIBLE_DEVICES"] = cuda_device
-        self.model_name = model_name
-        # Create a txtai Embeddings instance with desired settings.
-        self.embeddings = Embeddings(path=model_name, hybrid=True, content=True, method="clspooling")
-        self.data = {}
-        self.documents = []
-
-    def load_data(self, json_file):
-        """
-        Load data from a JSON file.
-        :param json_file: Path to the JSON file.
-        """
-        with open(json_file, "r", encoding="utf-8") as f:
-            self.data = json.load(f)
-        return self.data
+# Retrieval, the LLM and the answer cache run in the model service (version2/server.py),
+# which loads bge-m3, the txtai index and the Ollama client once for all clients.
+COACH_API_URL = os.environ.get("COACH_API_URL", "http://localhost:8000")
+
 
-    def prepare_documents(self):
+class CoachClient:
+    """
+    HTTP client for the model service with a keep-alive connection pool.
+    """
+
+    def __init__(self, base_url=COACH_API_URL, timeout=(5, 300), pool_size=4):
         """
-        Prepare documents by combining file title and transcription.
-        Each document is a tuple: (id, combined_text, metadata)
-        The metadata is JSON serialized to ensure SQLite can bind it properly.
+        :param base_url: Base URL of the model service.
+        :param timeout: (connect, read) timeout; the read timeout bounds the wait between tokens.
+        :param pool_size: Maximum number of pooled connections.
         """
-        self.documents = []
-        for key, value in self.data.items():
-            file_title = value.get("file_title", "")
-            transcription = value.get("transcription", "")
-            combined_text = f"Dosya Başlığı: {file_title}\nTranskript: {transcription}"
-            metadata = json.dumps({"file_title": file_title, "transcription": transcription})
-            self.documents.append((key, combined_text, metadata))
-        return self.documents
-
-    def index_documents(self):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, path, payload, **kwargs):
+        response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def search(self, query, limit=3, weights=None):
         """
-        Index all prepared documents using txtai.
+        Run a hybrid search.
+        :return: The service response with "results" (id, score, record) and "index_version".
         """
-        if not self.documents:
-            raise ValueError("No documents prepared for indexing. Run prepare_documents() first.")
-        print("Indexing documents...")
-        start_time = time.time()
-        self.embeddings.index(tqdm(self.documents, total=len(self.documents)))
-        elapsed_time = time.time() - start_time
-        print(f"Indexing took {elapsed_time:.2f} seconds")
-        return elapsed_time
-
-    def save_index(self, directory="indexes"):
+        return self.post("/search", {"query": query, "limit": limit, "weights": weights}).json()
+
+    def answer_stream(self, query, ids, cancel_event=None):
         """
-        Save the index to the specified directory.
-        :param directory: Directory where the index file will be saved.
+        Stream the answer for the given document ids as NDJSON chunks.
+        Closing the generator (or setting cancel_event) closes the connection and stops generation.
+        :return: A generator of {"response": token} chunks followed by a {"done": true, ...} chunk.
         """
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-        current_date = datetime.now().strftime("%d-%m-%Y")
-        file_name = f"index_{self.model_name.split('/')[-1]}_{current_date}"
-        file_path = os.path.join(directory, file_name)
-        self.embeddings.save(file_path)
-        print("Index saved to", file_path)
-        return file_path
-
-#############################
-# LLM Generation Components #
-#############################
-
-def generate_response(context, query_text):
-    """
-    Generate a response using the llama3-70b model via Ollama with a Turkish system prompt.
-    The prompt instructs the model to use the provided context to produce a comprehensive, accurate, and clear answer.
-    """
-    prompt = f"""Sistem Talimatları:
-Alanında uzman, detaylara önem veren ve doğruluğa bağlı kalan bir dil modelisin. Aşağıda verilen bağlamı kullanarak, '{query_text}' sorusuna kapsamlı, doğru ve net bir yanıt oluştur. Lütfen verilen bağlamdaki bilgileri dikkatle değerlendir ve gereksiz tahminlerden kaçın. Eğer sağlanan metinlerde gerekli bilgi yoksa, "Bilmiyorum" de.
-
---- BAĞLAM ---
-{context}
+        with self.post("/answer", {"query": query, "ids": ids}, stream=True) as response:
+            for line in response.iter_lines():
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                if line:
+                    yield json.loads(line)
 
---- SORU ---
-{query_text}
-
---- YANIT ---"""
-    try:
-        # Pass the prompt as a positional argument instead of using the --prompt flag.
-        result = subprocess.run(
-            ["ollama", "run", "llama3:70b", prompt],
-            capture_output=True, text=True, check=True
-        )
-        response = result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print("Ollama error:", e.stderr)
-        response = "An error occurred while generating a response with Ollama."
-    return response
-
-###############################
-# Main Query and Integration  #
-###############################
 
 def main():
-    # Set the index directory path
-    index_dir = "/data/Workspace/balkan/leadership_coach/indexes"
-    indexer = EmbeddingIndexer(model_name="BAAI/bge-m3", cuda_device="1")
-    current_date = datetime.now().strftime("%d-%m-%Y")
-    index_file_name = f"index_{indexer.model_name.split('/')[-1]}_{current_date}"
-    index_file_path = os.path.join(index_dir, index_file_name)
-
-    # If the index file exists, load it; otherwise, index the documents and save the index.
-    if os.path.exists(index_file_path):
-        print("Loading existing index from", index_file_path)
-        indexer.embeddings.load(index_file_path)
-        # Even if the index is loaded, we need the documents for mapping context.
-        indexer.load_data("transcriptions-no-cut.json")
-        indexer.prepare_documents()
-    else:
-        print("Index file not found. Indexing documents...")
-        indexer.load_data("transcriptions-no-cut.json")
-        indexer.prepare_documents()
-        indexer.index_documents()
-        indexer.save_index(directory=index_dir)
+    client = CoachClient()
 
     # Ask the user for a query.
     query_text = input("Enter your search query: ").strip()
@@ -144,39 +73,53 @@ def main():
         weight = None
 
     # Retrieve the top results.
-    results = indexer.embeddings.search(query_text, limit=limit, weights=weight)
+    try:
+        results = client.search(query_text, limit=limit, weights=weight)["results"]
+    except requests.RequestException as e:
+        print(f"Could not reach the model service at {client.base_url}: {e}")
+        return
     if not results:
         print("No relevant documents found.")
         return
 
-    # Build context by mapping document IDs to their data.
-    doc_dict = {doc[0]: doc for doc in indexer.documents}
-    context_pieces = []
+    # Print the retrieved documents; the service builds the LLM context from the same ids.
     print("\n### Retrieved Documents ###\n")
     for res in results:
-        # If result is a dictionary, use the 'id' key; otherwise, assume tuple structure.
-        if isinstance(res, dict):
-            doc_id = res.get("id")
-        else:
-            doc_id = res[0]
-        if doc_id in doc_dict:
-            metadata = json.loads(doc_dict[doc_id][2])
-            file_title = metadata.get("file_title", "N/A")
-            transcription = metadata.get("transcription", "N/A")
+        record = res["record"]
+        if record is not None:
             # Print each retrieved document (in Turkish)
-            print(f"Başlık: {file_title}")
-            print(f"Transkript: {transcription}")
+            print(f"Başlık: {record['file_title'] or 'N/A'}")
+            if record["unit"] == "s":
+                print(f"Passage: [{record['start']:.2f}s - {record['end']:.2f}s]")
+            elif record["unit"] == "char":
+                print(f"Passage: characters {record['start']}-{record['end']}")
+            print(f"Transkript: {record['transcription']}")
             print("-" * 50)
-            context_pieces.append(f"Başlık: {file_title}\nTranskript: {transcription}")
         else:
             print("Document information not found.")
-            context_pieces.append("Document information not found.")
-    context = "\n\n".join(context_pieces)
 
-    # Generate the LLM response using the assembled context.
-    final_response = generate_response(context, query_text)
+    # Stream the LLM response.
     print("\n### LLM Response ###\n")
-    print(final_response)
+    context_stats = None
+    try:
+        for chunk in client.answer_stream(query_text, [res["id"] for res in results]):
+            if "context" in chunk:
+                context_stats = chunk["context"]
+                continue
+            if chunk.get("done"):
+                if chunk.get("error"):
+                    print(f"\nError while generating the response with Ollama: {chunk['error']}")
+                elif chunk.get("cache") == "semantic":
+                    print(f"\n(from the semantic answer cache, similarity {chunk['score']:.3f})")
+                break
+            print(chunk.get("response", ""), end="", flush=True)
+    except requests.RequestException as e:
+        print(f"\nError while streaming the response: {e}")
+    print()
+    if context_stats:
+        print(f"Context: {context_stats['tokens']} / {context_stats['budget']} tokens, "
+              f"{context_stats['sentences']}/{context_stats['total_sentences']} sentences"
+              + (" (compressed)" if context_stats["compressed"] else ""))
 
 if __name__ == '__main__':
     main()
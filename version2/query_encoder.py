@@ -0,0 +1,168 @@
+"""
+bge-m3 sorgu kodlayıcısının CPU için hızlandırılmış sürümü.
+
+İki arka uç desteklenir:
+    onnx       : ONNX Runtime ile çalışan, isteğe bağlı int8 dinamik nicemlenmiş model (export komutuyla oluşturulur)
+    torch-int8 : Linear katmanları torch ile dinamik olarak int8'e nicemlenmiş model (dışa aktarma gerekmez)
+
+Çıktı, txtai'nin clspooling vektörüyle aynı tanımdadır: son katmandaki [CLS] gizli durumu, L2 normalize.
+Yalnızca sorgular bu kodlayıcıdan geçer; doküman indeksi yeniden oluşturulmaz.
+
+Dışa aktarma ve doğruluk kontrolü:
+    python query_encoder.py export --output encoders/bge-m3-onnx-int8
+    python query_encoder.py check --encoder encoders/bge-m3-onnx-int8 --index indexes/index_bge-m3_<hash> --queries sorgular.txt --k 10
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+ONNX_FILE = "model.onnx"
+METADATA_FILE = "encoder.json"
+
+class QueryEncoder:
+    """
+    Sorguları CPU'da int8 / ONNX Runtime ile kodlar ve normalize [CLS] vektörlerini döndürür.
+    """
+
+    def __init__(self, path, backend=None, max_length=512, threads=None):
+        self.path = path
+        # Dizinde model.onnx varsa ONNX Runtime, yoksa (ör. "BAAI/bge-m3") torch int8 kullanılır.
+        self.backend = backend or ("onnx" if os.path.exists(os.path.join(path, ONNX_FILE)) else "torch-int8")
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        if self.backend == "onnx":
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            self.session = onnxruntime.InferenceSession(os.path.join(path, ONNX_FILE), options,
+                                                        providers=["CPUExecutionProvider"])
+            self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        elif self.backend == "torch-int8":
+            if threads:
+                torch.set_num_threads(threads)
+            model = AutoModel.from_pretrained(path).eval()
+            self.model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            raise ValueError(f"Bilinmeyen sorgu kodlayıcı arka ucu: {self.backend}")
+
+    def encode(self, texts):
+        """
+        Metinleri (n, boyut) float32 vektörlere çevirir.
+        """
+        if self.backend == "onnx":
+            inputs = self.tokenizer(list(texts), padding=True, truncation=True, max_length=self.max_length,
+                                    return_tensors="np")
+            feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.input_names}
+            hidden = self.session.run(None, feed)[0]
+        else:
+            inputs = self.tokenizer(list(texts), padding=True, truncation=True, max_length=self.max_length,
+                                    return_tensors="pt")
+            with torch.no_grad():
+                hidden = self.model(**inputs).last_hidden_state.numpy()
+        vectors = hidden[:, 0].astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+def export_onnx(model_name, output, quantize=True, opset=17):
+    """
+    Modeli ONNX'e aktarır, isteğe bağlı olarak ağırlıkları int8'e nicemler ve
+    tokenizer ile birlikte output dizinine kaydeder.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    inputs = tokenizer(["Liderlik nedir?"], return_tensors="pt")
+    model_path = os.path.join(output, ONNX_FILE)
+    # Nicemlemede fp32 model (2 GB üzerinde harici ağırlık dosyalarıyla) geçici bir alt dizine yazılır.
+    fp32_dir = output if not quantize else os.path.join(output, "fp32")
+    os.makedirs(fp32_dir, exist_ok=True)
+    fp32_path = os.path.join(fp32_dir, ONNX_FILE)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ("input_ids", "attention_mask", "last_hidden_state")}
+    with torch.no_grad():
+        torch.onnx.export(model, (inputs["input_ids"], inputs["attention_mask"]), fp32_path,
+                          input_names=["input_ids", "attention_mask"], output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic_axes, opset_version=opset)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8)
+        shutil.rmtree(fp32_dir)
+    tokenizer.save_pretrained(output)
+    with open(os.path.join(output, METADATA_FILE), "w", encoding="utf-8") as f:
+        json.dump({"source": model_name, "pooling": "cls", "quantized": quantize, "opset": opset}, f, indent=4)
+    return model_path
+
+def parity_report(embeddings, encoder, queries, k=10):
+    """
+    Kodlayıcıyı txtai'nin fp32 sorgu vektörleriyle karşılaştırır: kosinüs benzerliği,
+    yoğun (dense) aramada recall@k ve sorgu başına kodlama süresi.
+    """
+    start = time.perf_counter()
+    reference = np.asarray(embeddings.batchtransform(queries), dtype=np.float32)
+    reference_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    start = time.perf_counter()
+    candidate = encoder.encode(queries)
+    candidate_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    cosine = np.sum(reference * candidate, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+    # Aynı ANN indeksinde fp32 ve yeni vektörlerle ilk k sonucun örtüşmesi.
+    expected = embeddings.ann.search(reference, k)
+    actual = embeddings.ann.search(candidate, k)
+    recalls = [
+        len({uid for uid, _ in hits} & {uid for uid, _ in ref_hits}) / max(len(ref_hits), 1)
+        for ref_hits, hits in zip(expected, actual)
+    ]
+    return {
+        "queries": len(queries),
+        "k": k,
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        f"recall@{k}_mean": float(np.mean(recalls)),
+        f"recall@{k}_min": float(np.min(recalls)),
+        "fp32_ms_per_query": reference_ms,
+        "encoder_ms_per_query": candidate_ms,
+        "speedup": reference_ms / candidate_ms if candidate_ms else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="bge-m3 CPU sorgu kodlayıcısı")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Modeli ONNX'e aktarır ve int8'e nicemler.")
+    export.add_argument("--model", default="BAAI/bge-m3")
+    export.add_argument("--output", required=True)
+    export.add_argument("--no-quantize", action="store_true", help="fp32 ONNX modeli olarak bırakır.")
+    export.add_argument("--opset", type=int, default=17)
+
+    check = commands.add_parser("check", help="fp32 vektörlerle parite ve recall@k kaybını raporlar.")
+    check.add_argument("--encoder", required=True, help="Dışa aktarılmış dizin ya da torch-int8 için model adı.")
+    check.add_argument("--backend", choices=["onnx", "torch-int8"])
+    check.add_argument("--index", required=True, help="Kaydedilmiş txtai indeks dizini.")
+    check.add_argument("--queries", required=True, help="Her satırda bir sorgu içeren dosya.")
+    check.add_argument("--k", type=int, default=10)
+    check.add_argument("--threads", type=int)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print("ONNX modeli kaydedildi:", export_onnx(args.model, args.output, not args.no_quantize, args.opset))
+        return
+
+    from txtai import Embeddings
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    embeddings = Embeddings()
+    embeddings.load(args.index)
+    encoder = QueryEncoder(args.encoder, backend=args.backend, threads=args.threads)
+    print(json.dumps(parity_report(embeddings, encoder, queries, args.k), indent=4))
+
+if __name__ == "__main__":
+    main()
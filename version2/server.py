@@ -0,0 +1,1778 @@
+"""
+Leadership Coach model servisi.
+
+bge-m3 / txtai indeksi, Ollama istemcisi, yanıt önbelleği ve VITS TTS modeli bu süreçte
+yalnızca bir kez yüklenir. Streamlit arayüzü (app.py) ve CLI istemcileri (pipeline/query_and_llm.py)
+modelleri yüklemez, bu servise HTTP üzerinden bağlanır; böylece arayüz kopyaları model belleğini çoğaltmaz.
+
+Uç noktalar:
+    POST /search  {"query", "limit", "weights", "web"} -> {"results", "index_version", "cache_stats", "web"}
+    POST /answer  {"query", "ids", "web"}         -> NDJSON akışı: {"response": token} ... {"done": true, ...}
+    POST /tts     {"text"}                        -> audio/wav (sentezlenecek metin yoksa 204)
+    POST /web     {"query", "max_results"}        -> {"results", "error"}
+    GET  /health                                  -> {"status", "ready", "index_version", "startup", ...}
+    GET  /ready                                   -> tüm modeller yüklenene kadar 503
+
+Çalıştırma:
+    python server.py --host 0.0.0.0 --port 8000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import time
+import io
+import hashlib
+import re
+import threading
+import traceback
+from types import MappingProxyType
+from collections.abc import Sequence
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+from tqdm import tqdm
+from cachetools import LRUCache, TTLCache
+
+# torch, transformers, txtai, scipy ve duckduckgo_search ağır modüllerdir; ilk kullanıldıkları
+# yerde içe aktarılırlar, böylece servis modeller yüklenmeden dinlemeye başlar.
+PROCESS_START = time.perf_counter()
+STARTUP_TIMINGS = {}
+
+def log_phase(name, seconds):
+    """
+    Başlangıç fazının süresini kaydeder ve loglar.
+    """
+    STARTUP_TIMINGS[name] = round(seconds, 3)
+    print(f"[başlangıç] {name}: {seconds:.2f} s", flush=True)
+
+class LazyResource:
+    """
+    İlk kullanımda ya da warm_up() ile arka planda bir kez yüklenen kaynak. Yükleme sürerken
+    get() çağıranlar bekler; yükleme hata verirse bir sonraki get() yeniden dener.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.value = None
+        self.loaded = False
+        # Son yükleme denemesinin hatası; /health üzerinden raporlanır.
+        self.error = None
+
+    def get(self):
+        if self.loaded:
+            return self.value
+        with self.lock:
+            if not self.loaded:
+                start = time.perf_counter()
+                try:
+                    self.value = self.loader()
+                except Exception as e:
+                    self.error = f"{type(e).__name__}: {e}"
+                    raise
+                self.loaded = True
+                self.error = None
+                log_phase(self.name, time.perf_counter() - start)
+        return self.value
+
+    def warm_up(self):
+        threading.Thread(target=self.get, name=f"warm-up-{self.name}", daemon=True).start()
+
+##############################################
+# txtai Indexing                             #
+##############################################
+
+# Kaydedilen her indeksin yanında, sonuçlarını çözmek için kullanılan kayıt tablosu.
+RECORDS_FILE = "records.json"
+# Sıkıştırılmış vektör formatlarının Faiss karşılıkları (m: PQ alt nicemleyici sayısı).
+VECTOR_STORAGE = {"fp16": "SQfp16", "int8": "SQ8", "pq": "PQ{m}"}
+# 8 bitlik PQ her alt nicemleyici için 2**8 merkez öğrenir; daha az vektörle eğitilemez.
+PQ_NBITS = 8
+
+# Doküman metni için şablon; manifest hash'ine dahil edilir.
+TEXT_TEMPLATE = "Dosya Başlığı: {file_title}\nTranskript: {transcription}"
+
+# Whisper çıktısındaki "[0.00s - 60.00s] metin" segmentleri ve cümle sınırları.
+SEGMENT_PATTERN = re.compile(r"^\[(\d+(?:\.\d+)?)s - (\d+(?:\.\d+)?)s\]\s*(.*)$", re.S)
+SENTENCE_PATTERN = re.compile(r"\S.*?(?:[.!?…]+(?=\s|$)|$)", re.S)
+
+def split_passages(transcription, max_tokens=256, overlap_tokens=32, count_tokens=None):
+    """
+    Transkripti, token bütçesine uyan ve birbiriyle örtüşen pasajlara böler.
+    Liste halindeki transkriptlerde (audio_to_text.py çıktısı) segment zamanları,
+    düz metinde ise karakter konumları kaynak ofseti olarak döndürülür.
+    Her pasaj: {"text", "start", "end", "unit"} ("unit": "s" veya "char").
+    """
+    count_tokens = count_tokens or (lambda text: len(text.split()))
+    units = []
+    if isinstance(transcription, list):
+        unit_name, last_end = "s", 0.0
+        for segment in transcription:
+            match = SEGMENT_PATTERN.match(segment.strip())
+            if match:
+                start, end, text = float(match.group(1)), float(match.group(2)), match.group(3)
+            else:
+                start, end, text = last_end, last_end, segment
+            last_end = end
+            for sentence in SENTENCE_PATTERN.finditer(text):
+                units.append((sentence.group().strip(), start, end))
+    else:
+        unit_name = "char"
+        for sentence in SENTENCE_PATTERN.finditer(transcription):
+            text = sentence.group()
+            offset = len(text) - len(text.lstrip())
+            units.append((text.strip(), sentence.start() + offset, sentence.start() + offset + len(text.strip())))
+
+    # Bütçeyi tek başına aşan cümleler kelime pencerelerine bölünür.
+    sized_units = []
+    for text, start, end in units:
+        if not text:
+            continue
+        tokens = count_tokens(text)
+        if tokens <= max_tokens:
+            sized_units.append((text, start, end, tokens))
+            continue
+        words = list(re.finditer(r"\S+", text))
+        for i in range(0, len(words), max_tokens):
+            window = words[i:i + max_tokens]
+            piece = text[window[0].start():window[-1].end()]
+            if unit_name == "char":
+                sized_units.append((piece, start + window[0].start(), start + window[-1].end(), count_tokens(piece)))
+            else:
+                sized_units.append((piece, start, end, count_tokens(piece)))
+
+    passages, current, current_tokens = [], [], 0
+    for unit in sized_units:
+        if current and current_tokens + unit[3] > max_tokens:
+            passages.append(current)
+            # Önceki pasajın son cümleleri örtüşme bütçesi kadar taşınır.
+            keep, kept = [], 0
+            for previous in reversed(current):
+                if kept + previous[3] > overlap_tokens:
+                    break
+                keep.insert(0, previous)
+                kept += previous[3]
+            if kept + unit[3] > max_tokens:
+                keep, kept = [], 0
+            current, current_tokens = keep, kept
+        current.append(unit)
+        current_tokens += unit[3]
+    if current:
+        passages.append(current)
+
+    return [
+        {"text": " ".join(u[0] for u in passage), "start": passage[0][1], "end": passage[-1][2], "unit": unit_name}
+        for passage in passages
+    ]
+
+class DocumentRecord:
+    """
+    Bir indeks dokümanının kompakt kaydı. Transkript metni kaynakla paylaşılır; karakter
+    ofsetli pasajlarda metin, kaynak transkriptten yalnızca istendiğinde dilimlenir.
+    """
+    __slots__ = ("file_title", "source", "text", "start", "end", "unit")
+
+    def __init__(self, file_title, source, text, start=None, end=None, unit=None):
+        self.file_title = file_title
+        self.source = source
+        self.text = text
+        self.start = start
+        self.end = end
+        self.unit = unit
+
+    @property
+    def transcription(self):
+        if self.unit == "char":
+            return self.text[self.start:self.end]
+        return self.text
+
+    def tags(self):
+        """
+        txtai'ye verilen, transkripti içermeyen küçük metadata JSON'u.
+        """
+        return json.dumps({"file_title": self.file_title, "source": self.source,
+                           "start": self.start, "end": self.end, "unit": self.unit})
+
+class DocumentView(Sequence):
+    """
+    Kayıtlardan (id, birleşik metin, metadata) demetlerini erişim anında üreten salt okunur dizi.
+    Birleşik metinler bellekte tutulmaz; yalnızca indeksleme sırasında oluşturulur.
+    """
+
+    def __init__(self, records, text_template):
+        self.records = records
+        self.ids = tuple(records)
+        self.text_template = text_template
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        doc_id = self.ids[index]
+        record = self.records[doc_id]
+        combined_text = self.text_template.format(file_title=record.file_title, transcription=record.transcription)
+        return doc_id, combined_text, record.tags()
+
+class IndexSnapshot:
+    """
+    Sunulan indeksin anlık görüntüsü: kayıtlar, embeddings ve sürüm. Yayımlandıktan sonra
+    değiştirilmez; yeni indekse tek bir atamayla (EmbeddingIndexer.publish) geçilir. İstekler
+    görüntüyü bir kez okur, böylece sonuçlar, kayıtlar ve sürüm her zaman aynı indekse aittir.
+    """
+    __slots__ = ("records", "embeddings", "version")
+
+    def __init__(self, records, embeddings, version):
+        self.records = records
+        self.embeddings = embeddings
+        self.version = version
+
+def normalize_query(query):
+    """
+    Sorguyu önbellek anahtarı için NFC'ye çevirir ve boşlukları sadeleştirir.
+    """
+    return " ".join(unicodedata.normalize("NFC", query).split())
+
+class EmbeddingIndexer:
+    def __init__(self, model_name="BAAI/bge-m3", cuda_device=None, method="clspooling", hybrid=True,
+                 text_template=TEXT_TEMPLATE, chunk_tokens=None, chunk_overlap=32, content=False,
+                 cache_size=1024, cache_ttl=3600, query_encoder=None, vector_format=None, pq_subquantizers=64,
+                 rescore_factor=0, embeddings_factory=None):
+        """
+        Belirtilen model ve CUDA ayarları ile embedding indexer'ı başlatır.
+        cuda_device verilmezse CUDA_VISIBLE_DEVICES değiştirilmez (ör. yalnızca CPU olan sunucular).
+        query_encoder verilirse (query_encoder.QueryEncoder) sorgular bu int8 / ONNX kodlayıcıyla kodlanır;
+        dokümanlar ve kayıtlı indeks değişmez.
+        vector_format ("fp16", "int8", "pq") verilirse yoğun vektörler Faiss'te sıkıştırılmış saklanır
+        (bkz. configure_vectors); rescore_factor > 0 ise en iyi limit * rescore_factor aday tam (float32)
+        vektörlerle yeniden puanlanır.
+        embeddings_factory verilirse txtai.Embeddings yerine bu fabrika aynı argümanlarla çağrılır (ör. testler).
+        """
+        if cuda_device is not None:
+            os.environ["CUDA_VISIBLE_DEVICES"] = cuda_device
+        self.model_name = model_name
+        self.query_encoder = query_encoder
+        if vector_format is not None and vector_format not in VECTOR_STORAGE:
+            raise ValueError(f"Bilinmeyen vektör formatı: {vector_format} (seçenekler: {', '.join(VECTOR_STORAGE)})")
+        self.vector_format = vector_format
+        self.pq_subquantizers = pq_subquantizers
+        self.rescore_factor = rescore_factor
+        self.embeddings_factory = embeddings_factory
+        self.method = method
+        self.hybrid = hybrid
+        self.text_template = text_template
+        # chunk_tokens verilirse transkriptler pasajlara bölünerek indekslenir.
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        # Sonuçlar self.records'tan okunduğu için txtai'nin içerik veritabanı varsayılan olarak kapalıdır.
+        self.content = content
+        # Arama sonuçları ve sorgu vektörleri için LRU + TTL önbellekler. Sonuç anahtarı indeks
+        # sürümünü içerir; sorgu vektörleri yalnızca modele bağlı olduğu için yeniden indekslemede korunur.
+        self.cache_lock = threading.Lock()
+        self.result_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.vector_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.cache_counters = {"result_hits": 0, "result_misses": 0, "vector_hits": 0, "vector_misses": 0}
+        self.data = {}
+        self.documents = []
+        self.manifest = {}
+        # Sunulan indeks: değişmez id -> kayıt tablosu, txtai Embeddings örneği ve sürüm (indeks dizininin adı).
+        self.snapshot = IndexSnapshot(MappingProxyType({}), self.create_embeddings(), None)
+        self.rebuild_thread = None
+        self.rebuild_lock = threading.Lock()
+        # Son arka plan yeniden oluşturmasının hatası; bu durumda son geçerli indeks kullanılmaya devam eder.
+        self.rebuild_error = None
+
+    @property
+    def records(self):
+        return self.snapshot.records
+
+    @property
+    def embeddings(self):
+        return self.snapshot.embeddings
+
+    @property
+    def index_version(self):
+        return self.snapshot.version
+
+    def publish(self, records, embeddings, version):
+        """
+        Kayıtları, embeddings'i ve sürümü tek bir anlık görüntü olarak yayımlar. Atama atomiktir;
+        süren istekler okudukları önceki görüntüyle tamamlanır.
+        """
+        self.snapshot = IndexSnapshot(records, embeddings, version)
+
+    def create_embeddings(self):
+        """
+        Indexer ayarlarıyla yeni bir txtai Embeddings örneği oluşturur.
+        """
+        factory = self.embeddings_factory
+        if factory is None:
+            from txtai import Embeddings as factory
+
+        embeddings = factory(path=self.model_name, hybrid=self.hybrid, content=self.content, method=self.method)
+        self.cache_query_vectors(embeddings)
+        return embeddings
+
+    def cache_query_vectors(self, embeddings):
+        """
+        Sorgu kodlamasını (embeddings.batchtransform) vektör önbelleğiyle sarar; daha önce
+        kodlanmış bir sorgu metni için bge-m3 yeniden çalıştırılmaz. query_encoder varsa metin
+        sorguları txtai'nin torch modeli yerine onunla kodlanır.
+        """
+        original = embeddings.batchtransform
+
+        def encoder_transform(documents, *args, **kwargs):
+            return self.query_encoder.encode(
+                [document[1] if isinstance(document, tuple) else document for document in documents])
+
+        transform = original if self.query_encoder is None else encoder_transform
+
+        def batchtransform(documents, category=None, index=None):
+            documents = list(documents)
+            texts = [document[1] if isinstance(document, tuple) else document for document in documents]
+            if not all(isinstance(text, str) for text in texts):
+                return original(documents, category, index)
+            # Varsayılanlar anahtarda açıkça yer alır: arama yolu (batchtransform(gen)) ile
+            # transform() (batchtransform([doc], None, None)) aynı girdiyi paylaşır.
+            keys = [(text, category, index) for text in texts]
+            with self.cache_lock:
+                vectors = [self.vector_cache.get(key) for key in keys]
+                missing = [i for i, vector in enumerate(vectors) if vector is None]
+                self.cache_counters["vector_hits"] += len(keys) - len(missing)
+                self.cache_counters["vector_misses"] += len(missing)
+            if missing:
+                computed = transform([documents[i] for i in missing], category, index)
+                with self.cache_lock:
+                    for i, vector in zip(missing, computed):
+                        vectors[i] = vector
+                        self.vector_cache[keys[i]] = vector
+            return np.array(vectors)
+
+        embeddings.batchtransform = batchtransform
+        # Sorgu olmayan metinler (bağlam cümleleri) aynı modelle ama önbelleğe girmeden kodlanır.
+        embeddings.uncached_batchtransform = transform
+
+    def search(self, query, limit=3, weights=None):
+        """
+        Önbellekli hybrid arama. Anahtar: normalize edilmiş sorgu, limit, ağırlık ve indeks sürümü.
+        """
+        return self.batch_search([query], limit=limit, weights=weights)[0]
+
+    def batch_search(self, queries, limit=3, weights=None, snapshot=None):
+        """
+        Birden çok sorguyu önbellek üzerinden arar. Önbellekte olmayan sorgular tek bir
+        embeddings.batchsearch çağrısında birlikte kodlanır; vektör ve sparse aramalar da toplu yapılır.
+        snapshot verilirse arama o indeks görüntüsünde yapılır (sonuçların kayıtları da ondan okunur).
+        """
+        snapshot = snapshot if snapshot is not None else self.snapshot
+        queries = [normalize_query(query) for query in queries]
+        index_version = snapshot.version
+        keys = [(query, limit, weights, index_version) for query in queries]
+        with self.cache_lock:
+            results = [self.result_cache.get(key) for key in keys]
+            hits = sum(result is not None for result in results)
+            self.cache_counters["result_hits"] += hits
+            self.cache_counters["result_misses"] += len(results) - hits
+        missing = list(dict.fromkeys(query for query, result in zip(queries, results) if result is None))
+        if missing:
+            computed = dict(zip(missing, snapshot.embeddings.batchsearch(missing, limit=limit, weights=weights)))
+            with self.cache_lock:
+                for query in missing:
+                    self.result_cache[(query, limit, weights, index_version)] = computed[query]
+            results = [result if result is not None else computed[query] for query, result in zip(queries, results)]
+        return [list(result) for result in results]
+
+    def query_vector(self, query):
+        """
+        Normalize edilmiş sorguyu yüklü bge-m3 modeliyle kodlar (vektör önbelleği üzerinden).
+        """
+        vector = self.embeddings.batchtransform([(None, normalize_query(query), None)])[0]
+        return np.asarray(vector, dtype=np.float32)
+
+    def text_vectors(self, texts):
+        """
+        Metinleri sorgularla aynı modelle, vektör önbelleğini kullanmadan kodlar. Önbellek ve
+        isabet oranı yalnızca sorguları yansıtır.
+        """
+        return np.asarray(self.embeddings.uncached_batchtransform(list(texts)), dtype=np.float32)
+
+    def cache_stats(self):
+        """
+        Önbelleklerin isabet oranlarını ve boyutlarını döndürür.
+        """
+        with self.cache_lock:
+            stats = dict(self.cache_counters)
+            stats["result_size"] = len(self.result_cache)
+            stats["vector_size"] = len(self.vector_cache)
+        for level in ("result", "vector"):
+            total = stats[f"{level}_hits"] + stats[f"{level}_misses"]
+            stats[f"{level}_hit_rate"] = stats[f"{level}_hits"] / total if total else 0.0
+        return stats
+
+    def load_data(self, json_file):
+        """
+        JSON dosyasından veriyi yükler ve indeks manifest'ini hesaplar.
+        """
+        with open(json_file, "r", encoding="utf-8") as f:
+            self.data = json.load(f)
+        self.manifest = self.build_manifest(json_file)
+        return self.data
+
+    def build_manifest(self, json_file):
+        """
+        İndeksi belirleyen tüm girdileri (derlem özeti, model, pooling, hybrid, şablon) toplar.
+        """
+        digest = hashlib.sha256()
+        with open(json_file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return {
+            "corpus_sha256": digest.hexdigest(),
+            "model_name": self.model_name,
+            "method": self.method,
+            "hybrid": self.hybrid,
+            "text_template": self.text_template,
+            "chunk_tokens": self.chunk_tokens,
+            "chunk_overlap": self.chunk_overlap,
+            "content": self.content,
+            # Varsayılan float32 indeksin manifest'i (ve hash'i) değişmesin diye yalnızca seçildiğinde eklenir.
+            **({"vector_format": self.vector_format, "pq_subquantizers": self.pq_subquantizers,
+                "rescore": bool(self.rescore_factor)} if self.vector_format else {}),
+        }
+
+    def manifest_hash(self, manifest=None):
+        """
+        Manifest'in kısa ve kararlı hash'ini döndürür.
+        """
+        manifest = manifest if manifest is not None else self.manifest
+        encoded = json.dumps(manifest, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()[:16]
+
+    def index_path(self, directory="indexes"):
+        """
+        Mevcut manifest'e karşılık gelen indeks dizinini döndürür.
+        """
+        file_name = f"index_{self.model_name.split('/')[-1]}_{self.manifest_hash()}"
+        return os.path.join(directory, file_name)
+
+    def latest_index_path(self, directory="indexes"):
+        """
+        Son başarılı indeksin yolunu döndürür. Önce latest.json işaretçisine,
+        yoksa dizindeki en yeni indekse bakar.
+        """
+        pointer = os.path.join(directory, "latest.json")
+        if os.path.exists(pointer):
+            with open(pointer, "r", encoding="utf-8") as f:
+                path = os.path.join(directory, json.load(f)["index"])
+            if os.path.exists(path):
+                return path
+        if not os.path.isdir(directory):
+            return None
+        prefix = f"index_{self.model_name.split('/')[-1]}_"
+        candidates = [
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.startswith(prefix) and os.path.exists(os.path.join(directory, name, "config.json"))
+        ]
+        return max(candidates, key=os.path.getmtime) if candidates else None
+
+    @staticmethod
+    def save_records(path, records):
+        """
+        İndekslenen kayıtları indeksin yanına yazar. Karakter ofsetli pasajların kaynak
+        transkripti bir kez saklanır; bu pasajlar için yalnızca ofsetler yazılır.
+        """
+        sources, rows = {}, []
+        for doc_id, record in records.items():
+            text = record.text
+            if record.unit == "char":
+                sources.setdefault(record.source, record.text)
+                text = None
+            rows.append([doc_id, record.file_title, record.source, record.start, record.end, record.unit, text])
+        with open(os.path.join(path, RECORDS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"sources": sources, "records": rows}, f, ensure_ascii=False)
+
+    @staticmethod
+    def load_records(path):
+        """
+        save_records ile yazılmış kayıt tablosunu okur; dosya yoksa None döndürür.
+        """
+        records_file = os.path.join(path, RECORDS_FILE)
+        if not os.path.exists(records_file):
+            return None
+        with open(records_file, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        sources = saved["sources"]
+        return MappingProxyType({
+            doc_id: DocumentRecord(file_title, source, sources[source] if text is None else text, start, end, unit)
+            for doc_id, file_title, source, start, end, unit, text in saved["records"]
+        })
+
+    def load_index(self, path, records=None):
+        """
+        Kaydedilmiş bir indeksi yükler ve kayıtlarıyla (varsayılan: hazırlanan dokümanlar) yayımlar.
+        """
+        embeddings = self.embeddings
+        embeddings.load(path)
+        self.configure_search(embeddings)
+        self.publish(records if records is not None else self.documents.records, embeddings,
+                     os.path.basename(os.path.normpath(path)))
+
+    def configure_vectors(self, embeddings, count):
+        """
+        Sıkıştırılmış vektör formatı seçildiyse Faiss bileşenlerini doküman sayısına göre ayarlar.
+        Ayar indeksle birlikte kaydedilir ve indeks mmap bayrağıyla okunur. Faiss yalnızca IVF ters
+        listelerini dosyadan eşler; bu listeler aynı sunucudaki işçiler arasında sayfa önbelleği
+        üzerinden paylaşılır. IDMap (küçük derlem) kodları ve RFlat tam vektörleri her süreçte belleğe
+        okunur; bu durumda kazanç yalnızca sıkıştırmadır.
+        """
+        if not self.vector_format:
+            return
+        storage = VECTOR_STORAGE[self.vector_format].format(m=self.pq_subquantizers)
+        if self.vector_format == "pq" and count < 2 ** PQ_NBITS:
+            print(f"PQ için en az {2 ** PQ_NBITS} vektör gerekir ({count} doküman); SQ8 kullanılıyor.")
+            storage = VECTOR_STORAGE["int8"]
+        # Küçük derlemlerde düz (IDMap) indeks, büyüklerde IVF; eşik ve hücre sayısı txtai varsayılanlarıyla aynıdır.
+        if count <= 5000:
+            components = f"IDMap,{storage}"
+        else:
+            components = f"IVF{max(1, min(round(4 * math.sqrt(count)), count // 39))},{storage}"
+        if self.rescore_factor:
+            # RFlat: tam vektörler ayrı tutulur ve yalnızca aday satırlarını yeniden puanlamak için kullanılır.
+            components += ",RFlat"
+        embeddings.config["backend"] = "faiss"
+        embeddings.config["faiss"] = dict(embeddings.config.get("faiss") or {}, components=components, mmap=True)
+
+    def configure_search(self, embeddings):
+        """
+        Yeniden puanlama açıksa sıkıştırılmış aramadan kaç kat aday alınacağını ayarlar.
+        """
+        if self.vector_format and self.rescore_factor:
+            import faiss
+
+            faiss.ParameterSpace().set_index_parameter(embeddings.ann.backend, "k_factor_rf", self.rescore_factor)
+
+    def prepare_documents(self):
+        """
+        Dokümanları, dosya başlığı ve transkripti birleştirerek hazırlar.
+        Her doküman: (id, birleşik metin, metadata) şeklinde. Pasajlara bölme açıksa
+        her pasaj "<anahtar>#<n>" kimliğiyle ayrı bir dokümandır; kaynak ve ofsetler metadata'dadır.
+        Dokümanlar, self.documents.records'taki kompakt kayıtlardan erişim anında üretilir; aynı
+        kayıtlar indeksle birlikte yayımlanır ve sorgu sırasında JSON çözümlemeden kullanılır.
+        """
+        records = {}
+        for key, value in self.data.items():
+            file_title = value.get("file_title", "")
+            transcription = value.get("transcription", "")
+            if not self.chunk_tokens:
+                records[key] = DocumentRecord(file_title, key, transcription)
+                continue
+            for i, passage in enumerate(split_passages(transcription, self.chunk_tokens, self.chunk_overlap)):
+                # Karakter ofsetli pasajlar kaynak transkripti paylaşır, kopyalanmaz.
+                text = transcription if passage["unit"] == "char" else passage["text"]
+                records[f"{key}#{i}"] = DocumentRecord(file_title, key, text, passage["start"], passage["end"],
+                                                       passage["unit"])
+        self.documents = DocumentView(MappingProxyType(records), self.text_template)
+        # Ham JSON artık gerekmez; her transkript kayıtlarda tek kopya olarak tutulur.
+        self.data = {}
+        return self.documents
+
+    def index_documents(self):
+        """
+        Hazırlanan dokümanları txtai ile indeksler.
+        """
+        if not self.documents:
+            raise ValueError("İndeksleme için doküman bulunamadı. Önce prepare_documents() çalıştırın.")
+        print("Dokümanlar indeksleniyor...")
+        start_time = time.time()
+        self.configure_vectors(self.embeddings, len(self.documents))
+        self.embeddings.index(tqdm(self.documents, total=len(self.documents)))
+        self.publish(self.documents.records, self.embeddings, self.index_version)
+        elapsed_time = time.time() - start_time
+        print(f"İndeksleme {elapsed_time:.2f} saniyede tamamlandı.")
+        return elapsed_time
+
+    def document_fingerprints(self):
+        """
+        Her doküman için metin ve metadata'dan hesaplanan parmak izini döndürür.
+        """
+        return {
+            doc_id: hashlib.sha256(f"{text}\x00{metadata}".encode("utf-8")).hexdigest()
+            for doc_id, text, metadata in self.documents
+        }
+
+    def can_update(self, path):
+        """
+        Kayıtlı indeksin artımlı güncellenip güncellenemeyeceğini kontrol eder:
+        parmak izleri mevcut olmalı ve derlem dışındaki tüm manifest alanları aynı olmalı.
+        Sıkıştırılmış indekslerde (mmap ile açılan IVF listeleri salt okunurdur, nicemleyici eski
+        derlemle eğitilmiştir) indeks her zaman yeniden oluşturulur.
+        """
+        if self.vector_format:
+            return False
+        manifest_file = os.path.join(path, "manifest.json")
+        if not os.path.exists(manifest_file) or not os.path.exists(os.path.join(path, "fingerprints.json")):
+            return False
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        return all(previous.get(key) == value for key, value in self.manifest.items() if key != "corpus_sha256")
+
+    def update_index(self, path, embeddings=None):
+        """
+        Kayıtlı indeksi yalnızca yeni veya değişen dokümanları gömerek ve silinen
+        anahtarları kaldırarak günceller. (eklenen/güncellenen, silinen) sayılarını döndürür.
+        """
+        embeddings = embeddings if embeddings is not None else self.embeddings
+        with open(os.path.join(path, "fingerprints.json"), "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        current = self.document_fingerprints()
+        changed = [doc for doc in self.documents if previous.get(doc[0]) != current[doc[0]]]
+        removed = [doc_id for doc_id in previous if doc_id not in current]
+        if removed:
+            embeddings.delete(removed)
+        if changed:
+            embeddings.upsert(changed)
+        return len(changed), len(removed)
+
+    def save_index(self, directory="indexes", embeddings=None):
+        """
+        İndeksi manifest hash'i ile adlandırılmış dizine kaydeder ve
+        latest.json işaretçisini günceller.
+        """
+        embeddings = embeddings if embeddings is not None else self.embeddings
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        file_path = self.index_path(directory)
+        embeddings.save(file_path)
+        with open(os.path.join(file_path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=4)
+        with open(os.path.join(file_path, "fingerprints.json"), "w", encoding="utf-8") as f:
+            json.dump(self.document_fingerprints(), f, ensure_ascii=False)
+        # content=False olduğu için bu indeksin sonuçları yalnızca bu kayıtlarla çözülebilir.
+        self.save_records(file_path, self.documents.records)
+        # İşaretçi, indeks tamamen yazıldıktan sonra atomik olarak değiştirilir.
+        pointer = os.path.join(directory, "latest.json")
+        with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"index": os.path.basename(file_path), "manifest": self.manifest}, f, ensure_ascii=False)
+        os.replace(pointer + ".tmp", pointer)
+        return file_path
+
+    def build_index(self, directory="indexes"):
+        """
+        Hazırlanan dokümanlar için yeni bir indeks oluşturup kaydeder ve (embeddings, yol) döndürür.
+        Uyumlu bir önceki indeks varsa yalnızca fark gömülür. Kullanılan indeks (self.embeddings)
+        değiştirilmez; servis ve pipeline/ingest.py aynı yolu kullanır.
+        """
+        embeddings = self.create_embeddings()
+        previous_path = self.latest_index_path(directory)
+        if previous_path and self.can_update(previous_path):
+            embeddings.load(previous_path)
+            upserted, deleted = self.update_index(previous_path, embeddings)
+            print(f"Artımlı güncelleme: {upserted} doküman eklendi/güncellendi, {deleted} silindi.")
+        else:
+            self.configure_vectors(embeddings, len(self.documents))
+            embeddings.index(tqdm(self.documents, total=len(self.documents)))
+        file_path = self.save_index(directory, embeddings=embeddings)
+        if self.vector_format:
+            # Servis indeksi diskten, mmap bayrağıyla yüklenmiş haliyle kullanır (IVF listeleri eşlenir).
+            embeddings = self.create_embeddings()
+            embeddings.load(file_path)
+        self.configure_search(embeddings)
+        return embeddings, file_path
+
+    def rebuild_in_background(self, directory="indexes"):
+        """
+        Güncel derlem için indeksi arka planda oluşturur. Bu sırada sorgular son
+        geçerli indeksi ve onun kayıtlarını kullanmaya devam eder; iş bitince yeni indeks,
+        self.documents'taki yeni kayıtlar ve sürüm tek bir anlık görüntü olarak yayımlanır.
+        """
+        with self.rebuild_lock:
+            if self.rebuild_thread is not None and self.rebuild_thread.is_alive():
+                return self.rebuild_thread
+
+            def rebuild():
+                try:
+                    build()
+                except Exception as e:
+                    self.rebuild_error = f"{type(e).__name__}: {e}"
+                    print(f"Arka planda indeks oluşturulamadı, son geçerli indeks kullanılıyor: {self.rebuild_error}",
+                          flush=True)
+                    traceback.print_exc()
+                else:
+                    self.rebuild_error = None
+
+            def build():
+                embeddings, file_path = self.build_index(directory)
+                self.publish(self.documents.records, embeddings, os.path.basename(file_path))
+
+            self.rebuild_thread = threading.Thread(target=rebuild, name="index-rebuild", daemon=True)
+            self.rebuild_thread.start()
+            return self.rebuild_thread
+
+##############################################
+# Web Araması (API Anahtarsız)               #
+##############################################
+
+# Web araması için bekleme bütçesi (saniye); süre dolarsa yanıt web sonuçları olmadan döner.
+WEB_SEARCH_TIMEOUT = float(os.environ.get("WEB_SEARCH_TIMEOUT", "2.0"))
+WEB_SEARCH_MAX_RESULTS = 5
+WEB_SEARCH_CACHE_SIZE = 512
+WEB_SEARCH_CACHE_TTL = int(os.environ.get("WEB_SEARCH_CACHE_TTL", "3600"))
+# Verilirse DuckDuckGo yerine bu JSON dosyasındaki sabit sonuçlar kullanılır (StaticSearchBackend).
+WEB_SEARCH_FIXTURES = os.environ.get("WEB_SEARCH_FIXTURES")
+
+class DuckDuckGoBackend:
+    """
+    DuckDuckGo ile web araması. DDGS istemcisi thread başına bir kez oluşturulur ve
+    bağlantıları sonraki aramalarda yeniden kullanılır.
+    """
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def __call__(self, query, max_results):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            from duckduckgo_search import DDGS
+
+            client = self.local.client = DDGS(timeout=self.timeout)
+        return list(client.text(query, max_results=max_results))
+
+class StaticSearchBackend:
+    """
+    Ağa çıkmayan sahte arama arka ucu (testler ve çevrimdışı geliştirme için). Sonuçlar
+    {sorgu: [{"title", "href", "body"}, ...]} biçiminde bir sözlükten ya da JSON dosyasından gelir;
+    delay ile yavaş bir arama taklit edilebilir.
+    """
+
+    def __init__(self, results=None, delay=0.0):
+        if isinstance(results, str):
+            with open(results, "r", encoding="utf-8") as f:
+                results = json.load(f)
+        self.results = {normalize_query(query).casefold(): hits for query, hits in (results or {}).items()}
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, query, max_results):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return list(self.results.get(normalize_query(query).casefold(), []))[:max_results]
+
+class WebSearcher:
+    """
+    Web aramasını kendi thread havuzunda zaman aşımıyla çalıştırır ve sonuçları sorguya göre
+    TTL önbelleğinde tutar. Aynı sorgu için süren arama paylaşılır; bütçeyi aşan bir arama
+    arka planda tamamlanırsa sonucu yine önbelleğe yazılır. backend(query, max_results) dışarıdan verilebilir.
+    """
+
+    def __init__(self, backend=None, timeout=WEB_SEARCH_TIMEOUT, cache_size=WEB_SEARCH_CACHE_SIZE,
+                 cache_ttl=WEB_SEARCH_CACHE_TTL, workers=2):
+        self.backend = backend if backend is not None else DuckDuckGoBackend()
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="web")
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "timeouts": 0, "errors": 0}
+
+    @staticmethod
+    def cache_key(query, max_results):
+        return normalize_query(query).casefold(), max_results
+
+    def fetch(self, key, query, max_results):
+        try:
+            results = self.backend(query, max_results)
+        except Exception as e:
+            print(f"Web araması sırasında hata oluştu: {str(e)}")
+            with self.lock:
+                self.pending.pop(key, None)
+                self.stats["errors"] += 1
+            raise
+        with self.lock:
+            self.cache[key] = results
+            self.pending.pop(key, None)
+        return results
+
+    async def search(self, query, max_results=WEB_SEARCH_MAX_RESULTS, timeout=None):
+        """
+        (sonuçlar, hata) döndürür; hata None, "timeout" ya da arama hatasının mesajıdır.
+        """
+        key = self.cache_key(query, max_results)
+        with self.lock:
+            if key in self.cache:
+                self.stats["hits"] += 1
+                return self.cache[key], None
+            self.stats["misses"] += 1
+            future = self.pending.get(key)
+            if future is None:
+                future = self.pending[key] = self.executor.submit(self.fetch, key, query, max_results)
+        waiter = asyncio.wrap_future(future)
+        # Bekleyen kalmasa da sonuç alınır; zaman aşımı aramayı iptal etmez.
+        waiter.add_done_callback(lambda done: done.cancelled() or done.exception())
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout or self.timeout), None
+        except asyncio.TimeoutError:
+            with self.lock:
+                self.stats["timeouts"] += 1
+            return [], "timeout"
+        except Exception as e:
+            return [], str(e) or type(e).__name__
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+##############################################
+# LLM Yanıt Fonksiyonları                    #
+##############################################
+
+OLLAMA_URL = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+LLM_MODEL = "llama3:70b"
+# Anlamsal yanıt önbelleği: benzerlik eşiği, en fazla kayıt sayısı ve kayıt ömrü (saniye).
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = 256
+SEMANTIC_CACHE_TTL = 24 * 3600
+
+class OllamaClient:
+    """
+    Ollama HTTP API için kalıcı (keep-alive) bağlantı havuzlu asenkron istemci.
+    Yanıtları token token akıtır ve modeli keep_alive süresince bellekte tutar.
+    """
+
+    def __init__(self, base_url=OLLAMA_URL, model=LLM_MODEL, keep_alive="30m", timeout=(5, 300), pool_size=8):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        # (bağlantı, okuma) zaman aşımı; okuma süresi token'lar arası beklemeyi sınırlar.
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = None
+
+    async def start(self):
+        """
+        Bağlantı havuzunu servisin olay döngüsünde oluşturur.
+        """
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size),
+            timeout=aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1]),
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def warm_up(self):
+        """
+        Boş bir istekle modeli belleğe yükler; ilk sorguda yükleme beklenmez.
+        """
+        try:
+            async with self.session.post(f"{self.base_url}/api/generate",
+                                         json={"model": self.model, "keep_alive": self.keep_alive},
+                                         timeout=aiohttp.ClientTimeout(sock_connect=self.timeout[0])) as response:
+                response.raise_for_status()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+
+    async def generate_stream(self, prompt):
+        """
+        /api/generate üzerinden yanıtı akıtır ve her token parçasını döndürür (async generator).
+        Generator kapatıldığında veya istek iptal edildiğinde bağlantı kapanır ve Ollama üretimi durdurur.
+        """
+        payload = {"model": self.model, "prompt": prompt, "stream": True, "keep_alive": self.keep_alive}
+        async with self.session.post(f"{self.base_url}/api/generate", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                line = line.strip()
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
+
+def build_prompt(context, query_text):
+    """
+    LLM'e gönderilecek Türkçe sistem talimatlı istemi oluşturur.
+    """
+    return f"""Sistem Talimatları:
+    Sen yalnızca Türkçe yanıt veren bir yapay zeka asistanısın.
+    Başka bir dilde yanıt vermemelisin.
+
+    Aşağıdaki bağlamı kullanarak, '{query_text}' sorusuna yalnızca Türkçe olarak yanıt oluştur.
+    Bağlamda verilen bilgilerden emin olmadığın durumda yanıt üretme.
+    Gereksiz yorum veya tahmin yapma.
+    Eğer bağlamda yeterli bilgi yoksa, sadece "Bilmiyorum." diye yanıt ver.
+
+    --- BAĞLAM ---
+    {context}
+
+    --- SORU ---
+    {query_text}
+
+    --- YANIT ---"""
+
+class SemanticAnswerCache:
+    """
+    Aynı sorunun farklı ifadeleri için yanıt önbelleği. Soru vektörleri arasındaki
+    kosinüs benzerliği eşiği aşıyorsa ve getirilen doküman kümesi aynıysa kayıtlı yanıt döner.
+    Kayıtlar boyut (LRU) ve yaşa göre silinir; indeks sürümü değişince önbellek temizlenir.
+    Yanıtın sesi, aynı cümleler için diskteki WAV önbelleğinden (AudioCache) gelir.
+    """
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_size=SEMANTIC_CACHE_SIZE, ttl=SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.index_version = None
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def sync(self, index_version):
+        # Kilit tutulurken çağrılır: yeni indeks sürümünde eski yanıtlar geçersizdir.
+        if index_version != self.index_version:
+            self.entries.clear()
+            self.index_version = index_version
+        expired = [key for key, entry in self.entries.items() if time.time() - entry["created"] > self.ttl]
+        for key in expired:
+            del self.entries[key]
+
+    def lookup(self, vector, doc_ids, index_version):
+        """
+        Eşiği aşan en benzer kaydı döndürür; yoksa None.
+        """
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self.lock:
+            self.sync(index_version)
+            best_key, best_score = None, self.threshold
+            for key, entry in self.entries.items():
+                if entry["doc_ids"] != doc_ids:
+                    continue
+                score = float(np.dot(vector, entry["vector"]))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                return None
+            self.entries.move_to_end(best_key)
+            return dict(self.entries[best_key], score=best_score)
+
+    def store(self, vector, doc_ids, index_version, answer):
+        """
+        Yanıtı soru vektörü ve doküman kümesiyle birlikte kaydeder.
+        """
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self.lock:
+            self.sync(index_version)
+            self.counter += 1
+            self.entries[self.counter] = {"vector": vector, "doc_ids": doc_ids, "answer": answer,
+                                          "created": time.time()}
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+#########################################
+# TTS Model Yükleme ve Ses Üretim Fonksiyonu #
+#########################################
+
+TTS_MODEL = "facebook/mms-tts-tur"
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+class AudioCache:
+    """
+    Sentezlenmiş WAV baytları için diskte tutulan, boyutu sınırlı LRU önbellek.
+    Dosyalar içerik hash'i ile adlandırılır; erişim sırası dosya mtime'ı ile korunur.
+    """
+
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Yeniden başlatmada mevcut dosyalar en eskiden en yeniye sıralanarak yüklenir.
+        files = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".wav")]
+        self.entries = OrderedDict(
+            (os.path.basename(path)[:-4], os.path.getsize(path)) for path in sorted(files, key=os.path.getmtime)
+        )
+        self.total_bytes = sum(self.entries.values())
+
+    @staticmethod
+    def key(text, revision, sampling_rate):
+        """
+        Normalize edilmiş metin, model sürümü ve örnekleme hızından önbellek anahtarı üretir.
+        """
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{revision}\x00{sampling_rate}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".wav")
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        try:
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+            os.utime(self.path(key))
+            return data
+        except FileNotFoundError:
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+            return None
+
+    def put(self, key, data):
+        tmp_path = self.path(key) + f".{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(key))
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_key, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(self.path(old_key))
+                except FileNotFoundError:
+                    pass
+
+def waveform_to_wav(waveform, sampling_rate):
+    """
+    Dalga formunu normalize ederek 16-bit WAV baytlarına dönüştürür.
+    """
+    import scipy.io.wavfile
+
+    peak = np.max(np.abs(waveform)) if waveform.size else 0.0
+    waveform_norm = waveform / peak if peak > 0 else waveform
+    waveform_int16 = (waveform_norm * 32767).astype(np.int16)
+    wav_buffer = io.BytesIO()
+    scipy.io.wavfile.write(wav_buffer, rate=sampling_rate, data=waveform_int16)
+    return wav_buffer.getvalue()
+
+class SpeechSynthesizer:
+    """
+    VITS modeliyle cümleleri WAV baytlarına çevirir. Aynı metin, model sürümü ve örnekleme hızı
+    için ses yalnızca bir kez sentezlenir ve sonraki isteklerde diskteki önbellekten gelir.
+    """
+
+    def __init__(self, model_name=TTS_MODEL, cache=None):
+        from transformers import AutoTokenizer, VitsModel
+
+        self.model = VitsModel.from_pretrained(model_name)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.sampling_rate = self.model.config.sampling_rate
+        self.revision = getattr(self.model.config, "_commit_hash", None) or model_name
+        self.cache = cache if cache is not None else AudioCache()
+
+    def synthesize_speech(self, text):
+        """
+        Verilen metni VITS modeli ile sese çevirir ve float dalga formunu döndürür.
+        """
+        import torch
+
+        inputs = self.tokenizer(text, return_tensors="pt")
+        if inputs["input_ids"].shape[-1] == 0:
+            return np.zeros(0, dtype=np.float32)
+        with torch.no_grad():
+            result = self.model(**inputs)
+        return result.waveform.detach().cpu().numpy().squeeze()
+
+    def synthesize_sentence(self, text):
+        """
+        Cümleyi (önbellek üzerinden) WAV baytlarına çevirir; seslendirilecek bir şey yoksa None döner.
+        """
+        key = self.cache.key(text, self.revision, self.sampling_rate)
+        wav = self.cache.get(key)
+        if wav is None:
+            waveform = self.synthesize_speech(text)
+            if not waveform.size:
+                return None
+            wav = waveform_to_wav(waveform, self.sampling_rate)
+            self.cache.put(key, wav)
+        return wav
+
+#########################################
+# Cross-Encoder ile Yeniden Sıralama    #
+#########################################
+
+# Hybrid arama RERANK_CANDIDATES adayı getirir; küçük bir çok dilli cross-encoder bunları yeniden
+# puanlar ve yalnızca en iyi pasajlar RERANK_TOKEN_BUDGET içinde LLM bağlamına girer.
+# RERANK_MODEL boş verilirse yeniden sıralama kapanır.
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "20"))
+RERANK_TOKEN_BUDGET = int(os.environ.get("RERANK_TOKEN_BUDGET", "1500"))
+
+class Reranker:
+    """
+    (sorgu, pasaj) çiftlerini cross-encoder ile CPU'da batch'ler halinde puanlar.
+    Skorlar (sorgu, doküman kimliği, indeks sürümü) anahtarıyla önbelleklenir.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, batch_size=16, max_length=512, cache_size=4096, cache_ttl=3600):
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.lock = threading.Lock()
+
+    def score(self, query, passages, keys):
+        """
+        Pasajların sorguyla ilgililik skorlarını döndürür; önbellekte olmayanlar batch'ler halinde hesaplanır.
+        """
+        import torch
+
+        with self.lock:
+            scores = [self.cache.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            inputs = self.tokenizer([query] * len(batch), [passages[i] for i in batch], padding=True,
+                                    truncation="only_second", max_length=self.max_length, return_tensors="pt")
+            with torch.no_grad():
+                logits = self.model(**inputs).logits
+            # Tek çıkışlı modellerde skor logit'in kendisi, iki sınıflılarda "ilgili" sınıfının logit'idir.
+            values = logits.view(len(batch), -1)[:, -1].tolist()
+            with self.lock:
+                for i, value in zip(batch, values):
+                    scores[i] = value
+                    self.cache[keys[i]] = value
+        return scores
+
+#########################################
+# Token Bütçeli Bağlam Oluşturma        #
+#########################################
+
+# Token sayımı LLM'in tokenizer'ıyla yapılır (Ollama'daki llama3:70b ile aynı sözlük).
+LLM_TOKENIZER = os.environ.get("LLM_TOKENIZER", "NousResearch/Meta-Llama-3-70B-Instruct")
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+# Cümle vektörleri önbelleğe alınan en fazla pasaj sayısı (indeks sürümü başına).
+CONTEXT_VECTOR_CACHE_SIZE = int(os.environ.get("CONTEXT_VECTOR_CACHE_SIZE", "4096"))
+
+def load_token_counter(name=LLM_TOKENIZER):
+    """
+    LLM tokenizer'ıyla token sayan fonksiyonu döndürür; tokenizer verilmezse ya da yüklenemezse
+    kelime sayısına düşer.
+    """
+    if not name:
+        return lambda text: len(text.split())
+    from transformers import AutoTokenizer
+
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(name)
+    except (OSError, ValueError) as e:
+        print(f"LLM tokenizer yüklenemedi ({e}); token sayısı kelime sayısıyla tahmin edilecek.")
+        return lambda text: len(text.split())
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+class ContextBuilder:
+    """
+    Getirilen pasajlardan token bütçesini aşmayan LLM bağlamı oluşturur. Örtüşen pasajlardaki
+    tekrar eden cümleler bir kez alınır; bütçe aşılırsa cümleler sorgu vektörüne kosinüs
+    benzerliğine göre seçilir ve özgün sırasıyla yazılır. Cümle vektörleri sorgu vektörü önbelleğine
+    girmez; pasaj cümlelerinin vektörleri (indeks sürümü, doküman) anahtarıyla ayrı bir LRU önbellekte
+    tutulur, böylece aynı pasaj her sıkıştırmada yeniden kodlanmaz.
+    """
+
+    def __init__(self, indexer, count_tokens, budget=CONTEXT_TOKEN_BUDGET, cache_size=CONTEXT_VECTOR_CACHE_SIZE):
+        self.indexer = indexer
+        self.count_tokens = count_tokens
+        self.budget = budget
+        self.cache_lock = threading.Lock()
+        self.sentence_vectors = LRUCache(maxsize=cache_size)
+
+    @staticmethod
+    def render(documents):
+        return "\n\n".join(f"{header} {' '.join(sentences)}" for header, sentences, _ in documents)
+
+    @staticmethod
+    def split_sentences(text):
+        return [sentence for sentence in (match.group(0).strip() for match in SENTENCE_PATTERN.finditer(text)) if sentence]
+
+    def document_vectors(self, key, text):
+        """
+        Pasajın cümle -> vektör tablosunu döndürür; önbellekte yoksa tüm cümlelerini bir kez kodlar.
+        """
+        with self.cache_lock:
+            vectors = self.sentence_vectors.get(key)
+        if vectors is None:
+            sentences = list(dict.fromkeys(self.split_sentences(text)))
+            vectors = dict(zip(sentences, self.indexer.text_vectors(sentences))) if sentences else {}
+            with self.cache_lock:
+                self.sentence_vectors[key] = vectors
+        return vectors
+
+    def build(self, query, ids, web_results=None, snapshot=None):
+        """
+        (bağlam, istatistikler) döndürür. web_results verilirse web sonuçlarının özetleri
+        transkriptlerden sonra aynı bütçe ve seçimle bağlama eklenir. snapshot, isteğin okuduğu
+        indeks görüntüsüdür (varsayılan: sunulan indeks); kayıtlar ve önbellek anahtarları ondan alınır.
+        """
+        snapshot = snapshot if snapshot is not None else self.indexer.snapshot
+        documents, seen = [], set()
+
+        def add(header, text, key=None):
+            sentences = []
+            for sentence in self.split_sentences(text):
+                normalized = normalize_query(sentence).casefold()
+                # Pasajlar arasındaki örtüşme (chunk_overlap) ve tekrarlar bağlama bir kez girer.
+                if normalized not in seen:
+                    seen.add(normalized)
+                    sentences.append(sentence)
+            if sentences:
+                documents.append((header, sentences, key and (key, text)))
+
+        for doc_id in ids:
+            record = snapshot.records.get(doc_id)
+            if record is not None:
+                add(f"Başlık: {record.file_title or 'N/A'}\nTranskript:", record.transcription,
+                    (snapshot.version, doc_id))
+        for result in web_results or []:
+            add(f"Web: {result.get('title') or 'N/A'} ({result.get('href') or '-'})\nÖzet:", result.get("body") or "")
+
+        total_sentences = sum(len(sentences) for _, sentences, _ in documents)
+        context = self.render(documents)
+        compressed = self.count_tokens(context) > self.budget
+        if compressed:
+            flat = [(i, j, sentence) for i, (_, sentences, _) in enumerate(documents) for j, sentence in enumerate(sentences)]
+            query_vector = self.indexer.query_vector(query)
+            # Pasaj cümleleri önbellekten; web özetleri zamanla değiştiği için her seferinde kodlanır.
+            tables = [self.document_vectors(*source) if source else None for _, _, source in documents]
+            uncached = [k for k, (i, _, _) in enumerate(flat) if tables[i] is None]
+            encoded = dict(zip(uncached, self.indexer.text_vectors(flat[k][2] for k in uncached))) if uncached else {}
+            vectors = np.array([encoded[k] if tables[i] is None else tables[i][sentence]
+                                for k, (i, _, sentence) in enumerate(flat)])
+            scores = vectors @ query_vector / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector) + 1e-12)
+            used = sum(self.count_tokens(header) + 3 for header, _, _ in documents)
+            chosen = set()
+            for k in np.argsort(-scores):
+                i, j, sentence = flat[k]
+                tokens = self.count_tokens(sentence) + 1
+                if used + tokens <= self.budget:
+                    chosen.add((i, j))
+                    used += tokens
+            documents = [
+                (header, [sentence for j, sentence in enumerate(sentences) if (i, j) in chosen], source)
+                for i, (header, sentences, source) in enumerate(documents)
+            ]
+            documents = [document for document in documents if document[1]]
+            context = self.render(documents)
+
+        return context, {
+            "tokens": self.count_tokens(context),
+            "budget": self.budget,
+            "documents": len(documents),
+            "web": sum(header.startswith("Web: ") for header, _, _ in documents),
+            "sentences": sum(len(sentences) for _, sentences, _ in documents),
+            "total_sentences": total_sentences,
+            "compressed": compressed,
+        }
+
+#########################################
+# Embedding Indexer'ı Yükleme veya Oluşturma #
+#########################################
+
+# İndeks dizini servis ve çevrimdışı oluşturma (pipeline/ingest.py) için ortaktır.
+INDEX_DIR = os.environ.get("COACH_INDEX_DIR", "/data/Workspace/balkan/leadership_coach/indexes")
+DATA_FILE = os.environ.get("COACH_DATA_FILE", "transcriptions-no-cut.json")
+
+# GPU seçimi ve isteğe bağlı CPU sorgu kodlayıcısı (query_encoder.py ile dışa aktarılmış dizin
+# ya da torch int8 için model adı). CPU sunucularında COACH_CUDA_DEVICE="" verilebilir.
+CUDA_DEVICE = os.environ.get("COACH_CUDA_DEVICE", "1")
+# Sıkıştırılmış vektör indeksi: VECTOR_FORMAT = fp16 | int8 | pq (boşsa float32),
+# VECTOR_RESCORE > 0 ise adaylar tam vektörlerle yeniden puanlanır (aday çarpanı).
+VECTOR_FORMAT = os.environ.get("VECTOR_FORMAT") or None
+VECTOR_RESCORE = int(os.environ.get("VECTOR_RESCORE", "0"))
+# PQ alt nicemleyici sayısı; vektör boyutunu (bge-m3: 1024) tam bölmelidir.
+VECTOR_PQ_SUBQUANTIZERS = int(os.environ.get("VECTOR_PQ_SUBQUANTIZERS", "64"))
+QUERY_ENCODER = os.environ.get("QUERY_ENCODER")
+QUERY_ENCODER_BACKEND = os.environ.get("QUERY_ENCODER_BACKEND")
+
+def create_indexer(query_encoder=None):
+    """
+    Servis ayarlarıyla bir EmbeddingIndexer oluşturur. pipeline/ingest.py de bunu kullanır; böylece
+    çevrimdışı oluşturulan indeksin manifest'i (ve dizin adı) servisin arayacağıyla aynıdır.
+    """
+    return EmbeddingIndexer(model_name="BAAI/bge-m3", cuda_device=CUDA_DEVICE, chunk_tokens=256,
+                            query_encoder=query_encoder, vector_format=VECTOR_FORMAT,
+                            pq_subquantizers=VECTOR_PQ_SUBQUANTIZERS, rescore_factor=VECTOR_RESCORE)
+
+def load_indexer(query_encoder=QUERY_ENCODER, query_encoder_backend=QUERY_ENCODER_BACKEND):
+    encoder = None
+    if query_encoder:
+        from query_encoder import QueryEncoder
+
+        print("Sorgu kodlayıcı yükleniyor: " + query_encoder)
+        encoder = QueryEncoder(query_encoder, backend=query_encoder_backend)
+    indexer = create_indexer(encoder)
+    indexer.load_data(DATA_FILE)
+    indexer.prepare_documents()
+    index_file_path = indexer.index_path(INDEX_DIR)
+
+    last_good_path = None if os.path.exists(index_file_path) else indexer.latest_index_path(INDEX_DIR)
+    # Son geçerli indeksin sonuçları, yeni derlemden değil o indeksle kaydedilen kayıtlardan çözülür
+    # (pasaj numaraları değişmiş olabilir).
+    last_good_records = indexer.load_records(last_good_path) if last_good_path else None
+
+    if os.path.exists(index_file_path):
+        print("Önceden oluşturulmuş indeks yükleniyor: " + index_file_path)
+        indexer.load_index(index_file_path)
+    elif last_good_records is not None:
+        # Derlem veya ayarlar değişti: son geçerli indeksle hizmet verip yenisini arka planda oluştur.
+        print("İndeks güncel değil. Son geçerli indeks kullanılıyor, yeni indeks arka planda oluşturuluyor: "
+              + last_good_path)
+        indexer.load_index(last_good_path, records=last_good_records)
+        indexer.rebuild_in_background(directory=INDEX_DIR)
+    else:
+        if last_good_path:
+            print("Son geçerli indeksin kayıt tablosu yok; güncel indeks şimdi oluşturuluyor: " + last_good_path)
+        print("İndeks dosyası bulunamadı. Dokümanlar indeksleniyor...")
+        embeddings, file_path = indexer.build_index(INDEX_DIR)
+        indexer.publish(indexer.documents.records, embeddings, os.path.basename(file_path))
+        print("İndeks kaydedildi: " + file_path)
+    return indexer
+
+#########################################
+# HTTP Servisi                          #
+#########################################
+
+# Arama isteklerini birleştirme: en uzun bekleme (ms) ve en büyük batch boyutu.
+SEARCH_BATCH_WAIT_MS = float(os.environ.get("SEARCH_BATCH_WAIT_MS", "5"))
+SEARCH_BATCH_SIZE = int(os.environ.get("SEARCH_BATCH_SIZE", "32"))
+
+def result_id(result):
+    # txtai sonuçları içerik veritabanı açıksa dict, kapalıysa (id, skor) demetidir.
+    return result.get("id") if isinstance(result, dict) else result[0]
+
+def result_score(result):
+    return float(result.get("score") if isinstance(result, dict) else result[1])
+
+class QueryBatcher:
+    """
+    Eş zamanlı gelen arama isteklerini birleştirir: ilk istekten sonra en fazla max_wait_ms
+    boyunca (ya da max_batch_size dolana kadar) gelen sorgular tek bir batch_search çağrısında
+    kodlanıp aranır ve sonuçlar bekleyen isteklere dağıtılır.
+    """
+
+    def __init__(self, batch_search, executor, max_wait_ms=SEARCH_BATCH_WAIT_MS, max_batch_size=SEARCH_BATCH_SIZE):
+        # batch_search(queries, limit, weights, snapshot) -> her sorgu için sonuç listesi (EmbeddingIndexer.batch_search).
+        self.batch_search = batch_search
+        self.executor = executor
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.queue = None
+        self.task = None
+        # Toplanmakta olan (henüz başlatılmamış) batch; kapanışta bu istekler hatayla sonlandırılır.
+        self.collecting = []
+        # Süren toplu aramalar; olay döngüsü görevlere yalnızca zayıf referans tuttuğu için burada saklanır.
+        self.running = set()
+        self.stats = {"batches": 0, "queries": 0, "max_batch": 0}
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self.collect())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+        # Henüz başlatılmamış istekler (toplanan batch ve kuyruk) askıda kalmaz, hatayla sonlanır.
+        waiting = self.collecting
+        while self.queue is not None and not self.queue.empty():
+            waiting.append(self.queue.get_nowait())
+        self.collecting = []
+        for item in waiting:
+            if not item[2].done():
+                item[2].set_exception(RuntimeError("Arama servisi kapatılıyor."))
+        # Başlamış aramalar tamamlanır; bekleyen istekler sonuçlarını alır.
+        if self.running:
+            await asyncio.gather(*self.running, return_exceptions=True)
+
+    async def search(self, query, limit=3, weights=None, snapshot=None):
+        if self.task is None or self.task.done():
+            raise RuntimeError("Arama servisi çalışmıyor.")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, (limit, weights, snapshot), future))
+        return await future
+
+    async def collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.collecting = batch = []
+            batch.append(await self.queue.get())
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.stats["batches"] += 1
+            self.stats["queries"] += len(batch)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            # batchsearch tek limit/ağırlık aldığı ve tek bir indeks görüntüsünde aradığı için
+            # sorgular bu parametrelere göre gruplanır.
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for params, items in groups.items():
+                # Toplu arama sürerken sonraki batch toplanmaya devam eder.
+                task = asyncio.create_task(self.run(items, params))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+            self.collecting = []
+
+    async def run(self, items, params):
+        queries = [item[0] for item in items]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.batch_search, queries, *params)
+        except Exception as e:
+            for item in items:
+                if not item[2].done():
+                    item[2].set_exception(e)
+            return
+        for item, result in zip(items, results):
+            # İstemci bağlantıyı kapattıysa future iptal edilmiş olabilir.
+            if not item[2].done():
+                item[2].set_result(result)
+
+class CoachService:
+    """
+    Modelleri süreç başına bir kez yükler ve HTTP uç noktalarını sunar. Servis hemen dinlemeye
+    başlar; modeller açılışta arka plan thread'lerinde yüklenir ve henüz hazır olmayan bir modele
+    gelen istek yüklemenin bitmesini bekler. Bloklayan model çağrıları thread havuzlarında çalışır;
+    olay döngüsü yalnızca G/Ç ve akışı yönetir.
+    """
+
+    def __init__(self, search_workers=4, batch_wait_ms=SEARCH_BATCH_WAIT_MS, batch_size=SEARCH_BATCH_SIZE,
+                 query_encoder=QUERY_ENCODER, query_encoder_backend=QUERY_ENCODER_BACKEND,
+                 rerank_model=RERANK_MODEL, rerank_candidates=RERANK_CANDIDATES, rerank_token_budget=RERANK_TOKEN_BUDGET,
+                 llm_tokenizer=LLM_TOKENIZER, context_token_budget=CONTEXT_TOKEN_BUDGET, web_backend=None,
+                 web_timeout=WEB_SEARCH_TIMEOUT, ollama_url=OLLAMA_URL, indexer=None):
+        # indexer verilirse (önceden yüklenmiş bir EmbeddingIndexer) load_indexer çağrılmaz.
+        self.indexer = LazyResource(
+            "indeks", (lambda: indexer) if indexer is not None else lambda: load_indexer(query_encoder, query_encoder_backend))
+        self.reranker = LazyResource("reranker", lambda: Reranker(rerank_model)) if rerank_model else None
+        self.rerank_candidates = rerank_candidates
+        self.rerank_token_budget = rerank_token_budget
+        # Reranker ve bağlam bütçeleri LLM tokenizer'ıyla sayılır.
+        self.count_tokens = LazyResource("llm-tokenizer", lambda: load_token_counter(llm_tokenizer))
+        self.context_builder = LazyResource(
+            "bağlam", lambda: ContextBuilder(self.indexer.get(), self.count_tokens.get(), context_token_budget))
+        self.speech = LazyResource("tts", SpeechSynthesizer)
+        self.llm = OllamaClient(base_url=ollama_url)
+        self.semantic_cache = SemanticAnswerCache()
+        self.web = WebSearcher(web_backend, timeout=web_timeout)
+        self.search_executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="search")
+        self.batcher = QueryBatcher(lambda *args: self.indexer.get().batch_search(*args), self.search_executor,
+                                    batch_wait_ms, batch_size)
+        # VITS ve cross-encoder çağrıları kendi tek işçilerinde sıralanır.
+        self.tts_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")
+        self.rerank_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        # Bağlam sıkıştırması cümleleri kodlar; arama işçilerini meşgul etmemesi için ayrı çalışır.
+        self.context_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context")
+
+    async def run(self, executor, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+    async def resource(self, resource):
+        """
+        Kaynağı döndürür; henüz yükleniyorsa olay döngüsünü bloklamadan bekler.
+        """
+        return resource.value if resource.loaded else await self.run(None, resource.get)
+
+    def resources(self):
+        return [resource for resource in (self.indexer, self.count_tokens, self.reranker, self.speech)
+                if resource is not None]
+
+    async def retrieve(self, query, limit, weights, snapshot):
+        """
+        Aramayı isteğin okuduğu indeks görüntüsünde yapar ve [(id, skor)] döndürür. Reranker varsa
+        hybrid arama daha geniş bir aday kümesi getirir, cross-encoder yeniden puanlar ve en iyi limit
+        pasaj token bütçesiyle seçilir.
+        """
+        if self.reranker is None:
+            results = await self.batcher.search(query, limit, weights, snapshot)
+            return [(result_id(result), result_score(result)) for result in results]
+        results = await self.batcher.search(query, max(limit, self.rerank_candidates), weights, snapshot)
+        return await self.run(self.rerank_executor, self.rerank, query, results, limit, snapshot)
+
+    def rerank(self, query, results, limit, snapshot):
+        count_tokens = self.count_tokens.get()
+        query = normalize_query(query)
+        index_version = snapshot.version
+        candidates = [(result_id(result), snapshot.records.get(result_id(result))) for result in results]
+        candidates = [(doc_id, record) for doc_id, record in candidates if record is not None]
+        scores = self.reranker.get().score(query, [f"{record.file_title}\n{record.transcription}" for _, record in candidates],
+                                           [(query, doc_id, index_version) for doc_id, _ in candidates])
+        selected, used = [], 0
+        for (doc_id, record), score in sorted(zip(candidates, scores), key=lambda item: item[1], reverse=True):
+            if len(selected) >= limit:
+                break
+            tokens = count_tokens(record.transcription)
+            # En iyi pasaj her zaman alınır; sonrakiler yalnızca bütçeye sığarsa eklenir.
+            if selected and used + tokens > self.rerank_token_budget:
+                continue
+            selected.append((doc_id, score))
+            used += tokens
+        return selected
+
+    @staticmethod
+    async def read_json(request):
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise web.HTTPBadRequest(text="Geçersiz JSON gövdesi.")
+        if not isinstance(body, dict) or not str(body.get("query", body.get("text", ""))).strip():
+            raise web.HTTPBadRequest(text="Boş istek.")
+        return body
+
+    @staticmethod
+    def search_params(body):
+        try:
+            limit = int(body.get("limit") or 3)
+            weights = float(body["weights"]) if body.get("weights") is not None else None
+        except (TypeError, ValueError):
+            raise web.HTTPBadRequest(text="Geçersiz limit veya ağırlık.")
+        return limit, weights
+
+    def web_params(self, body):
+        return int(body.get("web_max_results") or WEB_SEARCH_MAX_RESULTS)
+
+    async def search(self, request):
+        """
+        Hybrid arama yapar. "web": true verilirse web araması aynı anda, zaman aşımı bütçesiyle çalışır
+        ve sonuçları "web" alanında döner.
+        """
+        body = await self.read_json(request)
+        limit, weights = self.search_params(body)
+        indexer = await self.resource(self.indexer)
+        # Arama, kayıtlar ve sürüm aynı indeks görüntüsünden okunur (arka planda yeni indekse geçilse bile).
+        snapshot = indexer.snapshot
+        if body.get("web"):
+            results, (web_results, web_error) = await asyncio.gather(
+                self.retrieve(body["query"], limit, weights, snapshot),
+                self.web.search(body["query"], self.web_params(body)))
+        else:
+            results = await self.retrieve(body["query"], limit, weights, snapshot)
+        payload = []
+        for doc_id, score in results:
+            record = snapshot.records.get(doc_id)
+            payload.append({
+                "id": doc_id,
+                "score": score,
+                "record": None if record is None else {
+                    "file_title": record.file_title, "source": record.source,
+                    "transcription": record.transcription,
+                    "start": record.start, "end": record.end, "unit": record.unit,
+                },
+            })
+        response = {"results": payload, "index_version": snapshot.version,
+                    "reranked": self.reranker is not None, "cache_stats": indexer.cache_stats()}
+        if body.get("web"):
+            response["web"] = {"results": web_results, "error": web_error}
+        return web.json_response(response)
+
+    async def answer(self, request):
+        """
+        Yanıtı NDJSON olarak akıtır: LLM çağrılırsa ilk satır {"context": bağlam istatistikleri},
+        sonraki her satır {"response": token}, son satır {"done": true, "cache": null|"semantic", "score", "error"}.
+        "web": true verilirse web sonuçları (çoğunlukla /search'ün önbelleğe aldığı) bağlama eklenir.
+        İstemci bağlantıyı kapatırsa Ollama isteği de iptal edilir.
+        """
+        body = await self.read_json(request)
+        query_text = body["query"]
+        ids = body.get("ids")
+        web_results = []
+        indexer = await self.resource(self.indexer)
+        snapshot = indexer.snapshot
+        if ids is None:
+            if body.get("web"):
+                retrieved, (web_results, _) = await asyncio.gather(
+                    self.retrieve(query_text, *self.search_params(body), snapshot),
+                    self.web.search(query_text, self.web_params(body)))
+            else:
+                retrieved = await self.retrieve(query_text, *self.search_params(body), snapshot)
+            ids = [doc_id for doc_id, _ in retrieved]
+        elif not isinstance(ids, list):
+            raise web.HTTPBadRequest(text="ids bir liste olmalı.")
+        elif body.get("web"):
+            web_results, _ = await self.web.search(query_text, self.web_params(body))
+        index_version = snapshot.version
+        doc_set = frozenset(ids)
+        query_vector = await self.run(self.search_executor, indexer.query_vector, query_text)
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson; charset=utf-8"})
+        await response.prepare(request)
+
+        async def send(chunk):
+            await response.write((json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        # Anlamsal önbellek: benzer bir soru aynı dokümanlarla daha önce yanıtlandıysa LLM atlanır.
+        # Web sonuçları zamanla değiştiği için onları içeren yanıtlar önbelleğe girmez.
+        cached = None if web_results else self.semantic_cache.lookup(query_vector, doc_set, index_version)
+        try:
+            if cached is not None:
+                await send({"response": cached["answer"]})
+                await send({"done": True, "cache": "semantic", "score": cached["score"]})
+            else:
+                context_builder = await self.resource(self.context_builder)
+                context, context_stats = await self.run(self.context_executor, context_builder.build, query_text, ids,
+                                                        web_results, snapshot)
+                await send({"context": context_stats})
+                tokens = []
+                error = None
+                try:
+                    # aclosing: akış nasıl biterse bitsin (istemcinin kopması, iptal) generator kapatılır,
+                    # Ollama bağlantısı kesilir ve üretim durur.
+                    async with contextlib.aclosing(self.llm.generate_stream(build_prompt(context, query_text))) as stream:
+                        async for token in stream:
+                            tokens.append(token)
+                            await send({"response": token})
+                except ConnectionResetError:
+                    # aiohttp'nin ClientConnectionResetError'u aynı zamanda ClientError'dur; Ollama hatası sayılmaz.
+                    raise
+                except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+                    error = str(e) or type(e).__name__
+                # Yalnızca hatasız tamamlanan yanıtlar önbelleğe yazılır.
+                if error is None and not web_results:
+                    self.semantic_cache.store(query_vector, doc_set, index_version, "".join(tokens).strip())
+                await send({"done": True, "cache": None, "error": error})
+            await response.write_eof()
+        except ConnectionResetError:
+            # İstemci bağlantıyı kapattı: üretim durduruldu, yarım yanıt önbelleğe yazılmadı.
+            pass
+        return response
+
+    async def tts(self, request):
+        body = await self.read_json(request)
+        speech = await self.resource(self.speech)
+        wav = await self.run(self.tts_executor, speech.synthesize_sentence, body["text"].strip())
+        if wav is None:
+            return web.Response(status=204)
+        return web.Response(body=wav, content_type="audio/wav")
+
+    async def web_search(self, request):
+        body = await self.read_json(request)
+        results, error = await self.web.search(body["query"], int(body.get("max_results") or WEB_SEARCH_MAX_RESULTS))
+        return web.json_response({"results": results, "error": error})
+
+    async def health(self, request):
+        """
+        Canlılık: servis her zaman yanıt verir; hangi modellerin hazır olduğunu, yükleme ve
+        arka plan indeks oluşturma hatalarını ve başlangıç fazlarının sürelerini raporlar.
+        """
+        ready = {resource.name: resource.loaded for resource in self.resources()}
+        errors = {resource.name: resource.error for resource in self.resources() if resource.error}
+        indexer = self.indexer.value if self.indexer.loaded else None
+        rebuild = {
+            "running": bool(indexer and indexer.rebuild_thread and indexer.rebuild_thread.is_alive()),
+            "error": indexer.rebuild_error if indexer else None,
+        }
+        return web.json_response({
+            "status": "degraded" if errors or rebuild["error"] else "ok" if all(ready.values()) else "starting",
+            "ready": ready,
+            "errors": errors,
+            "index_version": indexer.index_version if indexer else None,
+            "index_rebuild": rebuild,
+            "startup": STARTUP_TIMINGS,
+            "batch_stats": self.batcher.stats,
+            "web_stats": self.web.stats,
+        })
+
+    async def ready(self, request):
+        """
+        Hazırlık: tüm modeller yüklenene kadar 503 döner (ör. Kubernetes readinessProbe).
+        """
+        if all(resource.loaded for resource in self.resources()):
+            return web.json_response({"status": "ready"})
+        return web.json_response({"status": "starting"}, status=503)
+
+    async def on_startup(self, app):
+        log_phase("http", time.perf_counter() - PROCESS_START)
+        await self.llm.start()
+        await self.batcher.start()
+        # Modeller arka planda yüklenirken servis istek kabul eder; ilk istek ilgili modeli bekler.
+        for resource in self.resources():
+            resource.warm_up()
+        app["llm_warm_up"] = asyncio.create_task(self.llm.warm_up())
+
+    async def on_cleanup(self, app):
+        await self.llm.close()
+        await self.batcher.close()
+        self.search_executor.shutdown(wait=False)
+        self.tts_executor.shutdown(wait=False)
+        self.rerank_executor.shutdown(wait=False)
+        self.context_executor.shutdown(wait=False)
+        self.web.close()
+
+def create_app(service=None):
+    service = service if service is not None else CoachService()
+    app = web.Application()
+    app.add_routes([
+        web.post("/search", service.search),
+        web.post("/answer", service.answer),
+        web.post("/tts", service.tts),
+        web.post("/web", service.web_search),
+        web.get("/health", service.health),
+        web.get("/ready", service.ready),
+    ])
+    app.on_startup.append(service.on_startup)
+    app.on_cleanup.append(service.on_cleanup)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Leadership Coach model servisi")
+    parser.add_argument("--host", default=os.environ.get("COACH_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("COACH_PORT", "8000")))
+    parser.add_argument("--batch-wait-ms", type=float, default=SEARCH_BATCH_WAIT_MS,
+                        help="Eş zamanlı sorguların tek batch'te toplanması için en uzun bekleme (ms).")
+    parser.add_argument("--batch-size", type=int, default=SEARCH_BATCH_SIZE,
+                        help="Tek batch'te kodlanacak en fazla sorgu sayısı.")
+    parser.add_argument("--query-encoder", default=QUERY_ENCODER,
+                        help="CPU sorgu kodlayıcısı: query_encoder.py ile dışa aktarılmış dizin ya da model adı.")
+    parser.add_argument("--query-encoder-backend", choices=["onnx", "torch-int8"], default=QUERY_ENCODER_BACKEND)
+    parser.add_argument("--rerank-model", default=RERANK_MODEL, help="Cross-encoder modeli; boş verilirse kapalı.")
+    parser.add_argument("--rerank-candidates", type=int, default=RERANK_CANDIDATES,
+                        help="Yeniden puanlanacak hybrid arama adayı sayısı.")
+    parser.add_argument("--rerank-token-budget", type=int, default=RERANK_TOKEN_BUDGET,
+                        help="Seçilen pasajların toplam token bütçesi.")
+    parser.add_argument("--llm-tokenizer", default=LLM_TOKENIZER, help="Token sayımı için LLM tokenizer'ı.")
+    parser.add_argument("--context-token-budget", type=int, default=CONTEXT_TOKEN_BUDGET,
+                        help="LLM bağlamının en fazla token sayısı.")
+    parser.add_argument("--web-timeout", type=float, default=WEB_SEARCH_TIMEOUT,
+                        help="Web araması için bekleme bütçesi (saniye).")
+    parser.add_argument("--web-fixtures", default=WEB_SEARCH_FIXTURES,
+                        help="DuckDuckGo yerine sabit sonuçlar döndüren JSON dosyası (testler için).")
+    args = parser.parse_args()
+    service = CoachService(batch_wait_ms=args.batch_wait_ms, batch_size=args.batch_size,
+                           query_encoder=args.query_encoder, query_encoder_backend=args.query_encoder_backend,
+                           rerank_model=args.rerank_model, rerank_candidates=args.rerank_candidates,
+                           rerank_token_budget=args.rerank_token_budget, llm_tokenizer=args.llm_tokenizer,
+                           context_token_budget=args.context_token_budget,
+                           web_backend=StaticSearchBackend(args.web_fixtures) if args.web_fixtures else None,
+                           web_timeout=args.web_timeout)
+    web.run_app(create_app(service), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Akan LLM yanıtı için cümle bazlı ses üretimi ve sıralı oynatma.
+
+StreamingTTS cümleleri yanıt üretilirken sese çevirir; SequentialPlayer hazır olan sesleri
+tek bir ses öğesinde sırayla ve otomatik çalar. Streamlit'e bağlı değildir (ses öğesi
+dışarıdan verilir), böylece app.py dışında da kullanılabilir ve test edilebilir.
+"""
+import io
+import re
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Akan metinde cümle sonu: noktalama + boşluk ya da satır sonu.
+SENTENCE_END_PATTERN = re.compile(r"[.!?…]+(?=\s)|\n+")
+
+def concatenate_wavs(clips):
+    """
+    Aynı örnekleme hızındaki WAV baytlarını tek bir WAV dosyasında birleştirir.
+    """
+    # Yalnızca ses oluşturulduğunda gerekir; arayüzün açılışını yavaşlatmaması için burada içe aktarılır.
+    import numpy as np
+    import scipy.io.wavfile
+
+    decoded = [scipy.io.wavfile.read(io.BytesIO(clip)) for clip in clips]
+    wav_buffer = io.BytesIO()
+    scipy.io.wavfile.write(wav_buffer, rate=decoded[0][0], data=np.concatenate([samples for _, samples in decoded]))
+    return wav_buffer.getvalue()
+
+class StreamingTTS:
+    """
+    LLM'den gelen token'ları cümlelere böler ve her cümleyi, üretim devam ederken
+    bir işçi thread'inde sese çevirir. Sesler (WAV baytları) cümle sırasıyla alınır.
+    """
+
+    def __init__(self, synthesize, min_chars=20):
+        self.synthesize = synthesize
+        # Çok kısa parçalar bir sonraki cümleyle birleştirilir.
+        self.min_chars = min_chars
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")
+        self.buffer = ""
+        self.futures = []
+        self.clips = []
+        # Seslendirilemeyen cümlelerin hataları; metin akışı bu hatalardan etkilenmez.
+        self.errors = []
+
+    def feed(self, text):
+        """
+        Yeni token'ları ekler; tamamlanan cümleleri sentez kuyruğuna gönderir.
+        """
+        self.buffer += text
+        # Cümleler token sınırlarından bağımsız olarak aynı şekilde bölünür; böylece önbellekten
+        # tek parça gelen bir yanıt da servisteki cümle bazlı ses önbelleğine isabet eder.
+        while True:
+            end = next((match.end() for match in SENTENCE_END_PATTERN.finditer(self.buffer)
+                        if len(self.buffer[:match.end()].strip()) >= self.min_chars), None)
+            if end is None:
+                break
+            self.submit(self.buffer[:end])
+            self.buffer = self.buffer[end:]
+
+    def finish(self):
+        """
+        Kalan metni gönderir; yeni cümle kabul edilmez.
+        """
+        self.submit(self.buffer)
+        self.buffer = ""
+        self.executor.shutdown(wait=False)
+
+    def submit(self, sentence):
+        sentence = sentence.strip()
+        if sentence:
+            self.futures.append(self.executor.submit(self.synthesize, sentence))
+
+    def result(self, future):
+        """
+        Cümlenin sesini döndürür; sentez başarısızsa hatayı kaydeder ve None döner.
+        """
+        try:
+            return future.result()
+        except requests.RequestException as e:
+            self.errors.append(str(e))
+            return None
+
+    def ready(self):
+        """
+        Sırası gelmiş ve sentezi bitmiş cümle seslerini beklemeden döndürür.
+        """
+        while len(self.clips) < len(self.futures) and self.futures[len(self.clips)].done():
+            self.clips.append(self.result(self.futures[len(self.clips)]))
+            yield self.clips[-1]
+
+    def pending(self):
+        """
+        Sesi henüz alınmamış cümle varsa True döner.
+        """
+        return len(self.clips) < len(self.futures)
+
+    def remaining(self):
+        """
+        Kalan cümle seslerini sentezleri bittikçe sırayla döndürür.
+        """
+        while len(self.clips) < len(self.futures):
+            self.clips.append(self.result(self.futures[len(self.clips)]))
+            yield self.clips[-1]
+
+def wav_duration(clip):
+    """
+    PCM WAV baytlarının süresini (saniye) döndürür.
+    """
+    with wave.open(io.BytesIO(clip), "rb") as wav:
+        return wav.getnframes() / wav.getframerate()
+
+# Tarayıcının bir klibi yükleyip çalmaya başlaması için bırakılan pay (saniye).
+PLAYBACK_MARGIN = 0.3
+
+class SequentialPlayer:
+    """
+    Cümle seslerini tek bir ses öğesinde (ör. st.empty()) sırayla ve otomatik çalar. Streamlit,
+    tarayıcıdaki oynatmanın bittiğini bildirmediği için her klibin süresi WAV başlığından okunur;
+    sıradaki klip, çalan klibin süresi dolunca aynı öğeye yazılır.
+    """
+
+    def __init__(self, slot, clock=time.monotonic, sleep=time.sleep, margin=PLAYBACK_MARGIN):
+        self.slot = slot
+        self.clock = clock
+        self.sleep = sleep
+        self.margin = margin
+        self.queue = deque()
+        self.played = []
+        self.busy_until = 0.0
+
+    def add(self, clip):
+        """
+        Klibi sıraya ekler (None, seslendirilemeyen cümledir) ve sırası geldiyse başlatır.
+        """
+        if clip is not None:
+            self.queue.append(clip)
+        self.advance()
+
+    def advance(self):
+        """
+        Çalan klip bittiyse sıradakini başlatır; beklemez.
+        """
+        if self.queue and self.clock() >= self.busy_until:
+            clip = self.queue.popleft()
+            self.slot.audio(clip, format="audio/wav", autoplay=True)
+            self.played.append(clip)
+            self.busy_until = self.clock() + wav_duration(clip) + self.margin
+
+    def drain(self):
+        """
+        Sıradaki klipleri çalar ve son klip bitene kadar bekler.
+        """
+        while self.queue:
+            self.sleep(max(0.0, self.busy_until - self.clock()))
+            self.advance()
+        self.sleep(max(0.0, self.busy_until - self.clock()))
+
+    def follow(self, speech, poll=0.1):
+        """
+        StreamingTTS'teki kalan cümleleri sentezleri bittikçe sıraya ekler; sentez beklenirken
+        çalan klip bitince sıradaki başlatılır. Son klip bitene kadar döner.
+        """
+        while speech.pending():
+            for clip in speech.ready():
+                self.add(clip)
+            self.advance()
+            self.sleep(poll)
+        for clip in speech.ready():
+            self.add(clip)
+        self.drain()
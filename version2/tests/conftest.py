@@ -0,0 +1,5 @@
+import os
+import sys
+
+# server.py ve app.py, version2 dizininden çalıştırılan betiklerdir; testler onları aynı şekilde içe aktarır.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
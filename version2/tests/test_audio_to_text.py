@@ -0,0 +1,126 @@
+"""
+data/ transkripsiyon betiklerinin testleri: ses etkinliği tespiti (VAD) ve çıktı biçimi. Whisper
+yüklenmez; ffmpeg akışı yerine sentetik ses çerçeveleri, model yerine sahte çözümleme kullanılır.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+import audio_to_text
+import audio_to_text_no_cut
+import transcription
+
+SR = 16000
+
+def tone(seconds, amplitude=0.3):
+    t = np.arange(int(seconds * SR), dtype=np.float32) / SR
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+def silence(seconds):
+    return np.zeros(int(seconds * SR), dtype=np.float32)
+
+def make_transcriber(audio, frame_seconds=7):
+    """
+    Modeli yüklemeden, stream_mp3'ü verilen sesi parça parça döndüren bir transcriber oluşturur.
+    """
+    transcriber = object.__new__(audio_to_text.WhisperTranscriber)
+    transcriber.vad_threshold_db = -40
+    transcriber.vad_frame_ms = 30
+    transcriber.min_silence_seconds = 0.5
+    transcriber.min_speech_seconds = 0.25
+    transcriber.max_pause_seconds = 2.0
+    transcriber.max_window_seconds = 30
+
+    def stream_mp3(audio_path, frame_seconds=None):
+        step = int(frame_seconds * SR)
+        for start in range(0, len(audio), step):
+            yield torch.from_numpy(audio[start:start + step])
+
+    transcriber.stream_mp3 = stream_mp3
+    return transcriber
+
+##############################################
+# Ses Etkinliği Tespiti (VAD)                #
+##############################################
+
+def windows(audio):
+    return list(make_transcriber(audio).vad_chunks("sahte.mp3"))
+
+def test_vad_drops_silence_and_short_bursts():
+    audio = np.concatenate([silence(3), tone(0.1), silence(3), tone(2), silence(5)])
+    chunks = windows(audio)
+    assert len(chunks) == 1
+    start, end, chunk = chunks[0]
+    assert start == pytest.approx(6.1, abs=0.05)
+    assert end == pytest.approx(8.1, abs=0.05)
+    assert len(chunk) == int(round((end - start) * SR))
+
+def test_vad_packs_nearby_regions_and_splits_long_pauses():
+    # 1 s duraklamalı konuşmalar tek pencerede birleşir; 3 s duraklama (> max_pause) yeni pencere açar.
+    audio = np.concatenate([tone(4), silence(1), tone(4), silence(3), tone(4)])
+    chunks = windows(audio)
+    assert [(round(start, 1), round(end, 1)) for start, end, _ in chunks] == [(0.0, 9.0), (12.0, 16.0)]
+
+def test_vad_windows_never_exceed_max_window():
+    # Kesintisiz 75 s konuşma ve 25 s'lik bölgeler 30 s'yi aşmayacak şekilde paketlenir.
+    audio = np.concatenate([tone(75), silence(1)] + [tone(12), silence(0.8)] * 5)
+    chunks = windows(audio)
+    for start, end, chunk in chunks:
+        assert end - start <= 30 + 1e-6
+        assert len(chunk) <= 30 * SR
+    # Zaman sırası korunur ve pencereler çakışmaz.
+    for (_, previous_end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        assert start >= previous_end
+    speech = sum(end - start for start, end, _ in chunks)
+    assert speech == pytest.approx(75 + 5 * 12 + 4 * 0.8, abs=1.0)
+
+
+##############################################
+# Çıktı Biçimi ve Checkpoint                 #
+##############################################
+
+def fake_transcriber(cls, windows, batch_size=2):
+    """
+    Modeli yüklemeden, verilen (başlangıç, bitiş) pencerelerini "metin <başlangıç>" olarak yazan bir transcriber.
+    """
+    transcriber = object.__new__(cls)
+    transcriber.batch_size = batch_size
+    transcriber.timed_chunks = lambda audio_path: (
+        (start, end, torch.tensor([start])) for start, end in windows[audio_path]
+    )
+    transcriber.transcribe_batch = lambda chunks: [f"metin {chunk[0].item():g}" for chunk in chunks]
+    return transcriber
+
+def test_no_cut_output_keeps_segment_times(tmp_path):
+    windows = {"a.mp3": [(1.5, 9.25), (12.0, 20.0)], "b.mp3": [(0.0, 3.0)]}
+    transcriber = fake_transcriber(audio_to_text_no_cut.WhisperTranscriber, windows)
+    finished = {}
+    outputs = transcriber.transcribe_files(list(windows), on_file_done=finished.__setitem__)
+
+    assert outputs == finished
+    assert outputs["a.mp3"] == {
+        "transcription": "metin 1.5 metin 12",
+        "segments": [{"start": 1.5, "end": 9.25, "text": "metin 1.5"}, {"start": 12.0, "end": 20.0, "text": "metin 12"}],
+    }
+
+    # Zamanlar checkpoint'ten çıktı JSON'una taşınır.
+    checkpoint_path = tmp_path / "out.checkpoint.jsonl"
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        transcription.append_checkpoint(checkpoint, "audio/a.mp3", "hash-a", outputs["a.mp3"])
+    done = transcription.read_checkpoint(checkpoint_path)
+    output_json = tmp_path / "out.json"
+    transcription.write_results(["audio/a.mp3"], {"audio/a.mp3": "hash-a"}, done, output_json)
+    saved = json.loads(output_json.read_text(encoding="utf-8"))
+    assert saved == {"a.mp3": {"file_title": "a", **outputs["a.mp3"]}}
+
+def test_cut_output_prefixes_segment_times():
+    transcriber = fake_transcriber(audio_to_text.WhisperTranscriber, {"a.mp3": [(1.5, 9.25)]})
+    assert transcriber.transcribe_mp3("a.mp3") == {"transcription": ["[1.50s - 9.25s] metin 1.5"]}
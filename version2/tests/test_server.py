@@ -0,0 +1,799 @@
+"""
+server.py için model gerektirmeyen testler. Ollama yerine yerel bir aiohttp sahte sunucusu kullanılır.
+
+Çalıştırma (version2 dizininde):
+    python -m pytest -q tests
+"""
+import asyncio
+import json
+import os
+import re
+import zlib
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("cachetools")
+pytest.importorskip("tqdm")
+
+from aiohttp import web
+
+import server
+
+##############################################
+# Sahte Ollama Sunucusu                       #
+##############################################
+
+class FakeOllama:
+    """
+    /api/generate için NDJSON akıtan sahte sunucu. mode: "ok", "error" (akış içinde hata satırı),
+    "http" (500 yanıtı) ya da "slow" (istemci kapatana kadar token akıtır).
+    """
+
+    def __init__(self, mode="ok", tokens=("Mer", "haba", "!")):
+        self.mode = mode
+        self.tokens = tokens
+        self.requests = []
+        self.disconnected = asyncio.Event()
+        self.runner = None
+        self.url = None
+
+    async def generate(self, request):
+        self.requests.append(await request.json())
+        if self.mode == "http":
+            return web.json_response({"error": "model yok"}, status=500)
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+
+        async def send(chunk):
+            await response.write((json.dumps(chunk) + "\n").encode("utf-8"))
+
+        try:
+            if self.mode == "slow":
+                for i in range(1000):
+                    await send({"response": f"t{i} ", "done": False})
+                    await asyncio.sleep(0.01)
+            else:
+                for token in self.tokens:
+                    await send({"response": token, "done": False})
+                if self.mode == "error":
+                    await send({"error": "bellek yetersiz"})
+                else:
+                    await send({"response": "", "done": True})
+                    # done sonrası satırlar okunmamalı.
+                    await send({"response": "fazla", "done": False})
+        except ConnectionResetError:
+            self.disconnected.set()
+        except asyncio.CancelledError:
+            self.disconnected.set()
+            raise
+        return response
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/api/generate", self.generate)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.runner.cleanup()
+
+async def collect(client, prompt="soru"):
+    return [token async for token in client.generate_stream(prompt)]
+
+##############################################
+# Sahte txtai Embeddings                      #
+##############################################
+
+class FakeEmbeddings:
+    """
+    EmbeddingIndexer'a embeddings_factory olarak verilen, bellekte çalışan sahte txtai Embeddings.
+    Vektörler metin uzunluğundan üretilir; arama, sorgu kelimelerini içeren dokümanları döndürür.
+    """
+
+    def __init__(self, path=None, hybrid=True, content=False, method=None):
+        self.config = {"path": path, "hybrid": hybrid, "content": content, "method": method}
+        self.documents = {}
+        self.encoded = []
+        self.upserted = []
+        self.deleted = []
+
+    def batchtransform(self, documents, category=None, index=None):
+        texts = [document[1] if isinstance(document, tuple) else document for document in documents]
+        self.encoded.extend(texts)
+        return server.np.array([[float(len(text)), 1.0] for text in texts])
+
+    def index(self, documents):
+        self.documents = {doc_id: text for doc_id, text, _ in documents}
+
+    def upsert(self, documents):
+        for doc_id, text, _ in documents:
+            self.upserted.append(doc_id)
+            self.documents[doc_id] = text
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self.deleted.append(doc_id)
+            self.documents.pop(doc_id, None)
+
+    def batchsearch(self, queries, limit=3, weights=None):
+        results = []
+        for query in queries:
+            words = set(query.lower().split())
+            scores = [(doc_id, len(words & set(text.lower().split())) / len(words))
+                      for doc_id, text in self.documents.items()]
+            results.append(sorted((score for score in scores if score[1] > 0), key=lambda score: -score[1])[:limit])
+        return results
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "config.json"), "w", encoding="utf-8") as f:
+            json.dump({**self.config, "documents": self.documents}, f, ensure_ascii=False)
+
+    def load(self, path, config=None):
+        with open(os.path.join(path, "config.json"), "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        self.documents = saved.pop("documents")
+        self.config = saved
+
+def make_indexer(embeddings_factory=FakeEmbeddings, **kwargs):
+    """
+    Model yüklemeden, FakeEmbeddings ile çalışan gerçek bir EmbeddingIndexer oluşturur.
+    """
+    return server.EmbeddingIndexer(model_name="test/fake-model", embeddings_factory=embeddings_factory, **kwargs)
+
+def write_corpus(path, data):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+CORPUS = {
+    "a.mp3": {"file_title": "Liderlik", "transcription": "Liderlik bir yolculuktur."},
+    "b.mp3": {"file_title": "Ekip", "transcription": "Ekip güveni zamanla kazanılır."},
+}
+
+##############################################
+# OllamaClient (user-004)                     #
+##############################################
+
+def test_generate_stream_yields_tokens_until_done():
+    async def scenario():
+        async with FakeOllama() as ollama:
+            client = server.OllamaClient(base_url=ollama.url, model="test-model")
+            await client.start()
+            try:
+                tokens = await collect(client)
+            finally:
+                await client.close()
+            return tokens, ollama.requests
+
+    tokens, requests = asyncio.run(scenario())
+    assert tokens == ["Mer", "haba", "!"]
+    assert requests == [{"model": "test-model", "prompt": "soru", "stream": True, "keep_alive": "30m"}]
+
+def test_generate_stream_raises_on_error_line():
+    async def scenario():
+        async with FakeOllama(mode="error") as ollama:
+            client = server.OllamaClient(base_url=ollama.url)
+            await client.start()
+            tokens = []
+            try:
+                with pytest.raises(RuntimeError, match="bellek yetersiz"):
+                    async for token in client.generate_stream("soru"):
+                        tokens.append(token)
+            finally:
+                await client.close()
+            return tokens
+
+    assert asyncio.run(scenario()) == ["Mer", "haba", "!"]
+
+def test_generate_stream_raises_on_http_error():
+    async def scenario():
+        async with FakeOllama(mode="http") as ollama:
+            client = server.OllamaClient(base_url=ollama.url)
+            await client.start()
+            try:
+                with pytest.raises(server.aiohttp.ClientResponseError):
+                    await collect(client)
+            finally:
+                await client.close()
+
+    asyncio.run(scenario())
+
+def test_generate_stream_close_disconnects_from_ollama():
+    async def scenario():
+        async with FakeOllama(mode="slow") as ollama:
+            client = server.OllamaClient(base_url=ollama.url)
+            await client.start()
+            try:
+                stream = client.generate_stream("soru")
+                first = [await stream.__anext__(), await stream.__anext__()]
+                # Generator'ı kapatmak bağlantıyı kapatır; sunucu akışı yazamaz hale gelir.
+                await stream.aclose()
+                await asyncio.wait_for(ollama.disconnected.wait(), timeout=5)
+            finally:
+                await client.close()
+            return first
+
+    assert asyncio.run(scenario()) == ["t0 ", "t1 "]
+
+def make_answer_indexer():
+    indexer = make_indexer()
+    indexer.publish({"a#0": server.DocumentRecord("A", "a", "Liderlik bir yolculuktur.")}, indexer.embeddings, "v1")
+    return indexer
+
+async def serve(service, *routes):
+    app = web.Application()
+    for path in routes:
+        app.router.add_post(path, getattr(service, path.strip("/")))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+async def serve_answer(ollama):
+    service = server.CoachService(indexer=make_answer_indexer(), ollama_url=ollama.url, rerank_model="",
+                                  llm_tokenizer="")
+    await service.llm.start()
+    runner, url = await serve(service, "/answer")
+    return service, runner, url
+
+def test_answer_streams_and_caches_completed_answers():
+    async def scenario():
+        async with FakeOllama() as ollama:
+            service, runner, url = await serve_answer(ollama)
+            try:
+                async with server.aiohttp.ClientSession() as session:
+                    async with session.post(f"{url}/answer", json={"query": "Liderlik nedir?", "ids": ["a#0"]}) as response:
+                        lines = [json.loads(line) async for line in response.content if line.strip()]
+            finally:
+                await service.llm.close()
+                await runner.cleanup()
+            return service, lines
+
+    service, lines = asyncio.run(scenario())
+    assert lines[0]["context"]["documents"] == 1
+    assert [line["response"] for line in lines[1:-1]] == ["Mer", "haba", "!"]
+    assert lines[-1] == {"done": True, "cache": None, "error": None}
+    assert len(service.semantic_cache.entries) == 1
+
+def test_answer_stops_generation_when_client_disconnects(caplog):
+    async def scenario():
+        async with FakeOllama(mode="slow") as ollama:
+            service, runner, url = await serve_answer(ollama)
+            try:
+                async with server.aiohttp.ClientSession() as session:
+                    response = await session.post(f"{url}/answer", json={"query": "Liderlik nedir?", "ids": ["a#0"]})
+                    await response.content.readline()
+                    await response.content.readline()
+                    # İstemci yanıtın ortasında bağlantıyı kapatır.
+                    response.close()
+                    await asyncio.wait_for(ollama.disconnected.wait(), timeout=5)
+            finally:
+                await service.llm.close()
+                await runner.cleanup()
+            return service, ollama
+
+    with caplog.at_level("ERROR", logger="aiohttp.server"):
+        service, ollama = asyncio.run(scenario())
+    assert ollama.disconnected.is_set()
+    # Yarım yanıt önbelleğe yazılmaz ve istek işleyicisi hatasız biter.
+    assert not service.semantic_cache.entries
+    assert not [record for record in caplog.records if record.name == "aiohttp.server"]
+
+##############################################
+# Pasajlara Bölme (user-003)                  #
+##############################################
+
+def test_split_passages_char_offsets_point_into_source():
+    text = "  Birinci cümle burada. İkinci cümle de burada!  Üçüncü cümle?\nDördüncü cümle biter."
+    passages = server.split_passages(text, max_tokens=6, overlap_tokens=3)
+    assert len(passages) > 1
+    for passage in passages:
+        assert passage["unit"] == "char"
+        # Ofsetler kaynak metinde pasajın ilk ve son cümlesinin sınırlarıdır.
+        assert text[passage["start"]:passage["end"]].startswith(passage["text"].split(" ")[0])
+        assert text[passage["start"]:passage["end"]].endswith(passage["text"].split(" ")[-1])
+    assert passages[0]["start"] == 2
+    assert passages[-1]["end"] == len(text)
+
+def test_split_passages_respects_budget_and_overlap():
+    sentences = [f"Cümle {i} burada bitiyor." for i in range(10)]
+    passages = server.split_passages(" ".join(sentences), max_tokens=8, overlap_tokens=4)
+    for passage in passages:
+        assert len(passage["text"].split()) <= 8
+    # Ardışık pasajlar örtüşme bütçesine sığan son cümleyi paylaşır.
+    for previous, current in zip(passages, passages[1:]):
+        assert current["start"] < previous["end"]
+        assert previous["text"].endswith(current["text"][:len("Cümle 0 burada bitiyor.")])
+
+def test_split_passages_splits_long_sentence_into_word_windows():
+    text = " ".join(f"k{i}" for i in range(25)) + "."
+    passages = server.split_passages(text, max_tokens=10, overlap_tokens=0)
+    assert [len(passage["text"].split()) for passage in passages] == [10, 10, 5]
+    for passage in passages:
+        assert text[passage["start"]:passage["end"]] == passage["text"]
+
+def test_split_passages_uses_segment_times_for_lists():
+    segments = ["[0.00s - 4.50s] Merhaba. Hoş geldiniz.", "[4.50s - 9.00s] Liderlik nedir?", "zamansız segment"]
+    passages = server.split_passages(segments, max_tokens=3, overlap_tokens=0)
+    assert all(passage["unit"] == "s" for passage in passages)
+    assert passages[0] == {"text": "Merhaba. Hoş geldiniz.", "start": 0.0, "end": 4.5, "unit": "s"}
+    assert passages[1]["start"] == 4.5 and passages[1]["end"] == 9.0
+    # Zaman damgası olmayan segment, önceki segmentin bitişini kullanır.
+    assert passages[-1]["start"] == passages[-1]["end"] == 9.0
+
+##############################################
+# İndeks Kayıtları (user-012)                 #
+##############################################
+
+def test_records_round_trip_with_shared_sources(tmp_path):
+    transcription = "Birinci cümle. İkinci cümle."
+    records = {
+        "a#0": server.DocumentRecord("A", "a", transcription, 0, 14, "char"),
+        "a#1": server.DocumentRecord("A", "a", transcription, 15, 28, "char"),
+        "b#0": server.DocumentRecord("B", "b", "Segment metni.", 0.0, 4.5, "s"),
+        "c": server.DocumentRecord("C", "c", "Bölünmemiş transkript."),
+    }
+    server.EmbeddingIndexer.save_records(str(tmp_path), records)
+    saved = json.loads((tmp_path / server.RECORDS_FILE).read_text(encoding="utf-8"))
+    # Karakter ofsetli pasajların transkripti bir kez yazılır.
+    assert saved["sources"] == {"a": transcription}
+
+    loaded = server.EmbeddingIndexer.load_records(str(tmp_path))
+    assert list(loaded) == list(records)
+    for doc_id, record in records.items():
+        assert loaded[doc_id].tags() == record.tags()
+        assert loaded[doc_id].transcription == record.transcription
+    assert loaded["a#0"].text is loaded["a#1"].text
+
+def test_load_records_returns_none_without_file(tmp_path):
+    assert server.EmbeddingIndexer.load_records(str(tmp_path)) is None
+
+def test_search_reads_one_snapshot_while_new_index_is_published():
+    indexer = make_indexer()
+    old, new = FakeEmbeddings(), FakeEmbeddings()
+    old.documents = new.documents = {"a#0": "liderlik yolculuk"}
+    indexer.publish({"a#0": server.DocumentRecord("Eski", "a", "Eski pasaj.")}, old, "v1")
+    search = old.batchsearch
+
+    def batchsearch(queries, limit=3, weights=None):
+        # Arama sürerken arka plandaki yeniden oluşturma biter ve yeni indeks yayımlanır.
+        indexer.publish({"a#0": server.DocumentRecord("Yeni", "a", "Yeni pasaj.")}, new, "v2")
+        return search(queries, limit, weights)
+
+    old.batchsearch = batchsearch
+
+    async def scenario():
+        service = server.CoachService(indexer=indexer, rerank_model="", llm_tokenizer="", batch_wait_ms=1)
+        await service.batcher.start()
+        runner, url = await serve(service, "/search")
+        try:
+            bodies = []
+            async with server.aiohttp.ClientSession() as session:
+                for _ in range(2):
+                    async with session.post(f"{url}/search", json={"query": "liderlik"}) as response:
+                        bodies.append(await response.json())
+        finally:
+            await service.batcher.close()
+            await runner.cleanup()
+            service.search_executor.shutdown()
+        return bodies
+
+    first, second = asyncio.run(scenario())
+    # İlk istek başladığı indeksin kayıtları ve sürümüyle tamamlanır; sonraki istek yeni indeksi görür.
+    assert (first["index_version"], first["results"][0]["record"]["file_title"]) == ("v1", "Eski")
+    assert (second["index_version"], second["results"][0]["record"]["file_title"]) == ("v2", "Yeni")
+
+##############################################
+# Sorgu Vektörü, İndeks ve Önbellekler (user-014) #
+##############################################
+
+def test_query_vector_shares_cache_with_search_path():
+    indexer = make_indexer()
+    # txtai'nin arama yolu sorguları (None, sorgu, None) demetleriyle ve ek argümansız kodlar.
+    indexer.embeddings.batchtransform((None, query, None) for query in ["liderlik nedir"])
+    indexer.query_vector("  liderlik   nedir ")
+    indexer.embeddings.batchtransform(["liderlik nedir"], None, None)
+    assert indexer.embeddings.encoded == ["liderlik nedir"]
+    stats = indexer.cache_stats()
+    assert (stats["vector_hits"], stats["vector_misses"]) == (2, 1)
+
+def test_build_manifest_tracks_corpus_and_index_settings(tmp_path):
+    corpus = write_corpus(tmp_path / "a.json", CORPUS)
+    copy = write_corpus(tmp_path / "b.json", CORPUS)
+    changed = write_corpus(tmp_path / "c.json", {**CORPUS, "c.mp3": {"file_title": "C", "transcription": "Yeni."}})
+    indexer = make_indexer()
+    manifest = indexer.build_manifest(corpus)
+    # Aynı içerik farklı yolda aynı indekse karşılık gelir; içerik veya ayar değişince hash değişir.
+    assert indexer.manifest_hash(indexer.build_manifest(copy)) == indexer.manifest_hash(manifest)
+    assert indexer.build_manifest(changed)["corpus_sha256"] != manifest["corpus_sha256"]
+    assert make_indexer(chunk_tokens=64).manifest_hash(make_indexer(chunk_tokens=64).build_manifest(corpus)) != \
+        indexer.manifest_hash(manifest)
+    assert "vector_format" not in manifest
+    assert make_indexer(vector_format="int8").build_manifest(corpus)["vector_format"] == "int8"
+
+def test_latest_index_path_prefers_pointer_then_newest(tmp_path):
+    indexer = make_indexer()
+    assert indexer.latest_index_path(str(tmp_path / "yok")) is None
+    paths = []
+    for i, name in enumerate(["index_fake-model_old", "index_fake-model_new"]):
+        path = tmp_path / name
+        path.mkdir()
+        (path / "config.json").write_text("{}")
+        os.utime(path, (1000 + i, 1000 + i))
+        paths.append(str(path))
+    # Yarım kalmış (config.json'suz) ve başka modele ait dizinler dikkate alınmaz.
+    (tmp_path / "index_fake-model_partial").mkdir()
+    (tmp_path / "index_other-model_x").mkdir()
+    assert indexer.latest_index_path(str(tmp_path)) == paths[1]
+
+    (tmp_path / "latest.json").write_text(json.dumps({"index": "index_fake-model_old"}))
+    assert indexer.latest_index_path(str(tmp_path)) == paths[0]
+    (tmp_path / "latest.json").write_text(json.dumps({"index": "index_fake-model_silinmis"}))
+    assert indexer.latest_index_path(str(tmp_path)) == paths[1]
+
+def test_build_index_embeds_only_changed_documents(tmp_path):
+    index_dir = str(tmp_path / "indexes")
+    first = make_indexer()
+    first.load_data(write_corpus(tmp_path / "v1.json", CORPUS))
+    first.prepare_documents()
+    embeddings, first_path = first.build_index(index_dir)
+    assert sorted(embeddings.documents) == ["a.mp3", "b.mp3"]
+
+    # a değişir, b silinir, c eklenir: yalnızca a ve c yeniden gömülür.
+    corpus = {"a.mp3": {"file_title": "Liderlik", "transcription": "Liderlik bir sorumluluktur."},
+              "c.mp3": {"file_title": "Vizyon", "transcription": "Vizyon yön verir."}}
+    second = make_indexer()
+    second.load_data(write_corpus(tmp_path / "v2.json", corpus))
+    second.prepare_documents()
+    embeddings, second_path = second.build_index(index_dir)
+    assert second_path != first_path
+    assert sorted(embeddings.upserted) == ["a.mp3", "c.mp3"]
+    assert embeddings.deleted == ["b.mp3"]
+    assert sorted(embeddings.documents) == ["a.mp3", "c.mp3"]
+    assert second.latest_index_path(index_dir) == second_path
+    assert list(server.EmbeddingIndexer.load_records(second_path)) == ["a.mp3", "c.mp3"]
+    # Sunulan indeks build_index tarafından değiştirilmez.
+    assert second.embeddings is not embeddings and not second.embeddings.documents
+
+def test_audio_cache_evicts_least_recently_used(tmp_path):
+    cache = server.AudioCache(str(tmp_path), max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+    # Son erişilen a korunur, en eski b silinir.
+    assert cache.get("b") is None
+    assert not os.path.exists(cache.path("b"))
+    assert (cache.get("a"), cache.get("c")) == (b"aaaa", b"cccc")
+    assert cache.total_bytes == 8
+
+    # Yeniden başlatmada mevcut dosyalar ve toplam boyut diskten okunur.
+    reopened = server.AudioCache(str(tmp_path), max_bytes=10)
+    assert sorted(reopened.entries) == ["a", "c"] and reopened.total_bytes == 8
+
+def test_semantic_cache_requires_threshold_and_same_documents():
+    cache = server.SemanticAnswerCache(threshold=0.9)
+    cache.store(server.np.array([1.0, 0.0]), ("a#0", "b#1"), "v1", "yanıt")
+    hit = cache.lookup(server.np.array([2.0, 0.1]), ("a#0", "b#1"), "v1")
+    assert hit["answer"] == "yanıt" and hit["score"] >= 0.9
+    assert cache.lookup(server.np.array([1.0, 1.0]), ("a#0", "b#1"), "v1") is None
+    assert cache.lookup(server.np.array([1.0, 0.0]), ("a#0",), "v1") is None
+
+def test_semantic_cache_clears_on_new_index_version():
+    cache = server.SemanticAnswerCache(threshold=0.9)
+    cache.store(server.np.array([1.0, 0.0]), ("a#0",), "v1", "yanıt")
+    assert cache.lookup(server.np.array([1.0, 0.0]), ("a#0",), "v2") is None
+    assert cache.lookup(server.np.array([1.0, 0.0]), ("a#0",), "v1") is None
+
+def test_semantic_cache_expires_and_evicts_oldest(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "time", lambda: now[0])
+    cache = server.SemanticAnswerCache(threshold=0.9, max_size=2, ttl=60)
+    for i, doc_id in enumerate(["a", "b", "c"]):
+        cache.store(server.np.array([1.0, 0.0]), (doc_id,), "v1", f"yanıt {i}")
+    # En eski kayıt boyut sınırı nedeniyle silinir.
+    assert cache.lookup(server.np.array([1.0, 0.0]), ("a",), "v1") is None
+    assert cache.lookup(server.np.array([1.0, 0.0]), ("c",), "v1")["answer"] == "yanıt 2"
+    now[0] += 61
+    assert cache.lookup(server.np.array([1.0, 0.0]), ("c",), "v1") is None
+
+##############################################
+# Arama İsteklerini Birleştirme (user-016)    #
+##############################################
+
+def test_query_batcher_groups_concurrent_queries_by_parameters():
+    calls = []
+
+    def batch_search(queries, limit, weights, snapshot=None):
+        calls.append((list(queries), limit, weights))
+        return [[(query, limit)] for query in queries]
+
+    async def scenario():
+        with server.ThreadPoolExecutor(max_workers=2) as executor:
+            batcher = server.QueryBatcher(batch_search, executor, max_wait_ms=50, max_batch_size=8)
+            await batcher.start()
+            results = await asyncio.gather(
+                batcher.search("a", 3), batcher.search("b", 3), batcher.search("c", 5), batcher.search("d", 3, 0.5))
+            await batcher.close()
+            return batcher, results
+
+    batcher, results = asyncio.run(scenario())
+    assert results == [[("a", 3)], [("b", 3)], [("c", 5)], [("d", 3)]]
+    # Tek bir batch, limit/ağırlık çiftine göre üç batch_search çağrısına bölünür.
+    assert sorted(calls, key=lambda call: call[0]) == [(["a", "b"], 3, None), (["c"], 5, None), (["d"], 3, 0.5)]
+    assert batcher.stats == {"batches": 1, "queries": 4, "max_batch": 4}
+    assert not batcher.running
+
+def test_query_batcher_respects_max_batch_size_and_propagates_errors():
+    def batch_search(queries, limit, weights, snapshot=None):
+        if "hata" in queries:
+            raise ValueError("arama başarısız")
+        return [[query] for query in queries]
+
+    async def scenario():
+        with server.ThreadPoolExecutor(max_workers=2) as executor:
+            batcher = server.QueryBatcher(batch_search, executor, max_wait_ms=50, max_batch_size=2)
+            await batcher.start()
+            results = await asyncio.gather(batcher.search("a"), batcher.search("b"), batcher.search("hata"),
+                                           return_exceptions=True)
+            await batcher.close()
+            return batcher, results
+
+    batcher, results = asyncio.run(scenario())
+    assert results[:2] == [["a"], ["b"]]
+    assert isinstance(results[2], ValueError)
+    assert batcher.stats["batches"] == 2 and batcher.stats["max_batch"] == 2
+
+def test_query_batcher_close_waits_for_running_searches():
+    release = server.threading.Event()
+
+    def batch_search(queries, limit, weights, snapshot=None):
+        release.wait(5)
+        return [[query] for query in queries]
+
+    async def scenario():
+        with server.ThreadPoolExecutor(max_workers=1) as executor:
+            batcher = server.QueryBatcher(batch_search, executor, max_wait_ms=1)
+            await batcher.start()
+            pending = asyncio.ensure_future(batcher.search("a"))
+            while not batcher.running:
+                await asyncio.sleep(0.01)
+            asyncio.get_running_loop().call_later(0.05, release.set)
+            await batcher.close()
+            assert not batcher.running
+            return await pending
+
+    assert asyncio.run(scenario()) == ["a"]
+
+def test_query_batcher_close_fails_requests_not_yet_started():
+    calls = []
+
+    def batch_search(queries, limit, weights, snapshot=None):
+        calls.append(queries)
+        return [[query] for query in queries]
+
+    async def scenario():
+        with server.ThreadPoolExecutor(max_workers=1) as executor:
+            # Uzun bekleme süresi: istekler kapanış anında hâlâ toplanmakta olan batch'tedir.
+            batcher = server.QueryBatcher(batch_search, executor, max_wait_ms=10_000)
+            await batcher.start()
+            pending = [asyncio.ensure_future(batcher.search(query)) for query in ("a", "b")]
+            while len(batcher.collecting) < 2:
+                await asyncio.sleep(0.01)
+            await asyncio.wait_for(batcher.close(), timeout=5)
+            results = await asyncio.gather(*pending, return_exceptions=True)
+            with pytest.raises(RuntimeError):
+                await batcher.search("c")
+            return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert calls == []
+
+##############################################
+# Sıkıştırılmış Vektörler ve Yeniden Oluşturma (user-018) #
+##############################################
+
+def test_configure_vectors_falls_back_to_sq8_for_small_pq_corpus():
+    embeddings = FakeEmbeddings()
+    make_indexer(vector_format="pq").configure_vectors(embeddings, 159)
+    assert embeddings.config["faiss"] == {"components": "IDMap,SQ8", "mmap": True}
+
+    embeddings = FakeEmbeddings()
+    make_indexer(vector_format="pq", pq_subquantizers=32, rescore_factor=4).configure_vectors(embeddings, 256)
+    assert embeddings.config["faiss"]["components"] == "IDMap,PQ32,RFlat"
+
+def hash_vectors(texts):
+    """
+    Model yerine kelimeleri 64 boyuta dağıtan, normalize edilmiş vektörler (txtai "external" dönüşümü).
+    """
+    vectors = server.np.zeros((len(texts), 64), dtype=server.np.float32)
+    for i, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[i, zlib.crc32(word.encode("utf-8")) % 64] += 1.0
+    return vectors / (server.np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+def external_embeddings(path=None, hybrid=True, content=False, method=None):
+    from txtai import Embeddings
+
+    # Dönüşüm modül yoluyla kaydedilir; yeniden yüklemede txtai aynı fonksiyonu çözümler.
+    return Embeddings(method="external", transform=f"{__name__}.hash_vectors", hybrid=hybrid, content=content)
+
+def test_int8_index_round_trips_through_disk(tmp_path, monkeypatch):
+    pytest.importorskip("txtai")
+    faiss = pytest.importorskip("faiss")
+    monkeypatch.setenv("ALLOW_RESOLVE_TRANSFORM", "True")
+    corpus = write_corpus(tmp_path / "corpus.json", {
+        "a.mp3": {"file_title": "Liderlik", "transcription": "Liderlik bir yolculuktur ve sabır ister."},
+        "b.mp3": {"file_title": "Ekip", "transcription": "Ekip güveni zamanla kazanılır."},
+        "c.mp3": {"file_title": "Vizyon", "transcription": "Vizyon ekibe yön verir."},
+    })
+    index_dir = str(tmp_path / "indexes")
+
+    def make_int8_indexer():
+        indexer = server.EmbeddingIndexer(model_name="test/hash", embeddings_factory=external_embeddings,
+                                          vector_format="int8")
+        indexer.load_data(corpus)
+        indexer.prepare_documents()
+        return indexer
+
+    built, path = make_int8_indexer().build_index(index_dir)
+    assert built.config["faiss"] == {"components": "IDMap,SQ8", "mmap": True}
+
+    # Yeni bir süreçteki gibi: aynı manifest aynı dizini bulur, indeks diskten yüklenip aranır.
+    indexer = make_int8_indexer()
+    assert indexer.index_path(index_dir) == path
+    indexer.load_index(path)
+    quantizer = faiss.downcast_index(faiss.downcast_index(indexer.embeddings.ann.backend).index)
+    assert isinstance(quantizer, faiss.IndexScalarQuantizer)
+    assert quantizer.sq.qtype == faiss.ScalarQuantizer.QT_8bit
+    assert [result_id for result_id, _ in indexer.search("ekip güveni", limit=1)] == ["b.mp3"]
+    assert [result_id for result_id, _ in indexer.search("liderlik yolculuk sabır", limit=1)] == ["a.mp3"]
+
+def test_rebuild_failure_is_recorded_and_keeps_serving_index(tmp_path):
+    indexer = make_indexer()
+    served = indexer.embeddings
+
+    def failing_factory(**kwargs):
+        raise RuntimeError("eğitim başarısız")
+
+    indexer.embeddings_factory = failing_factory
+    indexer.rebuild_in_background(str(tmp_path)).join(5)
+    assert indexer.rebuild_error == "RuntimeError: eğitim başarısız"
+    assert indexer.embeddings is served
+
+##############################################
+# Bağlam Oluşturma (user-020)                 #
+##############################################
+
+def test_text_vectors_bypass_query_vector_cache():
+    indexer = make_indexer()
+    indexer.query_vector("liderlik nedir")
+    vectors = indexer.text_vectors(["Birinci cümle.", "İkinci cümle."])
+    assert vectors.shape == (2, 2)
+    assert len(indexer.vector_cache) == 1
+    stats = indexer.cache_stats()
+    assert (stats["vector_hits"], stats["vector_misses"]) == (0, 1)
+
+class WordEmbeddings(FakeEmbeddings):
+    """
+    Kelime tabanlı vektörler üreten FakeEmbeddings; bağlam sıkıştırması sorguyla ilgili cümleleri seçebilir.
+    """
+
+    def batchtransform(self, documents, category=None, index=None):
+        texts = [document[1] if isinstance(document, tuple) else document for document in documents]
+        self.encoded.extend(texts)
+        return hash_vectors(texts)
+
+def make_context_builder(records, budget=1000):
+    indexer = make_indexer(embeddings_factory=WordEmbeddings)
+    indexer.publish(records, indexer.create_embeddings(), "v1")
+    return server.ContextBuilder(indexer, lambda text: len(text.split()), budget=budget), indexer
+
+def test_context_builder_keeps_overlapping_sentences_once():
+    builder, indexer = make_context_builder({
+        "a#0": server.DocumentRecord("A", "a", "Liderlik bir yolculuktur. Ekip güveni önemlidir."),
+        "a#1": server.DocumentRecord("A", "a", "Ekip güveni önemlidir. Vizyon yön verir."),
+    })
+
+    context, stats = builder.build("liderlik", ["a#0", "a#1", "yok#0"])
+
+    assert context.count("Ekip güveni önemlidir.") == 1
+    assert (stats["documents"], stats["sentences"], stats["total_sentences"]) == (2, 3, 3)
+    assert not stats["compressed"] and stats["tokens"] <= stats["budget"]
+    # Bütçe aşılmadıkça hiçbir cümle kodlanmaz.
+    assert indexer.embeddings.encoded == []
+
+def test_context_builder_fits_budget_with_most_relevant_sentences():
+    filler = " ".join(f"Toplantı {i} takvimi paylaşıldı." for i in range(20))
+    builder, _ = make_context_builder({
+        "a#0": server.DocumentRecord("A", "a", f"Güven liderliğin temelidir. {filler}"),
+        "b#0": server.DocumentRecord("B", "b", f"{filler} Liderlik güven ister."),
+    }, budget=20)
+
+    context, stats = builder.build("liderlik güven", ["a#0", "b#0"])
+
+    assert stats["compressed"]
+    assert stats["tokens"] <= 20 == stats["budget"]
+    assert stats["sentences"] < stats["total_sentences"] == 22
+    # Seçilen cümleler özgün sıralarıyla yazılır.
+    assert context.index("Güven liderliğin temelidir.") < context.index("Liderlik güven ister.")
+
+def test_context_builder_reuses_sentence_vectors_per_index_version():
+    records = {"a#0": server.DocumentRecord("A", "a", " ".join(f"Cümle {i} liderlik." for i in range(10)))}
+    builder, indexer = make_context_builder(records, budget=10)
+    embeddings = indexer.embeddings
+
+    builder.build("liderlik", ["a#0"])
+    first = len(embeddings.encoded)
+    builder.build("liderlik nedir", ["a#0"])
+    # İkinci istekte yalnızca yeni sorgu kodlanır; pasaj cümleleri önbellekten gelir.
+    assert embeddings.encoded[first:] == ["liderlik nedir"]
+
+    indexer.publish(records, embeddings, "v2")
+    builder.build("liderlik", ["a#0"])
+    assert len(embeddings.encoded) == first + 1 + 10
+
+##############################################
+# Web Araması (user-025)                      #
+##############################################
+
+WEB_RESULTS = {"Liderlik nedir": [{"title": f"Sonuç {i}", "href": f"https://ornek.com/{i}", "body": "Özet."}
+                                  for i in range(3)]}
+
+def test_web_searcher_caches_by_normalized_query():
+    backend = server.StaticSearchBackend(WEB_RESULTS)
+    searcher = server.WebSearcher(backend, timeout=1)
+
+    async def scenario():
+        first = await searcher.search("liderlik  nedir", max_results=2)
+        second = await searcher.search(" LIDERLIK nedir ", max_results=2)
+        return first, second
+
+    try:
+        (results, error), (cached, cached_error) = asyncio.run(scenario())
+    finally:
+        searcher.close()
+    assert error is None and cached_error is None
+    assert [result["title"] for result in results] == ["Sonuç 0", "Sonuç 1"]
+    assert cached == results
+    assert backend.calls == 1
+    assert searcher.stats == {"hits": 1, "misses": 1, "timeouts": 0, "errors": 0}
+
+def test_web_searcher_times_out_and_fills_cache_later():
+    backend = server.StaticSearchBackend(WEB_RESULTS, delay=0.2)
+    searcher = server.WebSearcher(backend, timeout=0.05)
+
+    async def scenario():
+        # Aynı sorgu için eş zamanlı istekler tek bir aramayı paylaşır.
+        late = await asyncio.gather(searcher.search("Liderlik nedir"), searcher.search("Liderlik nedir"))
+        await asyncio.sleep(0.3)
+        return late, await searcher.search("Liderlik nedir")
+
+    try:
+        late, (results, error) = asyncio.run(scenario())
+    finally:
+        searcher.close()
+    assert late == [([], "timeout"), ([], "timeout")]
+    assert error is None and len(results) == 3
+    assert backend.calls == 1
+    assert searcher.stats["timeouts"] == 2 and searcher.stats["hits"] == 1
+
+def test_web_searcher_reports_backend_errors_without_caching():
+    def backend(query, max_results):
+        raise ConnectionError("ağ yok")
+
+    searcher = server.WebSearcher(backend, timeout=1)
+    try:
+        results, error = asyncio.run(searcher.search("Liderlik nedir"))
+    finally:
+        searcher.close()
+    assert results == [] and error == "ağ yok"
+    assert searcher.stats["errors"] == 1 and not searcher.cache and not searcher.pending
@@ -0,0 +1,124 @@
+"""
+speech_stream.py için testler: cümle bölme ve sıralı otomatik oynatma. Sentez ve Streamlit
+yerine sahte fonksiyonlar kullanılır.
+
+Çalıştırma (version2 dizininde):
+    python -m pytest -q tests
+"""
+import io
+import wave
+
+import pytest
+
+pytest.importorskip("requests")
+
+import speech_stream
+
+def make_wav(seconds, rate=1000):
+    """
+    Verilen süre kadar sessiz, 16-bit mono WAV baytları üretir.
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"\0\0" * int(seconds * rate))
+    return buffer.getvalue()
+
+class FakeClock:
+    """
+    time.monotonic/time.sleep yerine elle ilerletilen saat.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class FakeSlot:
+    """
+    st.empty() yerine geçer; her audio çağrısını (zaman, klip, autoplay) olarak kaydeder.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+
+    def audio(self, clip, format, autoplay=False):
+        self.calls.append((self.clock(), clip, autoplay))
+
+##############################################
+# Cümle Bölme                                #
+##############################################
+
+def test_streaming_tts_splits_sentences_independent_of_token_boundaries():
+    text = "Liderlik bir yolculuktur. Kısa. Ekip güveni zamanla kazanılır!\nSon cümle"
+    whole = speech_stream.StreamingTTS(synthesize=str.upper)
+    whole.feed(text)
+    whole.finish()
+    tokens = speech_stream.StreamingTTS(synthesize=str.upper)
+    for char in text:
+        tokens.feed(char)
+    tokens.finish()
+
+    expected = ["LIDERLIK BIR YOLCULUKTUR.", "KISA. EKIP GÜVENI ZAMANLA KAZANILIR!", "SON CÜMLE"]
+    assert list(whole.remaining()) == expected
+    assert list(tokens.remaining()) == expected
+
+def test_streaming_tts_records_synthesis_errors():
+    import requests
+
+    def synthesize(sentence):
+        if "hata" in sentence:
+            raise requests.ConnectionError("servis kapalı")
+        return sentence
+
+    speech = speech_stream.StreamingTTS(synthesize=synthesize)
+    speech.feed("Bu cümlede hata var burada. Bu cümle ise sorunsuz.")
+    speech.finish()
+    assert list(speech.remaining()) == [None, "Bu cümle ise sorunsuz."]
+    assert speech.errors == ["servis kapalı"]
+
+##############################################
+# Sıralı Oynatma                             #
+##############################################
+
+def test_sequential_player_autoplays_each_clip_after_previous_finishes():
+    clock = FakeClock()
+    slot = FakeSlot(clock)
+    player = speech_stream.SequentialPlayer(slot, clock=clock, sleep=clock.sleep, margin=0.0)
+    first, second = make_wav(2.0), make_wav(1.0)
+
+    player.add(first)
+    player.add(None)
+    player.add(second)
+    # İkinci klip, ilki çalarken aynı öğeye yazılmaz.
+    assert slot.calls == [(0.0, first, True)]
+    clock.now = 1.0
+    player.advance()
+    assert len(slot.calls) == 1
+
+    player.drain()
+    assert slot.calls == [(0.0, first, True), (2.0, second, True)]
+    assert player.played == [first, second]
+    assert clock.now == pytest.approx(3.0)
+
+def test_sequential_player_follows_pending_synthesis():
+    clock = FakeClock()
+    slot = FakeSlot(clock)
+    player = speech_stream.SequentialPlayer(slot, clock=clock, sleep=clock.sleep, margin=0.0)
+    clips = {"Birinci cümle burada.": make_wav(0.5), "İkinci cümle de burada.": make_wav(0.5)}
+
+    speech = speech_stream.StreamingTTS(synthesize=clips.get)
+    speech.feed(" ".join(clips))
+    speech.finish()
+    player.follow(speech, poll=0.1)
+
+    assert [clip for _, clip, _ in slot.calls] == list(clips.values())
+    assert all(autoplay for _, _, autoplay in slot.calls)
+    assert slot.calls[1][0] >= 0.5